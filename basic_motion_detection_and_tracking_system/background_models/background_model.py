@@ -1,10 +1,16 @@
 import os
+# Third-party modules
+import numpy as np
 # Own modules
 from utilities.utils import write_image
 
 
 # Abstract background model
 class Model:
+    # False if the state of the model can't be saved in a checkpoint (see
+    # `checkpoint.py`)
+    resumable = True
+
     def __init__(self, background_model_frame, saving_cfg=None,
                  update_background_image=False):
         self.background_model_frame = background_model_frame
@@ -13,17 +19,52 @@ class Model:
         self.saving = True
         self.count_save = 0
 
+    # The model is saved in the checkpoints with pickle, without its saving
+    # configuration (which holds the image writer): it is given again when the
+    # model is restored
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['saving_cfg'] = None
+        return state
+
+    # NOTE: the frame delta returned can be a buffer of the model that is
+    # overwritten by the next call
     def get_frame_delta(self, frame):
         raise NotImplementedError
 
+    # Batch version of `get_frame_delta()`: `frames` is an N x H x W stack of
+    # preprocessed frames, in order, and the N x H x W stack of frame deltas is
+    # returned. Subclasses override it with a vectorized implementation.
+    def get_frame_deltas(self, frames):
+        frame_deltas = np.empty_like(frames)
+        for i, frame in enumerate(frames):
+            # NOTE: copied since the frame delta can be a buffer of the model
+            frame_deltas[i] = self.get_frame_delta(frame)
+        return frame_deltas
+
     def _save_background_image(self):
         # Save background image
         if self.saving_cfg.get('saved_folder') and self.saving:
             inum = "{0:06d}".format(self.count_save)
-            bi_fname = "background_image_{}.{}".format(
-               inum, self.saving_cfg.get('image_format', 'png'))
+            # NOTE: the format and encoding parameters are given by the
+            # encoder of the pipeline if any, see `encoding.py`
+            encoder = self.saving_cfg.get('encoder')
+            if encoder:
+                image_format, params = encoder.params('background')
+            else:
+                image_format = self.saving_cfg.get('image_format', 'png')
+                params = None
+            bi_fname = "background_image_{}.{}".format(inum, image_format)
             self.count_save += 1
             bi_fname = os.path.join(self.saving_cfg.get('saved_folder'), bi_fname)
-            write_image(bi_fname, self.background_model_frame)
+            # NOTE: the image is written in the background if an asynchronous
+            # writer is provided, see `utilities.image_writer`
+            image_writer = self.saving_cfg.get('image_writer')
+            if image_writer:
+                image_writer.write(bi_fname, self.background_model_frame,
+                                   params)
+            else:
+                write_image(bi_fname, self.background_model_frame,
+                            params=params)
             if not self.update_background_image:
                 self.saving = False
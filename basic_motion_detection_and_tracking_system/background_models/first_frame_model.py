@@ -1,18 +1,32 @@
 # Third-party modules
 import cv2
+import numpy as np
 # Own modules
 from background_models.background_model import Model
+from background_models.registry import register_model
 
 
+@register_model
 class FirstFrameModel(Model):
     __background_model_name__ = "first_frame"
 
     def __init__(self, background_model_frame, save_folder):
         super().__init__(background_model_frame, save_folder, False)
+        self._frame_delta = np.empty_like(background_model_frame)
 
     def get_frame_delta(self, frame):
         # Compute the absolute difference between the current frame and first
         # frame
-        frame_delta = cv2.absdiff(self.background_model_frame, frame)
+        frame_delta = cv2.absdiff(self.background_model_frame, frame,
+                                  dst=self._frame_delta)
         self._save_background_image()
         return frame_delta
+
+    def get_frame_deltas(self, frames):
+        # Absolute difference broadcasted over the whole stack, computed as
+        # max - min to stay in uint8 like `cv2.absdiff()`
+        frames = np.asarray(frames)
+        frame_deltas = np.maximum(frames, self.background_model_frame)
+        frame_deltas -= np.minimum(frames, self.background_model_frame)
+        self._save_background_image()
+        return frame_deltas
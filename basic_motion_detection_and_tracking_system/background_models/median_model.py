@@ -0,0 +1,51 @@
+# Third-party modules
+import cv2
+import numpy as np
+# Own modules
+from background_models.background_model import Model
+from background_models.registry import register_model
+
+
+@register_model
+class MedianModel(Model):
+    __background_model_name__ = "median"
+
+    # The background is the per-pixel median of the last `num_samples` sampled
+    # frames, where one frame is sampled every `sampling_interval` frames. The
+    # median follows slow lighting changes and ignores objects passing by.
+    def __init__(self, frame, save_folder, num_samples=25,
+                 sampling_interval=10):
+        if num_samples <= 0 or sampling_interval <= 0:
+            raise ValueError("num_samples and sampling_interval should be "
+                             "positive")
+        super().__init__(frame.copy(), save_folder, True)
+        self.sampling_interval = sampling_interval
+        # Ring buffer of the sampled frames
+        self.samples = np.empty((num_samples,) + frame.shape, frame.dtype)
+        self.samples[0] = frame
+        self.num_samples = 1
+        self.next_sample = 1 % num_samples
+        self.num_frames = 0
+        self._median = np.empty(frame.shape, np.float64)
+        self._frame_delta = np.empty_like(frame)
+
+    def get_frame_delta(self, frame):
+        frame_delta = cv2.absdiff(frame, self.background_model_frame,
+                                  dst=self._frame_delta)
+        self.num_frames += 1
+        if self.num_frames == 1:
+            self._save_background_image()
+        if not self.num_frames % self.sampling_interval:
+            self._add_sample(frame)
+            # The background image is only saved when it changes
+            self._save_background_image()
+        return frame_delta
+
+    def _add_sample(self, frame):
+        self.samples[self.next_sample] = frame
+        self.next_sample = (self.next_sample + 1) % len(self.samples)
+        self.num_samples = min(self.num_samples + 1, len(self.samples))
+        # Vectorized per-pixel median over the samples
+        np.median(self.samples[:self.num_samples], axis=0, out=self._median)
+        np.rint(self._median, out=self._median)
+        np.copyto(self.background_model_frame, self._median, casting='unsafe')
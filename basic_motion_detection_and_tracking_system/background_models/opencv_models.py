@@ -0,0 +1,75 @@
+# Third-party modules
+import cv2
+import numpy as np
+# Own modules
+from background_models.background_model import Model
+from background_models.registry import register_model
+
+# Value of the shadow pixels in the foreground masks of OpenCV's background
+# subtractors
+SHADOW_VALUE = 127
+
+
+# Wrapper around an OpenCV background subtractor (`cv2.BackgroundSubtractor`)
+# NOTE: the "frame delta" returned is the foreground mask of the subtractor
+# (255 for foreground, 0 for background), with the shadows removed
+class OpenCVSubtractorModel(Model):
+    # NOTE: the state of the OpenCV subtractors (e.g. the mixture of Gaussians
+    # of each pixel) isn't accessible from Python
+    resumable = False
+
+    def __init__(self, frame, save_folder, learning_rate=-1, **kwargs):
+        self.subtractor = self._create_subtractor(**kwargs)
+        # -1: the learning rate is chosen automatically from the history length
+        self.learning_rate = learning_rate
+        self.subtractor.apply(frame, learningRate=learning_rate)
+        super().__init__(frame, save_folder, True)
+        self._fg_mask = np.empty_like(frame)
+
+    def _create_subtractor(self, **kwargs):
+        raise NotImplementedError
+
+    def get_frame_delta(self, frame):
+        fg_mask = self.subtractor.apply(frame, fgmask=self._fg_mask,
+                                        learningRate=self.learning_rate)
+        # The background image is only computed if it is saved since it is
+        # costly to get from the subtractor
+        if self.saving_cfg.get('saved_folder'):
+            self.background_model_frame = self.subtractor.getBackgroundImage()
+            self._save_background_image()
+        # Shadows are not considered as motion
+        _, fg_mask = cv2.threshold(fg_mask, SHADOW_VALUE, 255,
+                                   cv2.THRESH_BINARY, dst=fg_mask)
+        return fg_mask
+
+
+@register_model
+class MOG2Model(OpenCVSubtractorModel):
+    __background_model_name__ = "mog2"
+
+    def __init__(self, frame, save_folder, history=500, var_threshold=16,
+                 detect_shadows=False, learning_rate=-1):
+        super().__init__(frame, save_folder, learning_rate, history=history,
+                         var_threshold=var_threshold,
+                         detect_shadows=detect_shadows)
+
+    def _create_subtractor(self, history, var_threshold, detect_shadows):
+        return cv2.createBackgroundSubtractorMOG2(history=history,
+                                                  varThreshold=var_threshold,
+                                                  detectShadows=detect_shadows)
+
+
+@register_model
+class KNNModel(OpenCVSubtractorModel):
+    __background_model_name__ = "knn"
+
+    def __init__(self, frame, save_folder, history=500, dist2_threshold=400.0,
+                 detect_shadows=False, learning_rate=-1):
+        super().__init__(frame, save_folder, learning_rate, history=history,
+                         dist2_threshold=dist2_threshold,
+                         detect_shadows=detect_shadows)
+
+    def _create_subtractor(self, history, dist2_threshold, detect_shadows):
+        return cv2.createBackgroundSubtractorKNN(
+            history=history, dist2Threshold=dist2_threshold,
+            detectShadows=detect_shadows)
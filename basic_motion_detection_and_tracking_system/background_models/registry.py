@@ -0,0 +1,117 @@
+"""
+Registry of the background models, indexed by their `__background_model_name__`
+
+Models are added with `register_model()`, which can be used as a class
+decorator. Besides the built-in models, models can come from:
+- modules imported with `load_plugins()` (e.g. listed in the
+  `background_model_plugins` option), which register their models when they
+  are imported
+- packages declaring an entry point in the group `ENTRY_POINT_GROUP` that
+  refers to a `Model` subclass
+"""
+import importlib
+import logging
+import os
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(os.path.dirname(__file__))), __name__))
+
+ENTRY_POINT_GROUP = 'automated_visual_system.background_models'
+# Modules of the built-in models, imported the first time the registry is used
+_BUILTIN_MODULES = [
+    'background_models.first_frame_model',
+    'background_models.weighted_average_model',
+    'background_models.median_model',
+    'background_models.opencv_models'
+]
+_models = {}
+_builtins_loaded = False
+_entry_points_loaded = False
+# Why the entry points couldn't be searched, if they couldn't
+_entry_points_error = None
+
+
+class ModelNotFoundError(Exception):
+    """Raised when no background model is registered with a given name"""
+
+
+def register_model(model_cls):
+    name = model_cls.__background_model_name__
+    if name in _models and _models[name] is not model_cls:
+        raise ValueError("A background model named '{}' is already "
+                         "registered: {}".format(name, _models[name]))
+    _models[name] = model_cls
+    return model_cls
+
+
+# Import modules that register background models
+def load_plugins(module_names):
+    for module_name in module_names:
+        logger.debug("Loading background models from {}".format(module_name))
+        importlib.import_module(module_name)
+
+
+def _load_entry_points():
+    global _entry_points_error
+    # NOTE 1: imported here since it is slow to import, see `get_model()`
+    # NOTE 2: `importlib.metadata` is new in Python 3.8, the backport
+    # `importlib_metadata` is used with the older versions
+    try:
+        import importlib.metadata as metadata
+    except ImportError:
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            _entry_points_error = "the entry points can only be searched " \
+                                  "with Python 3.8+ or with the package " \
+                                  "importlib_metadata installed"
+            logger.warning("Background models from installed packages are "
+                           "not loaded: {}".format(_entry_points_error))
+            return
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        # Python < 3.10
+        entry_points = entry_points.get(ENTRY_POINT_GROUP, [])
+    for entry_point in entry_points:
+        try:
+            register_model(entry_point.load())
+        except (ImportError, AttributeError, ValueError) as e:
+            logger.warning("Background model from entry point {} couldn't be "
+                           "loaded: {}".format(entry_point.name, e))
+
+
+# If `entry_points` is False, only the built-in models are loaded
+def _load_models(entry_points=True):
+    global _builtins_loaded, _entry_points_loaded
+    if not _builtins_loaded:
+        _builtins_loaded = True
+        for module_name in _BUILTIN_MODULES:
+            importlib.import_module(module_name)
+    if entry_points and not _entry_points_loaded:
+        _entry_points_loaded = True
+        _load_entry_points()
+
+
+# NOTE: the installed packages are only searched for entry points if no model
+# named `name` is built in or was loaded with `load_plugins()`, since the search
+# slows down the startup
+def get_model(name):
+    _load_models(entry_points=False)
+    if name not in _models:
+        _load_models()
+    try:
+        return _models[name]
+    except KeyError:
+        msg = "Background model ({}) is not supported. Background models " \
+              "supported are {}".format(name, available_models())
+        if _entry_points_error:
+            msg += " (installed packages not searched: {})".format(
+                _entry_points_error)
+        raise ModelNotFoundError(msg)
+
+
+def available_models():
+    _load_models()
+    return sorted(_models)
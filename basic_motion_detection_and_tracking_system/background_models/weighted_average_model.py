@@ -1,22 +1,46 @@
 # Third-party modules
 import cv2
+import numpy as np
 # Own modules
 from background_models.background_model import Model
+from background_models.registry import register_model
 
 
+@register_model
 class WeightedAverageModel(Model):
     __background_model_name__ = "weighted_average"
 
-    def __init__(self, frame, save_folder):
+    # `alpha`: weight of the current frame in the running average
+    def __init__(self, frame, save_folder, alpha=0.5):
         background_model_frame = frame.copy().astype("float")
         super().__init__(background_model_frame,save_folder, True)
+        self.alpha = alpha
+        # Running average converted to 8 bits, and frame delta
+        self._background = np.empty_like(frame)
+        self._frame_delta = np.empty_like(frame)
 
     def get_frame_delta(self, frame):
         # Accumulate the weighted average between the current frame and previous
         # frames, then compute the difference between the current frame and
         # running average
-        cv2.accumulateWeighted(frame, self.background_model_frame, 0.5)
+        cv2.accumulateWeighted(frame, self.background_model_frame, self.alpha)
         self._save_background_image()
         # TODO: why cv2.convertScaleAbs()?
-        return cv2.absdiff(
-            frame, cv2.convertScaleAbs(self.background_model_frame))
+        cv2.convertScaleAbs(self.background_model_frame, dst=self._background)
+        return cv2.absdiff(frame, self._background, dst=self._frame_delta)
+
+    # The running average is a recurrence, so it is still updated frame by
+    # frame (with the same OpenCV calls as `get_frame_delta()`, which makes the
+    # frame deltas bit-for-bit identical), but the absolute difference is
+    # computed in one call over the whole stack seen as a single image.
+    def get_frame_deltas(self, frames):
+        frames = np.ascontiguousarray(frames)
+        n, h, w = frames.shape
+        backgrounds = np.empty_like(frames)
+        for i, frame in enumerate(frames):
+            cv2.accumulateWeighted(frame, self.background_model_frame,
+                                   self.alpha)
+            cv2.convertScaleAbs(self.background_model_frame, dst=backgrounds[i])
+            self._save_background_image()
+        return cv2.absdiff(frames.reshape(n * h, w),
+                           backgrounds.reshape(n * h, w)).reshape(n, h, w)
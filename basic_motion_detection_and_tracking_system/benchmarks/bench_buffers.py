@@ -0,0 +1,52 @@
+"""
+Comparison of the pipeline with and without preallocated buffers
+
+Runs the pipeline on the same scenes with `preallocate_buffers` set to false
+(new arrays for every frame) and true (buffers allocated once, see
+`frame_buffers.py`), and reports the FPS, the minor page faults per frame and
+the peak RSS of both. See `bench_pipeline.py` for how each run is measured.
+
+Run from `basic_motion_detection_and_tracking_system/`:
+
+    $ python -m benchmarks.bench_buffers -n 300
+    $ python -m benchmarks.bench_buffers -s 1080p -m weighted_average
+"""
+import argparse
+# Own modules
+from benchmarks.bench_models import run_in_process
+from benchmarks.bench_pipeline import SCENES, bench_pipeline, load_conf
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--conf", default="conf.json",
+                    help="configuration file of the pipeline")
+    ap.add_argument("-s", "--scenes", nargs="+", default=SCENES,
+                    choices=SCENES)
+    ap.add_argument("-m", "--models", nargs="+",
+                    default=["first_frame", "weighted_average"],
+                    help="names of the background models")
+    ap.add_argument("-n", "--num-frames", type=int, default=300,
+                    help="number of frames processed in each run")
+    args = ap.parse_args()
+
+    conf = load_conf(args.conf)
+    print("{:>8} {:>18} {:>12} {:>8} {:>14} {:>10}".format(
+          "scene", "model", "buffers", "FPS", "faults/frame", "RSS (MB)"))
+    # NOTE: one run per process so that the peak RSS is per run
+    for scene in args.scenes:
+        for model_name in args.models:
+            fps = {}
+            for preallocate in [False, True]:
+                result = run_in_process(
+                    bench_pipeline, conf, scene, model_name, args.num_frames,
+                    {"preallocate_buffers": preallocate})
+                fps[preallocate] = result['fps']
+                print("{:>8} {:>18} {:>12} {:>8.1f} {:>14.1f} "
+                      "{:>10.1f}".format(
+                       scene, model_name,
+                       "preallocated" if preallocate else "per frame",
+                       result['fps'], result['minor_faults_per_frame'],
+                       result['peak_rss_mb']))
+            print("{:>8} {:>18} {:>12} {:>+8.1%}".format(
+                  "", "", "speedup", fps[True] / fps[False] - 1))
@@ -0,0 +1,119 @@
+"""
+Time taken to extract, merge and draw the bounding boxes of noisy masks
+
+The motion masks of a scene (the synthetic scene built on the image of
+`samples/`, see `synthetic.py`, or a video with `-v`) are computed like in the
+pipeline (frame delta against the first frame, threshold, dilation). Random
+specks are added to them to mimic a noisy scene (rain, leaves): `-s` is the
+number of specks per frame. For each level of noise, reports the time per
+frame and the number of boxes per frame of:
+- `contours`: `cv2.findContours()`, then `cv2.contourArea()`,
+  `cv2.boundingRect()` and `cv2.rectangle()` on each contour
+- `components`: `cv2.connectedComponentsWithStats()`, then all the boxes drawn
+  in one call
+- `components` followed by the 'union' and 'nms' merges (see `detections.py`)
+
+Run from `basic_motion_detection_and_tracking_system/`:
+
+    $ python -m benchmarks.bench_detections -n 100
+    $ python -m benchmarks.bench_detections -s 0 1000 5000 --min-area 0
+"""
+import argparse
+# Third-party modules
+import cv2
+import numpy as np
+# Own modules
+from benchmarks.bench_filters import load_grays, time_ms
+from benchmarks.bench_pipeline import load_conf
+from detections import component_boxes, contour_boxes, draw_boxes, merge_boxes
+from fast_filters import dilate
+
+
+# Return the motion masks of the grayscale frames with `num_specks` random
+# 3x3 specks added to each
+def noisy_masks(grays, delta_thresh, num_specks, seed=0):
+    rng = np.random.default_rng(seed)
+    blurred = [cv2.GaussianBlur(g, (21, 21), 0) for g in grays]
+    masks = []
+    for image in blurred[1:]:
+        _, thresh = cv2.threshold(cv2.absdiff(blurred[0], image),
+                                  delta_thresh, 255, cv2.THRESH_BINARY)
+        h, w = thresh.shape
+        ys = rng.integers(0, h - 3, num_specks)
+        xs = rng.integers(0, w - 3, num_specks)
+        for dy in range(3):
+            for dx in range(3):
+                thresh[ys + dy, xs + dx] = 255
+        masks.append(dilate(thresh, iterations=2))
+    return masks
+
+
+def old_loop(thresh, frame, min_area):
+    cnts = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL,
+                            cv2.CHAIN_APPROX_SIMPLE)[-2]
+    num_boxes = 0
+    for c in cnts:
+        if cv2.contourArea(c) < min_area:
+            continue
+        (x, y, w, h) = cv2.boundingRect(c)
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        num_boxes += 1
+    return num_boxes
+
+
+def contours(thresh, frame, min_area):
+    cnts = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL,
+                            cv2.CHAIN_APPROX_SIMPLE)[-2]
+    boxes, _ = contour_boxes(cnts, min_area)
+    draw_boxes(frame, boxes)
+    return len(boxes)
+
+
+def components(thresh, frame, min_area, merge='none'):
+    boxes, areas = component_boxes(thresh, min_area)
+    boxes, _ = merge_boxes(boxes, areas, merge, distance=10)
+    draw_boxes(frame, boxes)
+    return len(boxes)
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--conf", default="conf.json",
+                    help="configuration file of the pipeline (resize width, "
+                         "delta_thresh, min_area)")
+    ap.add_argument("-v", "--video", default="",
+                    help="video used instead of the samples scene")
+    ap.add_argument("-n", "--num-frames", type=int, default=100)
+    ap.add_argument("-s", "--specks", type=int, nargs="+",
+                    default=[0, 200, 2000])
+    ap.add_argument("--min-area", type=int, default=None,
+                    help="minimum area of a box (by default, min_area of the "
+                         "configuration)")
+    args = ap.parse_args()
+
+    conf = load_conf(args.conf)
+    min_area = conf["min_area"] if args.min_area is None else args.min_area
+    grays = load_grays(args.video, args.num_frames,
+                       conf["resize_image_width"])
+    frame = cv2.cvtColor(grays[0], cv2.COLOR_GRAY2BGR)
+    methods = [
+        ('contours (loop)', old_loop),
+        ('contours', contours),
+        ('components', components),
+        ('components + union', lambda t, f, a: components(t, f, a, 'union')),
+        ('components + nms', lambda t, f, a: components(t, f, a, 'nms'))
+    ]
+    print("{} frames of {}x{}, min_area={}".format(
+          len(grays), grays[0].shape[1], grays[0].shape[0], min_area))
+    print("{:>7} {:>20} {:>10} {:>8} {:>8}".format(
+          "specks", "method", "ms/frame", "speedup", "boxes"))
+    for num_specks in args.specks:
+        masks = noisy_masks(grays, conf["delta_thresh"], num_specks)
+        ref_ms = None
+        for name, method in methods:
+            ms = time_ms(lambda: [method(m, frame, min_area) for m in masks],
+                         3) / len(masks)
+            num_boxes = np.mean([method(m, frame, min_area) for m in masks])
+            ref_ms = ref_ms or ms
+            print("{:>7} {:>20} {:>10.3f} {:>7.2f}x {:>8.1f}".format(
+                  num_specks, name, ms, ref_ms / ms, num_boxes))
@@ -0,0 +1,123 @@
+"""
+Time taken to encode the saved images and their size, for each encoding profile
+
+The images of a scene (the synthetic scene built on the image of `samples/`,
+see `synthetic.py`, or a video with `-v`) are computed like in the pipeline:
+the security feed (color frame), the frame delta against the first frame and
+the thresholded image (binary mask). Each set of images is encoded in memory
+(`cv2.imencode()`, i.e. without the disk I/O) with the profiles that apply to
+it, and the table reports the encoding time and the size of an image. The
+speedup and the size ratio are relative to PNG with the default settings of
+OpenCV (the output of `image_format: png`). The lossless encodings of the masks
+are also checked to be decoded without loss.
+
+Run from `basic_motion_detection_and_tracking_system/`:
+
+    $ python -m benchmarks.bench_encoding -n 50
+    $ python -m benchmarks.bench_encoding -v video.mp4
+"""
+import argparse
+# Third-party modules
+import cv2
+from imutils import resize
+import numpy as np
+# Own modules
+from benchmarks.bench_filters import time_ms
+from benchmarks.bench_pipeline import load_conf, make_frames
+from encoding import imwrite_params
+from fast_filters import dilate
+
+# (name, format, png_compression, jpeg_quality, webp_quality, bilevel) of the
+# profiles
+PROFILES = [
+    ('png default', 'png', -1, 0, 0, False),
+    ('png level 0', 'png', 0, 0, 0, False),
+    ('png level 1', 'png', 1, 0, 0, False),
+    ('png level 3', 'png', 3, 0, 0, False),
+    ('png level 6', 'png', 6, 0, 0, False),
+    ('png level 9', 'png', 9, 0, 0, False),
+    ('jpg q95', 'jpg', 0, 95, 0, False),
+    ('jpg q75', 'jpg', 0, 75, 0, False),
+    ('jpg q50', 'jpg', 0, 50, 0, False),
+    ('webp q90', 'webp', 0, 0, 90, False),
+    ('webp q50', 'webp', 0, 0, 50, False),
+    ('webp lossless', 'webp', 0, 0, 101, False),
+    # Binary masks only
+    ('png bilevel', 'png', -1, 0, 0, True),
+    ('png bilevel level 9', 'png', 9, 0, 0, True),
+    ('pbm', 'pbm', 0, 0, 0, False)
+]
+LOSSY_FORMATS = ['jpg', 'webp']
+
+
+# Return the security feed, thresholded and frame delta images of the frames
+def make_images(video_filepath, num_frames, width, delta_thresh):
+    if video_filepath:
+        frames = []
+        camera = cv2.VideoCapture(video_filepath)
+        while len(frames) < num_frames:
+            grabbed, frame = camera.read()
+            if not grabbed:
+                break
+            frames.append(frame)
+        camera.release()
+    else:
+        frames = make_frames('samples', num_frames)
+    if width:
+        frames = [resize(f, width=width) for f in frames]
+    blurred = [cv2.GaussianBlur(cv2.cvtColor(f, cv2.COLOR_BGR2GRAY), (21, 21),
+                                0) for f in frames]
+    images = {'security_feed': frames[1:], 'thresh': [], 'frame_delta': []}
+    for image in blurred[1:]:
+        frame_delta = cv2.absdiff(blurred[0], image)
+        _, thresh = cv2.threshold(frame_delta, delta_thresh, 255,
+                                  cv2.THRESH_BINARY)
+        images['frame_delta'].append(frame_delta)
+        images['thresh'].append(dilate(thresh, iterations=2))
+    return images
+
+
+def encode(images, image_format, params):
+    return [cv2.imencode('.' + image_format, image, params)[1]
+            for image in images]
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--conf", default="conf.json",
+                    help="configuration file of the pipeline (resize width, "
+                         "delta_thresh)")
+    ap.add_argument("-v", "--video", default="",
+                    help="video used instead of the samples scene")
+    ap.add_argument("-n", "--num-frames", type=int, default=50)
+    ap.add_argument("-r", "--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    conf = load_conf(args.conf)
+    all_images = make_images(args.video, args.num_frames,
+                             conf["resize_image_width"], conf["delta_thresh"])
+    first = all_images['security_feed'][0]
+    print("{} frames of {}x{}".format(len(all_images['security_feed']),
+                                      first.shape[1], first.shape[0]))
+    print("{:>13} {:>20} {:>10} {:>10} {:>8} {:>8}".format(
+          "images", "profile", "ms/image", "KB/image", "speedup", "ratio"))
+    for iname, images in all_images.items():
+        ref_ms = ref_kb = None
+        for name, image_format, png, jpg, webp, bilevel in PROFILES:
+            if (image_format == 'pbm' or bilevel) and iname != 'thresh':
+                continue
+            params = imwrite_params(
+                image_format, {"png_compression": png, "jpeg_quality": jpg,
+                               "webp_quality": webp}, bilevel)
+            ms = time_ms(lambda: encode(images, image_format, params),
+                         args.repeat) / len(images)
+            encoded = encode(images, image_format, params)
+            kb = np.mean([len(buf) for buf in encoded]) / 1000
+            if ref_ms is None:
+                ref_ms, ref_kb = ms, kb
+            print("{:>13} {:>20} {:>10.3f} {:>10.1f} {:>7.2f}x {:>8.2f}".format(
+                  iname, name, ms, kb, ref_ms / ms, kb / ref_kb))
+            if iname == 'thresh' and image_format not in LOSSY_FORMATS:
+                flags = cv2.IMREAD_GRAYSCALE
+                assert all(np.array_equal(cv2.imdecode(buf, flags), image)
+                           for buf, image in zip(encoded, images)), name
@@ -0,0 +1,151 @@
+"""
+Accuracy and speed of the blur modes and of the single-pass dilation
+
+The frames of a scene (by default the synthetic scene built on the image of
+`samples/`, see `synthetic.py`, or a video with `-v`) are resized like in the
+pipeline, converted to grayscale and blurred with each mode of
+`fast_filters.Blur`, for several kernel sizes. For each mode, reports:
+- the time to blur a frame
+- the mean and maximum absolute difference with the Gaussian blur
+- the IoU of the motion masks (thresholded and dilated frame deltas against
+  the first frame) with the masks obtained with the Gaussian blur
+- the proportion of frames whose motion decision (largest contour at least
+  `min_area` big) is the same as with the Gaussian blur
+
+The dilation is then timed with 2 passes of a 3x3 square and with 1 pass of a
+5x5 square, and the masks of both are checked to be identical.
+
+Run from `basic_motion_detection_and_tracking_system/`:
+
+    $ python -m benchmarks.bench_filters -n 200
+    $ python -m benchmarks.bench_filters -v video.mp4 -k 21 41 61
+"""
+import argparse
+import time
+# Third-party modules
+import cv2
+from imutils import resize
+import numpy as np
+# Own modules
+from benchmarks.bench_pipeline import load_conf, make_frames
+from fast_filters import Blur, dilate
+
+# Blur modes and their options, compared with the Gaussian blur
+MODES = [
+    ('gaussian', {}),
+    ('box', {'num_boxes': 1}),
+    ('box', {'num_boxes': 3}),
+    ('box', {'num_boxes': 4}),
+    ('integral', {'num_boxes': 3}),
+    ('pyramid', {'pyramid_levels': 1}),
+    ('pyramid', {'pyramid_levels': 2})
+]
+
+
+# Return the grayscale frames of the video `video_filepath`, or of the scene
+# `samples` if it is empty, resized to `width`
+def load_grays(video_filepath, num_frames, width):
+    if video_filepath:
+        frames = []
+        camera = cv2.VideoCapture(video_filepath)
+        while len(frames) < num_frames:
+            grabbed, frame = camera.read()
+            if not grabbed:
+                break
+            frames.append(frame)
+        camera.release()
+    else:
+        frames = make_frames('samples', num_frames)
+    if width:
+        frames = [resize(f, width=width) for f in frames]
+    return [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in frames]
+
+
+# Return the motion masks of the blurred frames (against the first one) and
+# the area of their largest contour
+def motion_masks(blurred, delta_thresh):
+    masks, max_areas = [], []
+    for image in blurred[1:]:
+        frame_delta = cv2.absdiff(blurred[0], image)
+        _, thresh = cv2.threshold(frame_delta, delta_thresh, 255,
+                                  cv2.THRESH_BINARY)
+        thresh = dilate(thresh, iterations=2)
+        cnts = cv2.findContours(thresh, cv2.RETR_EXTERNAL,
+                                cv2.CHAIN_APPROX_SIMPLE)[-2]
+        masks.append(thresh > 0)
+        max_areas.append(max([cv2.contourArea(c) for c in cnts], default=0))
+    return masks, np.array(max_areas)
+
+
+def iou(a, b):
+    union = np.count_nonzero(a | b)
+    return np.count_nonzero(a & b) / union if union else 1.0
+
+
+# Return the mean time in ms of `func()` over `repeat` calls
+def time_ms(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--conf", default="conf.json",
+                    help="configuration file of the pipeline (resize width, "
+                         "delta_thresh, min_area)")
+    ap.add_argument("-v", "--video", default="",
+                    help="video used instead of the samples scene")
+    ap.add_argument("-n", "--num-frames", type=int, default=200)
+    ap.add_argument("-k", "--kernel-sizes", type=int, nargs="+",
+                    default=[11, 21, 41])
+    args = ap.parse_args()
+
+    conf = load_conf(args.conf)
+    grays = load_grays(args.video, args.num_frames,
+                       conf["resize_image_width"])
+    print("{} frames of {}x{}".format(len(grays), grays[0].shape[1],
+                                      grays[0].shape[0]))
+    print("{:>7} {:>26} {:>10} {:>8} {:>10} {:>8} {:>8} {:>10}".format(
+          "kernel", "mode", "ms/frame", "speedup", "mean diff", "max diff",
+          "mask IoU", "decisions"))
+    for k in args.kernel_sizes:
+        ref_blurred = ref_masks = ref_motion = ref_ms = None
+        for mode, options in MODES:
+            blur = Blur((k, k), mode, **options)
+            dst = np.empty_like(grays[0])
+            ms = time_ms(lambda: [blur.apply(g, dst=dst) for g in grays],
+                         3) / len(grays)
+            blurred = [blur.apply(g) for g in grays]
+            masks, max_areas = motion_masks(blurred, conf["delta_thresh"])
+            motion = max_areas >= conf["min_area"]
+            if ref_blurred is None:
+                ref_blurred, ref_masks, ref_motion, ref_ms = \
+                    blurred, masks, motion, ms
+            diffs = [np.abs(b.astype(np.int16) - r)
+                     for b, r in zip(blurred, ref_blurred)]
+            name = mode + "".join(" {}={}".format(*o) for o in
+                                  options.items())
+            print("{:>7} {:>26} {:>10.3f} {:>7.2f}x {:>10.3f} {:>8d} "
+                  "{:>8.3f} {:>10.1%}".format(
+                   "{0}x{0}".format(k), name, ms, ref_ms / ms,
+                   np.mean([d.mean() for d in diffs]),
+                   max(int(d.max()) for d in diffs),
+                   np.mean([iou(m, r) for m, r in zip(masks, ref_masks)]),
+                   np.mean(motion == ref_motion)))
+
+    # Dilation of the thresholded frame deltas
+    blurred = [cv2.GaussianBlur(g, (21, 21), 0) for g in grays]
+    threshs = [cv2.threshold(cv2.absdiff(blurred[0], b), conf["delta_thresh"],
+                             255, cv2.THRESH_BINARY)[1] for b in blurred[1:]]
+    same = all(np.array_equal(dilate(t, single_pass=False), dilate(t))
+               for t in threshs)
+    dst = np.empty_like(threshs[0])
+    two_passes = time_ms(lambda: [dilate(t, single_pass=False, dst=dst)
+                                  for t in threshs], 5) / len(threshs)
+    one_pass = time_ms(lambda: [dilate(t, dst=dst) for t in threshs],
+                       5) / len(threshs)
+    print("Dilation: 2 passes of 3x3 {:.3f} ms, 1 pass of 5x5 {:.3f} ms "
+          "({:.2f}x), identical masks: {}".format(
+           two_passes, one_pass, two_passes / one_pass, same))
@@ -0,0 +1,140 @@
+"""
+Benchmark of the background models: time per frame and memory
+
+Each model runs on the same synthetic scene (grayscale, blurred like in the
+pipeline) at 480p, 720p and 1080p. Each (model, resolution) pair runs in its
+own process so that the memory of one model doesn't hide another's.
+
+Memory is reported in two ways:
+- traced: peak of the NumPy/Python allocations made by the model, measured
+  with `tracemalloc` in a second (untimed) pass. The internal state of the
+  OpenCV subtractors (MOG2, KNN) is not included.
+- RSS: growth of the peak resident set size of the process while the model
+  runs, which includes OpenCV's allocations but is only an approximation since
+  the allocator can reuse memory freed while generating the frames.
+
+Run from `basic_motion_detection_and_tracking_system/`:
+
+    $ python -m benchmarks.bench_models -n 200
+    $ python -m benchmarks.bench_models -m mog2 knn -r 1080p
+"""
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+import tracemalloc
+# Third-party modules
+import cv2
+# Own modules
+from background_models.registry import available_models, get_model
+from benchmarks.synthetic import RESOLUTIONS, SyntheticScene
+
+
+# Return the peak resident set size of the process in MB
+def peak_rss_mb():
+    try:
+        # Linux: the peak can be reset, see `reset_peak_rss()`
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+# Reset the peak resident set size to the current one (Linux only), so that
+# the memory used to generate the frames isn't counted
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+# Run `func(*args)` in a new process and return its result, so that the peak
+# RSS is measured for this call only
+# NOTE: same as a `ProcessPoolExecutor` with `max_tasks_per_child=1`, which
+# needs Python 3.11
+def run_in_process(func, *args):
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run_child,
+                                      args=(sender, func, args))
+    process.start()
+    sender.close()
+    try:
+        succeeded, result = receiver.recv()
+    except EOFError:
+        succeeded, result = False, "no result"
+    process.join()
+    if not succeeded:
+        raise RuntimeError("{} failed in process {} (exit code {}): "
+                           "{}".format(func.__name__, process.pid,
+                                       process.exitcode, result))
+    return result
+
+
+def _run_child(sender, func, args):
+    try:
+        result = (True, func(*args))
+    except Exception as e:
+        result = (False, "{}: {}".format(type(e).__name__, e))
+    sender.send(result)
+    sender.close()
+
+
+def bench_model(model_name, resolution, num_frames):
+    width, height = RESOLUTIONS[resolution]
+    scene = SyntheticScene(width, height, num_frames + 1)
+    grays = [cv2.GaussianBlur(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+                              (21, 21), 0)
+             for frame in scene.frames()]
+    del scene
+    reset_peak_rss()
+    rss_before = peak_rss_mb()
+    model = get_model(model_name)(grays[0], {})
+    start = time.perf_counter()
+    for gray in grays[1:]:
+        model.get_frame_delta(gray)
+    elapsed = time.perf_counter() - start
+    rss_mb = peak_rss_mb() - rss_before
+
+    tracemalloc.start()
+    model = get_model(model_name)(grays[0], {})
+    for gray in grays[1:]:
+        model.get_frame_delta(gray)
+    traced_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    tracemalloc.stop()
+    return {
+        'model': model_name,
+        'resolution': resolution,
+        'ms_per_frame': elapsed * 1000 / num_frames,
+        'traced_mb': traced_mb,
+        'rss_mb': rss_mb
+    }
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-m", "--models", nargs="+", default=None,
+                    help="names of the background models (default: all)")
+    ap.add_argument("-r", "--resolutions", nargs="+",
+                    default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    ap.add_argument("-n", "--num-frames", type=int, default=200,
+                    help="number of frames processed by each model")
+    args = ap.parse_args()
+
+    models = args.models or available_models()
+    print("{:>18} {:>10} {:>10} {:>12} {:>10}".format(
+          "model", "resolution", "ms/frame", "traced (MB)", "RSS (MB)"))
+    # NOTE: one process per model so that the peak RSS is per model
+    for model_name in models:
+        for resolution in args.resolutions:
+            result = run_in_process(bench_model, model_name, resolution,
+                                    args.num_frames)
+            print("{model:>18} {resolution:>10} {ms_per_frame:>10.2f} "
+                  "{traced_mb:>12.1f} {rss_mb:>10.1f}".format(**result))
@@ -0,0 +1,200 @@
+"""
+Benchmark of the full motion detection pipeline, with a baseline comparison
+
+The pipeline processes a fixed number of frames of deterministic scenes:
+synthetic scenes at 480p, 720p and 1080p, and a scene whose background is an
+image from `samples/`. Each (scene, background model) pair runs in its own
+process, with the frames generated beforehand so that only the pipeline is
+timed. The FPS, the mean/p50/p95 time of each stage (see `metrics.py`), the
+peak RSS while the pipeline runs and the number of minor page faults per frame
+(a sign of arrays being allocated and freed for every frame) are written to a
+JSON file.
+
+With `--baseline`, the results are compared with a previous JSON file and the
+script exits with status 1 if the FPS dropped (or the peak RSS grew) by more
+than `--tolerance`.
+
+Run from `basic_motion_detection_and_tracking_system/`:
+
+    $ python -m benchmarks.bench_pipeline -n 300 -o baseline.json
+    $ python -m benchmarks.bench_pipeline -n 300 -o new.json -b baseline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import sys
+# Third-party modules
+import cv2
+import numpy as np
+# Own modules
+from background_models.registry import available_models
+from benchmarks.bench_models import peak_rss_mb, reset_peak_rss, \
+    run_in_process
+from benchmarks.synthetic import RESOLUTIONS, ReplayCamera, SyntheticScene
+from pipeline import MotionDetectionPipeline, merge_conf
+
+SAMPLE_IMAGE = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                            'samples', 'security_feed_000117.jpeg')
+SCENES = list(RESOLUTIONS) + ['samples']
+# Options of `conf.json` that are the same for all the runs: nothing is saved
+# or shown, and nothing is logged
+BENCH_CONF = {
+    "disable_logging": True,
+    "video_filepath": "",
+    "image_dirpath": "",
+    "reports_dirpath": "",
+    "show_video": False,
+    "start_frame": 1,
+    "end_frame": 0,
+    "metrics": {"summary_interval": 0, "http_port": 0}
+}
+
+
+def load_conf(conf_path):
+    with open(conf_path) as f:
+        return json.load(f)
+
+
+# Return the frames of the scene
+def make_frames(scene, num_frames):
+    if scene == 'samples':
+        background = cv2.imread(SAMPLE_IMAGE)
+        height, width = background.shape[:2]
+        scene = SyntheticScene(width, height, num_frames,
+                               background=background)
+    else:
+        scene = SyntheticScene(*RESOLUTIONS[scene], num_frames)
+    return scene.frames()
+
+
+# NOTE: `overrides` are options of `conf.json` that are changed for this run
+def bench_pipeline(conf, scene, model_name, num_frames, overrides=None):
+    # NOTE: one more frame since the first one is the background image
+    frames = make_frames(scene, num_frames + 1)
+    height, width = frames[0].shape[:2]
+    conf = merge_conf(merge_conf(conf, BENCH_CONF), overrides or {})
+    conf["background_model"] = model_name
+    conf["metrics"]["window"] = num_frames
+    pipeline = MotionDetectionPipeline(conf, camera=ReplayCamera(frames))
+    pipeline.create_saved_folder()
+    pipeline.validate_conf()
+    del frames
+    reset_peak_rss()
+    minor_faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    pipeline.setup()
+    pipeline.run()
+    minor_faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - \
+        minor_faults
+
+    stages = {}
+    for stage in pipeline.metrics.stages():
+        histogram = pipeline.metrics.histograms[stage]
+        p50, p95 = histogram.quantiles([0.5, 0.95])
+        stages[stage] = {
+            'mean_ms': histogram.total * 1000 / histogram.count,
+            'p50_ms': p50 * 1000,
+            'p95_ms': p95 * 1000
+        }
+    return {
+        'scene': scene,
+        'size': [width, height],
+        'model': model_name,
+        'num_frames': pipeline.num_frames_processed,
+        'fps': pipeline.stats()['fps'],
+        'peak_rss_mb': peak_rss_mb(),
+        'minor_faults_per_frame': minor_faults / max(
+            1, pipeline.num_frames_processed),
+        'stages': stages
+    }
+
+
+# Return the regressions of `results` compared with `baseline`
+def compare(results, baseline, tolerance):
+    baseline = {(r['scene'], r['model']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        base = baseline.get((result['scene'], result['model']))
+        if base is None:
+            continue
+        if result['fps'] < base['fps'] * (1 - tolerance):
+            regressions.append("{scene}/{model}: {fps:.1f} FPS".format(
+                **result) + " (baseline: {:.1f} FPS)".format(base['fps']))
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append("{scene}/{model}: peak RSS {peak_rss_mb:.1f} "
+                               "MB".format(**result) +
+                               " (baseline: {:.1f} MB)".format(
+                                base['peak_rss_mb']))
+    return regressions
+
+
+def print_result(result, base=None):
+    slowest = max(result['stages'].items(), key=lambda s: s[1]['mean_ms'])
+    change = ""
+    if base:
+        change = "{:+.1%}".format(result['fps'] / base['fps'] - 1)
+    print("{:>8} {:>18} {:>8.1f} {:>8} {:>10.1f} {:>16}".format(
+          result['scene'], result['model'], result['fps'], change,
+          result['peak_rss_mb'],
+          "{} ({:.2f} ms)".format(slowest[0], slowest[1]['mean_ms'])))
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--conf", default="conf.json",
+                    help="configuration file of the pipeline")
+    ap.add_argument("-s", "--scenes", nargs="+", default=SCENES,
+                    choices=SCENES)
+    ap.add_argument("-m", "--models", nargs="+", default=None,
+                    help="names of the background models (default: all)")
+    ap.add_argument("-n", "--num-frames", type=int, default=300,
+                    help="number of frames processed in each run")
+    ap.add_argument("-o", "--output", default="bench_pipeline.json",
+                    help="JSON file where the results are written")
+    ap.add_argument("-b", "--baseline", default=None,
+                    help="JSON file of a previous run to compare with")
+    ap.add_argument("-t", "--tolerance", type=float, default=0.1,
+                    help="relative change above which a difference with the "
+                         "baseline is a regression")
+    args = ap.parse_args()
+
+    conf = load_conf(args.conf)
+    baseline = load_conf(args.baseline) if args.baseline else None
+    base_results = {}
+    if baseline:
+        base_results = {(r['scene'], r['model']): r
+                        for r in baseline['results']}
+    models = args.models or available_models()
+    print("{:>8} {:>18} {:>8} {:>8} {:>10} {:>16}".format(
+          "scene", "model", "FPS", "change", "RSS (MB)", "slowest stage"))
+    results = []
+    # NOTE: one run per process so that the peak RSS is per run
+    for scene in args.scenes:
+        for model_name in models:
+            result = run_in_process(bench_pipeline, conf, scene, model_name,
+                                    args.num_frames)
+            results.append(result)
+            print_result(result, base_results.get((scene, model_name)))
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'date': datetime.datetime.now().isoformat(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'num_frames': args.num_frames,
+            'results': results
+        }, f, indent=4)
+    print("Results written to {}".format(args.output))
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions (tolerance: {:.0%}):".format(args.tolerance))
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print("No regressions (tolerance: {:.0%})".format(args.tolerance))
@@ -0,0 +1,74 @@
+"""
+Benchmark of the strategies for seeking a video source to a given frame
+
+For each target frame, every strategy applicable to the source is timed from
+opening the capture to reading the target frame, and the frame read is
+compared with the one reached by the grab-only fast-forward (the reference).
+
+Run from `basic_motion_detection_and_tracking_system/`:
+
+    $ python -m benchmarks.bench_seek -v video.mp4 -f 100 1000 10000
+    $ python -m benchmarks.bench_seek -i "images/in%06d.jpg" -f 100 1000
+"""
+import argparse
+import time
+# Third-party modules
+import cv2
+import numpy as np
+# Own modules
+from frame_seek import seek
+
+
+def open_source(video_filepath, image_dirpath):
+    if video_filepath:
+        return cv2.VideoCapture(video_filepath)
+    return cv2.VideoCapture(image_dirpath, cv2.CAP_IMAGES)
+
+
+# Return the time taken to open the source, seek to `index` and read the frame,
+# the frame read and the strategy that succeeded
+def time_seek(strategy, index, video_filepath, image_dirpath):
+    start = time.perf_counter()
+    camera = open_source(video_filepath, image_dirpath)
+    camera, used = seek(camera, index, strategy=strategy,
+                        video_filepath=video_filepath,
+                        image_dirpath=image_dirpath)
+    grabbed, frame = camera.read()
+    elapsed = time.perf_counter() - start
+    camera.release()
+    return elapsed, frame if grabbed else None, used
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    group = ap.add_mutually_exclusive_group(required=True)
+    group.add_argument("-v", "--video", help="path to a video file")
+    group.add_argument("-i", "--images",
+                       help="printf-style pattern of an image sequence")
+    ap.add_argument("-f", "--frames", type=int, nargs="+", required=True,
+                    help="frame numbers (1-based) to seek to")
+    args = ap.parse_args()
+
+    if args.video:
+        strategies = ['pos_frames', 'grab']
+    else:
+        strategies = ['index', 'pos_frames', 'grab']
+    print("{:>10} {:>12} {:>12} {:>10}".format("frame", "strategy", "time (ms)",
+                                              "exact"))
+    for frame_num in args.frames:
+        results = {}
+        for strategy in strategies:
+            results[strategy] = time_seek(strategy, frame_num - 1, args.video,
+                                          args.images)
+        reference = results['grab'][1]
+        for strategy in strategies:
+            elapsed, frame, used = results[strategy]
+            if used != strategy:
+                # The strategy failed and the seek fell back to grab
+                exact = "fallback"
+            elif frame is None or reference is None:
+                exact = "no frame"
+            else:
+                exact = "yes" if np.array_equal(frame, reference) else "no"
+            print("{:>10} {:>12} {:>12.1f} {:>10}".format(
+                  frame_num, strategy, elapsed * 1000, exact))
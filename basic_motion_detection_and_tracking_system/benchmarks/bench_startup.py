@@ -0,0 +1,147 @@
+"""
+Startup to the first frame of a short clip, with `run_system.py` and with the
+daemon of `run_daemon.py`
+
+A short clip (the synthetic scene built on the image of `samples/`, see
+`synthetic.py`, or the first frames of a video with `-v`) is processed `-r`
+times:
+- `run_system`: one `run_system.py` process per clip. The startup is measured
+  by the pipeline from the start of the script (i.e. without the start of the
+  Python interpreter) and the total is the wall time of the process.
+- `daemon`: one job per clip submitted to a daemon started beforehand. The
+  startup is measured by the worker from the moment it takes the job and the
+  total is the time between the submission of the job and its result.
+
+Both modes use the same configuration (`-c`) with the images saved in a
+temporary folder, logging disabled and no display.
+
+Run from `basic_motion_detection_and_tracking_system/`:
+
+    $ python -m benchmarks.bench_startup -n 30 -r 5
+    $ python -m benchmarks.bench_startup -v video.mp4 -n 100
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+# Third-party modules
+import cv2
+# Own modules
+from benchmarks.bench_pipeline import load_conf, make_frames
+from job_daemon import submit_job
+
+STARTUP_PATTERN = re.compile(r"Startup to first frame: ([0-9.]+) ms")
+
+
+# Write the first `num_frames` frames of the video `video_filepath` (or of the
+# samples scene if it is empty) in the clip `clip_path`
+def write_clip(clip_path, video_filepath, num_frames):
+    frames = []
+    if video_filepath:
+        camera = cv2.VideoCapture(video_filepath)
+        while len(frames) < num_frames:
+            grabbed, frame = camera.read()
+            if not grabbed:
+                break
+            frames.append(frame)
+        camera.release()
+    else:
+        frames = make_frames('samples', num_frames)
+    height, width = frames[0].shape[:2]
+    writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*'MJPG'), 20,
+                             (width, height))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+
+# Return the startup and total times (ms) of `repeat` runs of `run_system.py`
+def bench_run_system(conf_path, repeat):
+    startups, totals = [], []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, 'run_system.py', '-c', conf_path],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True, check=True).stdout
+        totals.append((time.perf_counter() - t) * 1000)
+        startups.append(float(STARTUP_PATTERN.search(output).group(1)))
+    return startups, totals
+
+
+# Return the startup and total times (ms) of `repeat` jobs run by a daemon
+def bench_daemon(conf_path, clip_path, spool_dirpath, repeat):
+    daemon = subprocess.Popen(
+        [sys.executable, 'run_daemon.py', '-c', conf_path, '-s',
+         spool_dirpath, '-w', '1', '-p', '0.01'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    startups, totals = [], []
+    try:
+        # NOTE: the first job is not counted since it also waits for the
+        # daemon to start
+        for i in range(repeat + 1):
+            name = "job_{:03d}".format(i)
+            result_path = os.path.join(spool_dirpath, 'done',
+                                       name + '.result.json')
+            t = time.perf_counter()
+            submit_job(spool_dirpath, {"video_filepath": clip_path}, name)
+            failed_path = os.path.join(spool_dirpath, 'failed',
+                                       name + '.result.json')
+            while not os.path.exists(result_path):
+                if daemon.poll() is not None or os.path.exists(failed_path):
+                    raise RuntimeError("The job failed, see the jobs in "
+                                       "{}".format(spool_dirpath))
+                time.sleep(0.001)
+            total = (time.perf_counter() - t) * 1000
+            with open(result_path) as f:
+                result = json.load(f)
+            if i:
+                startups.append(result['startup_time'] * 1000)
+                totals.append(total)
+    finally:
+        daemon.terminate()
+        daemon.wait()
+    return startups, totals
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--conf", default="conf.json",
+                    help="configuration file of the pipeline")
+    ap.add_argument("-v", "--video", default="",
+                    help="video used instead of the samples scene")
+    ap.add_argument("-n", "--num-frames", type=int, default=30,
+                    help="number of frames of the clip")
+    ap.add_argument("-r", "--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dirpath:
+        clip_path = os.path.join(tmp_dirpath, 'clip.avi')
+        write_clip(clip_path, args.video, args.num_frames)
+        conf = load_conf(args.conf)
+        conf.update(video_filepath=clip_path,
+                    reports_dirpath=os.path.join(tmp_dirpath, 'reports'),
+                    disable_logging=True, show_video=False)
+        os.makedirs(conf["reports_dirpath"])
+        conf_path = os.path.join(tmp_dirpath, 'conf.json')
+        with open(conf_path, 'w') as f:
+            json.dump(conf, f)
+
+        results = [
+            ('run_system', bench_run_system(conf_path, args.repeat)),
+            ('daemon', bench_daemon(conf_path, clip_path,
+                                    os.path.join(tmp_dirpath, 'spool'),
+                                    args.repeat))
+        ]
+    print("Clip of {} frames, {} runs, median times".format(
+          args.num_frames, args.repeat))
+    print("{:>11} {:>18} {:>10}".format("mode", "first frame (ms)",
+                                        "total (ms)"))
+    for mode, (startups, totals) in results:
+        print("{:>11} {:>18.1f} {:>10.1f}".format(
+              mode, statistics.median(startups), statistics.median(totals)))
@@ -0,0 +1,104 @@
+"""
+Deterministic synthetic scenes for the benchmarks
+
+A scene is a static background (textured, or a real image such as the ones in
+`samples/`) with moving rectangles, sensor noise and a slow global lighting
+drift. The same seed always gives the same frames.
+"""
+# Third-party modules
+import cv2
+import numpy as np
+
+RESOLUTIONS = {
+    '480p': (854, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080)
+}
+
+
+class SyntheticScene:
+    """Generate the BGR frames of a synthetic scene, one at a time.
+
+    Same interface as `cv2.VideoCapture` (`read()` and `release()`) so that
+    the scene can be given to the pipeline as its camera.
+    """
+
+    # NOTE: if `background` (BGR image) is given, it is resized to the size of
+    # the scene and used instead of the textured background
+    def __init__(self, width, height, num_frames, num_objects=3, noise=4.0,
+                 lighting_drift=20.0, seed=0, background=None):
+        self.width = width
+        self.height = height
+        self.num_frames = num_frames
+        self.noise = noise
+        self.lighting_drift = lighting_drift
+        self.rng = np.random.default_rng(seed)
+        # Smooth textured background
+        small = self.rng.integers(40, 200, (height // 16 + 1, width // 16 + 1,
+                                            3), dtype=np.uint8)
+        self.background = cv2.resize(small, (width, height),
+                                     interpolation=cv2.INTER_LINEAR)
+        if background is not None:
+            self.background = cv2.resize(background, (width, height),
+                                         interpolation=cv2.INTER_AREA)
+        # Rectangles: position, velocity, size and color
+        size = np.array([width, height]) // 10
+        self.positions = self.rng.uniform([0, 0], [width, height],
+                                          (num_objects, 2))
+        self.velocities = self.rng.uniform(-0.01, 0.01, (num_objects, 2)) * \
+            [width, height]
+        self.sizes = (self.rng.uniform(0.5, 1.5, (num_objects, 2)) *
+                      size).astype(int)
+        self.colors = self.rng.integers(0, 256, (num_objects, 3))
+        self.frame_num = 0
+
+    def read(self):
+        if self.frame_num >= self.num_frames:
+            return False, None
+        t = self.frame_num / max(1, self.num_frames - 1)
+        # Global lighting drift: a slow sine over the whole scene
+        offset = self.lighting_drift * np.sin(2 * np.pi * t)
+        frame = np.clip(self.background.astype(np.int16) + int(round(offset)),
+                        0, 255).astype(np.uint8)
+        for (x, y), (w, h), color in zip(self.positions, self.sizes,
+                                         self.colors):
+            cv2.rectangle(frame, (int(x), int(y)), (int(x) + w, int(y) + h),
+                          color.tolist(), -1)
+        # Move the rectangles, bouncing on the borders
+        self.positions += self.velocities
+        for i in range(2):
+            limit = self.width if i == 0 else self.height
+            out = (self.positions[:, i] < 0) | (self.positions[:, i] > limit)
+            self.velocities[out, i] *= -1
+        if self.noise:
+            noise = self.rng.normal(0, self.noise, frame.shape)
+            frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+        self.frame_num += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+    # Return all the remaining frames
+    def frames(self):
+        frames = []
+        while True:
+            grabbed, frame = self.read()
+            if not grabbed:
+                return frames
+            frames.append(frame)
+
+
+class ReplayCamera:
+    """Camera returning frames generated beforehand, so that generating them
+    isn't part of the time measured."""
+
+    def __init__(self, frames):
+        self._frames = iter(frames)
+
+    def read(self):
+        frame = next(self._frames, None)
+        return frame is not None, frame
+
+    def release(self):
+        self._frames = iter(())
@@ -0,0 +1,56 @@
+"""
+Checkpoints of the pipeline, for resuming the processing of a long video
+
+A checkpoint is a pickled `dict` saved in the output folder of the run
+(`checkpoint.pkl`) with everything needed to continue after the last processed
+frame: the number of the next frame, the background model, the tracker, the
+motion gate, and the size of the output files (trajectories, archives, index
+of the events) at that time. On resume, the output files are truncated to
+these sizes so that the frames processed after the checkpoint aren't written
+twice.
+
+The file is replaced atomically: a crash while saving a checkpoint leaves the
+previous one.
+"""
+import os
+import pickle
+
+CHECKPOINT_FILENAME = 'checkpoint.pkl'
+CHECKPOINT_VERSION = 2
+
+
+class CheckpointError(Exception):
+    """Raised when a checkpoint can't be loaded"""
+
+
+def checkpoint_path(folder):
+    return os.path.join(folder, CHECKPOINT_FILENAME)
+
+
+def save_checkpoint(folder, state):
+    state = dict(state, version=CHECKPOINT_VERSION)
+    path = checkpoint_path(folder)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(folder):
+    path = checkpoint_path(folder)
+    try:
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+    except FileNotFoundError:
+        raise CheckpointError("No checkpoint in {}".format(folder))
+    except (pickle.UnpicklingError, EOFError, AttributeError,
+            ImportError) as e:
+        raise CheckpointError("Checkpoint {} couldn't be loaded: {}".format(
+                              path, e))
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise CheckpointError("Checkpoint {} has version {}, {} is "
+                              "expected".format(path, state.get('version'),
+                                                CHECKPOINT_VERSION))
+    return state
@@ -0,0 +1,148 @@
+"""
+Region of interest (ROI) and scale at which the motion is detected
+
+Only the bounding box of the ROI is cropped out of the original frame, resized
+to the detection scale, converted to grayscale and blurred. The pixels of the
+crop outside the ROI polygons/rectangles are masked out of the frame delta.
+The bounding boxes found at the detection scale are then mapped back onto the
+displayed ('security feed') frame.
+"""
+# Third-party modules
+import cv2
+import numpy as np
+# Own modules
+from fast_filters import Blur
+
+
+# Return the odd kernel size closest to `ksize` * `ratio` (at least 1)
+def scale_kernel_size(ksize, ratio):
+    ksize = max(1, int(round(ksize * ratio)))
+    return ksize if ksize % 2 else ksize + 1
+
+
+class DetectionRegion:
+    """Crop, scale and mask used for detecting motion on frames of one shape.
+
+    `rectangles` ([x, y, w, h]) and `polygons` ([[x1, y1], [x2, y2], ...]) are
+    in pixels of the original frames. If there are none, the whole frame is
+    the ROI. `detection_width` and `display_width` are the widths the whole
+    frame would have at the detection and display scales (0 means the original
+    width). If `reuse_buffers` is True, the intermediate images are written
+    into buffers allocated once. The crop is blurred with `fast_filters.Blur`
+    and `blur_options` (e.g. `mode`).
+    """
+
+    def __init__(self, frame_shape, detection_width=0, display_width=0,
+                 rectangles=None, polygons=None, ksize=(21, 21),
+                 reuse_buffers=False, blur_options=None):
+        height, width = frame_shape[:2]
+        rectangles = rectangles or []
+        polygons = [np.asarray(p, dtype=np.float64) for p in polygons or []]
+        self.detection_scale = detection_width / width if detection_width \
+            else 1.0
+        self.display_scale = display_width / width if display_width else 1.0
+
+        # Bounding box of the ROI in the original frame
+        if rectangles or polygons:
+            xs = [r[0] for r in rectangles] + [r[0] + r[2] for r in rectangles]
+            ys = [r[1] for r in rectangles] + [r[1] + r[3] for r in rectangles]
+            for p in polygons:
+                xs.extend(p[:, 0])
+                ys.extend(p[:, 1])
+            x0 = int(max(0, np.floor(min(xs))))
+            y0 = int(max(0, np.floor(min(ys))))
+            x1 = int(min(width, np.ceil(max(xs))))
+            y1 = int(min(height, np.ceil(max(ys))))
+            if x1 <= x0 or y1 <= y0:
+                raise ValueError("The ROI is outside of the frame "
+                                 "({}x{})".format(width, height))
+        else:
+            x0, y0, x1, y1 = 0, 0, width, height
+        self.crop = (x0, y0, x1, y1)
+        # Size of the crop at the detection scale
+        self.crop_size = (max(1, int(round((x1 - x0) * self.detection_scale))),
+                          max(1, int(round((y1 - y0) * self.detection_scale))))
+
+        # Mask of the ROI within the crop at the detection scale. It is not
+        # needed if the ROI is one rectangle (or the whole frame).
+        self.mask = None
+        if polygons or len(rectangles) > 1:
+            self.mask = np.zeros(self.crop_size[::-1], np.uint8)
+            for x, y, w, h in rectangles:
+                pts = np.array([[x, y], [x + w, y], [x + w, y + h],
+                                [x, y + h]], np.float64)
+                self._fill(pts)
+            for pts in polygons:
+                self._fill(pts)
+
+        # The areas and kernel sizes are expressed at the display scale:
+        # convert them to the detection scale
+        self.ratio = self.detection_scale / self.display_scale
+        self.ksize = (scale_kernel_size(ksize[0], self.ratio),
+                      scale_kernel_size(ksize[1], self.ratio))
+        self.blur = Blur(self.ksize, **(blur_options or {}))
+
+        # Buffers of the resized crop, its grayscale image and the masked
+        # frame delta
+        self._resized = self._gray = self._masked = None
+        if reuse_buffers:
+            self._resized = np.empty(self.crop_size[::-1] + frame_shape[2:],
+                                     np.uint8)
+            self._gray = np.empty(self.crop_size[::-1], np.uint8)
+            self._masked = np.empty(self.crop_size[::-1], np.uint8)
+
+    # Return the area at the detection scale of `area` pixels at the display
+    # scale
+    def detection_area(self, area):
+        return area * self.ratio ** 2
+
+    # Return the blurred grayscale ROI crop of `frame` (original frame) at the
+    # detection scale, written into `dst` if given
+    def preprocess(self, frame, dst=None):
+        x0, y0, x1, y1 = self.crop
+        crop = frame[y0:y1, x0:x1]
+        if self.crop_size != (x1 - x0, y1 - y0):
+            crop = cv2.resize(crop, self.crop_size, dst=self._resized,
+                              interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        return self.blur.apply(gray, dst=dst)
+
+    # Zero out the pixels of the frame delta that are outside the ROI
+    def apply_mask(self, frame_delta):
+        if self.mask is None:
+            return frame_delta
+        return cv2.bitwise_and(frame_delta, self.mask, dst=self._masked)
+
+    # Map a bounding box found at the detection scale onto the displayed frame
+    def to_display(self, x, y, w, h):
+        x0, y0 = self.crop[:2]
+        s = self.display_scale
+        d = self.detection_scale
+        return (int(round((x0 + x / d) * s)), int(round((y0 + y / d) * s)),
+                int(round(w / d * s)), int(round(h / d * s)))
+
+    # Same as `to_display()` for an array of boxes (N x 4)
+    def to_display_boxes(self, boxes):
+        x0, y0 = self.crop[:2]
+        s = self.display_scale
+        d = self.detection_scale
+        boxes = boxes / d
+        boxes[:, :2] += [x0, y0]
+        # NOTE: `np.round()` rounds halves to even like `round()`
+        return np.round(boxes * s).astype(np.int32)
+
+    # Draw the outline of the ROI on the displayed frame
+    def draw(self, frame, rectangles, polygons, color=(255, 0, 0)):
+        s = self.display_scale
+        for x, y, w, h in rectangles or []:
+            cv2.rectangle(frame, (int(x * s), int(y * s)),
+                          (int((x + w) * s), int((y + h) * s)), color, 1)
+        for pts in polygons or []:
+            pts = np.round(np.asarray(pts, np.float64) * s).astype(np.int32)
+            cv2.polylines(frame, [pts], True, color, 1)
+
+    # Fill the polygon `pts` (original frame coordinates) in the mask
+    def _fill(self, pts):
+        x0, y0 = self.crop[:2]
+        pts = (pts - [x0, y0]) * self.detection_scale
+        cv2.fillPoly(self.mask, [np.round(pts).astype(np.int32)], 255)
@@ -0,0 +1,284 @@
+"""
+Bounding boxes of the moving regions of the thresholded image
+
+The regions are found either with `cv2.findContours()` (external contours, one
+`cv2.contourArea()` and `cv2.boundingRect()` per contour) or with
+`cv2.connectedComponentsWithStats()`, which returns the box and the area of
+every region as arrays in one call, without looping over the regions in
+Python. The area of a component is its number of pixels, while the area of a
+contour is the area of the polygon through the centers of its border pixels,
+so the same `min_area` keeps slightly more regions with the components. The
+components cost about the same whatever the number of regions (every pixel is
+labelled), so they are faster than the contours only when there are many
+regions, e.g. in noisy scenes.
+
+The boxes that overlap or are close to each other (e.g. the pieces of one
+person, or the many small regions of rain or leaves) can then be merged:
+- 'union': the boxes closer than `distance` pixels are grouped (transitively)
+  and each group is replaced by its bounding box
+- 'nms': non-maximum suppression, the boxes overlapping a bigger box with an
+  IoU above `iou_threshold` are removed
+
+The boxes of a frame are returned as a structured array (`DETECTION_DTYPE`),
+which can also be saved for all the frames in a binary file, or as one JSON
+line per frame with the durations of the stages of the processing loop.
+"""
+import json
+import os
+# Third-party modules
+import cv2
+import numpy as np
+
+EXTRACTION_METHODS = ['contours', 'components']
+MERGE_METHODS = ['none', 'union', 'nms']
+DETECTIONS_MAGIC = b'MDDETS01'
+DETECTION_DTYPE = np.dtype([('frame', '<i4'), ('x', '<i4'), ('y', '<i4'),
+                            ('w', '<i4'), ('h', '<i4'), ('area', '<i4')])
+
+
+# Return the bounding boxes [x, y, w, h] (N x 4) and areas (N) of the contours
+# `cnts` at least `min_area` big
+def contour_boxes(cnts, min_area):
+    boxes, areas = [], []
+    for c in cnts:
+        area = cv2.contourArea(c)
+        if area < min_area:
+            continue
+        boxes.append(cv2.boundingRect(c))
+        areas.append(area)
+    return np.array(boxes, np.int32).reshape(-1, 4), \
+        np.array(areas, np.float64)
+
+
+# Same as `contour_boxes()` with the connected components of `thresh` (binary
+# image), found in one call. `thresh` isn't modified.
+def component_boxes(thresh, min_area):
+    _, _, stats, _ = cv2.connectedComponentsWithStats(thresh, connectivity=8,
+                                                      ltype=cv2.CV_32S)
+    # The first component is the background
+    stats = stats[1:]
+    kept = stats[:, cv2.CC_STAT_AREA] >= min_area
+    return stats[kept, :4].astype(np.int32), \
+        stats[kept, cv2.CC_STAT_AREA].astype(np.float64)
+
+
+# Return the N x N matrix of the gaps (pixels) between the boxes: 0 if they
+# overlap, otherwise the largest of the horizontal and vertical gaps
+def box_gaps(boxes):
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    gap_x = np.maximum(x0[:, None], x0[None, :]) - \
+        np.minimum(x1[:, None], x1[None, :])
+    gap_y = np.maximum(y0[:, None], y0[None, :]) - \
+        np.minimum(y1[:, None], y1[None, :])
+    return np.maximum(np.maximum(gap_x, gap_y), 0)
+
+
+# Merge the boxes closer than `distance` pixels (0 means overlapping or
+# touching). Return the boxes and areas of the groups.
+def merge_union(boxes, areas, distance=0):
+    n = len(boxes)
+    if n < 2:
+        return boxes, areas
+    adjacent = box_gaps(boxes) <= distance
+    # Label of each box: smallest index of its group, found by propagating the
+    # labels through the adjacent boxes until they don't change. Each box also
+    # takes the label of its label (pointer jumping), so that long chains of
+    # boxes need few iterations.
+    labels = np.arange(n)
+    while True:
+        new_labels = np.where(adjacent, labels[None, :], n).min(axis=1)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    groups, inverse = np.unique(labels, return_inverse=True)
+    if len(groups) == n:
+        return boxes, areas
+    x0 = np.full(len(groups), np.iinfo(np.int32).max)
+    y0 = x0.copy()
+    x1 = np.zeros(len(groups), np.int64)
+    y1 = x1.copy()
+    np.minimum.at(x0, inverse, boxes[:, 0])
+    np.minimum.at(y0, inverse, boxes[:, 1])
+    np.maximum.at(x1, inverse, boxes[:, 0] + boxes[:, 2])
+    np.maximum.at(y1, inverse, boxes[:, 1] + boxes[:, 3])
+    merged = np.stack([x0, y0, x1 - x0, y1 - y0], axis=1).astype(np.int32)
+    return merged, np.bincount(inverse, weights=areas)
+
+
+# Non-maximum suppression: keep the biggest boxes, and remove the boxes whose
+# IoU with a bigger kept box is above `iou_threshold`. Return the kept boxes and
+# areas, in their original order.
+def merge_nms(boxes, areas, iou_threshold=0.3):
+    n = len(boxes)
+    if n < 2:
+        return boxes, areas
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    inter = np.clip(np.minimum(x1[:, None], x1[None, :]) -
+                    np.maximum(x0[:, None], x0[None, :]), 0, None) * \
+        np.clip(np.minimum(y1[:, None], y1[None, :]) -
+                np.maximum(y0[:, None], y0[None, :]), 0, None)
+    box_areas = boxes[:, 2].astype(np.int64) * boxes[:, 3]
+    iou = inter / (box_areas[:, None] + box_areas[None, :] - inter)
+    # Rank of each box, from the biggest. `suppresses[i, j]`: box i removes
+    # box j if i is kept.
+    rank = np.empty(n, np.intp)
+    rank[np.argsort(-areas, kind='stable')] = np.arange(n)
+    suppresses = (iou > iou_threshold) & (rank[:, None] < rank[None, :])
+    removed = np.zeros(n, bool)
+    # Only the boxes that overlap smaller boxes are visited, from the biggest
+    candidates = np.flatnonzero(suppresses.any(axis=1))
+    for i in candidates[np.argsort(rank[candidates])]:
+        if not removed[i]:
+            removed |= suppresses[i]
+    return boxes[~removed], areas[~removed]
+
+
+def merge_boxes(boxes, areas, method='none', distance=0, iou_threshold=0.3):
+    if method == 'union':
+        return merge_union(boxes, areas, distance)
+    if method == 'nms':
+        return merge_nms(boxes, areas, iou_threshold)
+    return boxes, areas
+
+
+# Return the detections of frame `frame_num` as a structured array (see
+# `DETECTION_DTYPE`)
+def make_detections(frame_num, boxes, areas):
+    detections = np.empty(len(boxes), DETECTION_DTYPE)
+    detections['frame'] = frame_num
+    for i, field in enumerate(['x', 'y', 'w', 'h']):
+        detections[field] = boxes[:, i]
+    detections['area'] = np.round(areas)
+    return detections
+
+
+# Return the boxes [x, y, w, h] (N x 4) of the detections
+def detection_boxes(detections):
+    return np.stack([detections[f] for f in ['x', 'y', 'w', 'h']], axis=1)
+
+
+# Draw all the boxes [x, y, w, h] on `frame` with one call (same pixels as one
+# `cv2.rectangle()` per box)
+def draw_boxes(frame, boxes, color=(0, 255, 0), thickness=2):
+    if not len(boxes):
+        return
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    corners = np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1),
+                        np.stack([x1, y1], 1), np.stack([x0, y1], 1)], axis=1)
+    cv2.polylines(frame, list(corners.astype(np.int32)), True, color,
+                  thickness)
+
+
+class DetectionWriter:
+    """Write the detections of every frame to a binary file.
+
+    The file starts with `DETECTIONS_MAGIC`, followed by one record of
+    `DETECTION_DTYPE` per box. The records are buffered and appended
+    `buffer_size` at a time.
+
+    If `state` (from `get_state()`) is given, the writer continues an existing
+    file, which is first truncated to its size at the time of `state`.
+    """
+
+    def __init__(self, path, buffer_size=1024, state=None):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._records = []
+        self._num_pending = 0
+        if state:
+            self.num_records = state['num_records']
+            self._file = open(path, 'r+b')
+            self._file.truncate(state['size'])
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self.num_records = 0
+            self._file = open(path, 'wb')
+            self._file.write(DETECTIONS_MAGIC)
+
+    def write(self, detections):
+        if not len(detections):
+            return
+        self._records.append(detections)
+        self._num_pending += len(detections)
+        if self._num_pending >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._records:
+            records = np.concatenate(self._records)
+            self._file.write(records.tobytes())
+            self._file.flush()
+            self.num_records += len(records)
+            self._records = []
+            self._num_pending = 0
+
+    # Write the buffered records and return what is needed to continue the
+    # file later (e.g. from a checkpoint)
+    def get_state(self):
+        self.flush()
+        # NOTE: the magic number can still be in the buffer of the file
+        self._file.flush()
+        return {'size': self._file.tell(), 'num_records': self.num_records}
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class FrameRecordWriter:
+    """Write one JSON line per frame with its boxes and the duration of each
+    stage of the processing loop.
+
+    Each line is e.g. `{"frame": 12, "occupied": true, "boxes": [[x, y, w, h,
+    area], ...], "track_ids": [...], "ms": {"read": 0.41, ...}}`, where
+    `track_ids` is only present if the boxes are tracked and `ms` only if the
+    durations are given. As with `DetectionWriter`, `state` continues an
+    existing file.
+    """
+
+    def __init__(self, path, state=None):
+        self.path = path
+        if state:
+            self.num_records = state['num_records']
+            self._file = open(path, 'r+b')
+            self._file.truncate(state['size'])
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self.num_records = 0
+            self._file = open(path, 'wb')
+
+    def write(self, frame_num, detections, occupied, track_ids=None,
+              durations=None):
+        boxes = np.stack([detections[f] for f in
+                          ['x', 'y', 'w', 'h', 'area']], axis=1)
+        record = {'frame': frame_num, 'occupied': occupied,
+                  'boxes': boxes.tolist()}
+        if track_ids is not None:
+            record['track_ids'] = [int(i) for i in track_ids]
+        if durations is not None:
+            record['ms'] = {stage: round(d * 1000, 3)
+                            for stage, d in durations.items()}
+        self._file.write(json.dumps(record).encode() + b'\n')
+        self.num_records += 1
+
+    def get_state(self):
+        self._file.flush()
+        return {'size': self._file.tell(), 'num_records': self.num_records}
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+# Return the records of a detections file as a structured array (see
+# `DETECTION_DTYPE`), in the order they were written
+def load_detections(path):
+    with open(path, 'rb') as f:
+        if f.read(len(DETECTIONS_MAGIC)) != DETECTIONS_MAGIC:
+            raise ValueError("{} is not a detections file".format(path))
+    return np.fromfile(path, DETECTION_DTYPE, offset=len(DETECTIONS_MAGIC))
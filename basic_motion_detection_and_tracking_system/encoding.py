@@ -0,0 +1,123 @@
+"""
+Encoding of the images saved to disk
+
+Each set of images (security feed, thresholded, frame delta and background
+images) has its own encoding profile: the file format and the effort/quality
+of its encoder (PNG compression level, JPEG quality, WebP quality). The
+thresholded images are binary masks, so they can also be written with 1 bit per
+pixel: as bilevel PNG images or as binary PBM images (no compression).
+
+If the adaptive mode is enabled, the encoder effort is lowered while the
+writing can't keep up, i.e. while the queue of the asynchronous image writer
+is filling up or while the images take longer than a time budget to be
+written, and restored once the writing catches up.
+"""
+import logging
+import os
+# Third-party modules
+import cv2
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+# Sets of images with an encoding profile
+PROFILE_SETS = ['security_feed', 'thresh', 'frame_delta', 'background']
+# Sets of images that are binary masks (0 or 255)
+MASK_SETS = ['thresh']
+IMAGE_FORMATS = ['png', 'jpg', 'jpeg', 'webp']
+# Formats only supported for the binary masks
+MASK_FORMATS = ['pbm']
+
+# Weight of the last writing time in its moving average
+WRITE_MS_ALPHA = 0.1
+
+
+# Return the `cv2.imwrite()` parameters of an image in format `image_format`
+# encoded with the settings of `profile` (see `ImageEncoder`)
+def imwrite_params(image_format, profile, bilevel=False):
+    if image_format == 'png':
+        params = []
+        # NOTE: a negative level keeps the default of OpenCV (fastest level
+        # with the run-length encoding strategy)
+        if profile["png_compression"] >= 0:
+            params += [cv2.IMWRITE_PNG_COMPRESSION,
+                       profile["png_compression"]]
+        if bilevel:
+            params += [cv2.IMWRITE_PNG_BILEVEL, 1]
+        return params
+    elif image_format in ['jpg', 'jpeg']:
+        return [cv2.IMWRITE_JPEG_QUALITY, profile["jpeg_quality"]]
+    elif image_format == 'webp':
+        # NOTE: a quality above 100 is lossless
+        return [cv2.IMWRITE_WEBP_QUALITY, profile["webp_quality"]]
+    elif image_format == 'pbm':
+        return [cv2.IMWRITE_PXM_BINARY, 1]
+    else:
+        raise ValueError("Image format ({}) is not supported".format(
+                         image_format))
+
+
+class ImageEncoder:
+    """File format and encoding parameters of each set of images.
+
+    `profiles` maps a set of images (see `PROFILE_SETS`) to its profile:
+    `format` ('' for `default_format`), `png_compression`, `jpeg_quality`,
+    `webp_quality` and, for the binary masks, `bilevel`. The profile of the
+    `adaptive` configuration gives the cheapest settings used while the
+    writing is saturated: each setting of a profile is lowered to it.
+    """
+
+    def __init__(self, profiles, default_format='png', adaptive=None):
+        self.adaptive = adaptive if adaptive and adaptive["enable"] else None
+        # (extension, parameters) of each set of images, with the normal
+        # effort and with the reduced effort
+        self._params = {}
+        self._fast_params = {}
+        for iname, profile in profiles.items():
+            image_format = profile["format"] or default_format
+            bilevel = iname in MASK_SETS and profile["bilevel"]
+            self._params[iname] = (
+                image_format, imwrite_params(image_format, profile, bilevel))
+            if self.adaptive:
+                fast_profile = {key: min(profile[key], self.adaptive[key])
+                                for key in ['png_compression', 'jpeg_quality',
+                                            'webp_quality']}
+                self._fast_params[iname] = (
+                    image_format,
+                    imwrite_params(image_format, fast_profile, bilevel))
+        self.saturated = False
+        # Number of times the effort was lowered
+        self.num_saturations = 0
+        self._write_ms = 0.0
+
+    # Return the file extension and the `cv2.imwrite()` parameters of the
+    # images of the set `iname`
+    def params(self, iname):
+        if self.saturated:
+            return self._fast_params[iname]
+        return self._params[iname]
+
+    # Lower or restore the encoder effort from the occupancy of the queue of
+    # the image writer (between 0 and 1, None if the images are written
+    # synchronously) and the time taken to write the images of the last frame
+    def update(self, occupancy=None, write_ms=None):
+        if not self.adaptive:
+            return
+        budget = self.adaptive["write_budget_ms"]
+        if write_ms is not None:
+            self._write_ms += WRITE_MS_ALPHA * (write_ms - self._write_ms)
+        occupancy = occupancy or 0.0
+        if not self.saturated:
+            if occupancy >= self.adaptive["high_occupancy"] or \
+                    (budget and self._write_ms > budget):
+                self.saturated = True
+                self.num_saturations += 1
+                logger.info("Image writing saturated (queue occupancy=%.2f, "
+                            "write time=%.1f ms): encoder effort lowered",
+                            occupancy, self._write_ms)
+        # NOTE: the effort is restored once the writing takes less than half
+        # its budget since the cheaper settings make it faster
+        elif occupancy <= self.adaptive["low_occupancy"] and \
+                (not budget or self._write_ms <= budget / 2):
+            self.saturated = False
+            logger.info("Image writing caught up: encoder effort restored")
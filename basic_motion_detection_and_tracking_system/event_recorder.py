@@ -0,0 +1,208 @@
+"""
+Event-based recording: save one video clip per motion event instead of every
+frame
+
+The recorder keeps the last `pre_roll` frames in memory. When motion starts, a
+clip is opened with these frames, and it is closed once there was no motion
+for `post_roll` frames. Each event is added to an index (CSV or JSON lines)
+with its frame numbers, timestamps and number of bounding boxes.
+
+An event can be split into several clips (segments), e.g. when a checkpoint is
+saved while it is being recorded (see `get_state()`). Each segment has its own
+row in the index, with the `event_id` and the start of the event, the frames
+of its clip, and the counts of the event up to the end of the segment: the
+last segment of an event has the totals of the event.
+"""
+import collections
+import csv
+import datetime
+import json
+import logging
+import os
+# Third-party modules
+import cv2
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+INDEX_FORMATS = ['csv', 'jsonl']
+INDEX_FIELDS = ['event_id', 'segment', 'clip', 'start_frame', 'end_frame',
+                'clip_start_frame', 'clip_end_frame', 'start_time',
+                'end_time', 'num_frames_with_motion', 'max_boxes',
+                'total_boxes']
+
+
+class EventRecorder:
+    # NOTE: if `state` (from `get_state()`) is given, the recorder continues
+    # the index of a previous run, which is first truncated to its size at the
+    # time of `state`. The event that was being recorded then (if any)
+    # continues in a new segment.
+    def __init__(self, folder, pre_roll=30, post_roll=60, fps=20,
+                 fourcc='mp4v', clip_format='mp4', index_format='csv',
+                 state=None):
+        if index_format not in INDEX_FORMATS:
+            raise ValueError("Index format ({}) is not supported. Choices are "
+                             "{}".format(index_format, INDEX_FORMATS))
+        self.folder = folder
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.clip_format = clip_format
+        self.index_format = index_format
+        # (frame_num, timestamp, frame) of the last frames without motion
+        self._pre_roll_frames = collections.deque(maxlen=max(pre_roll, 0))
+        self._writer = None
+        self._event = None
+        # Number of frames without motion since the last frame with motion
+        self._num_quiet_frames = 0
+        self.num_events = 0
+        index_path = os.path.join(folder, 'events.{}'.format(index_format))
+        if state:
+            self.num_events = state['num_events']
+            self._index_file = open(index_path, 'r+', newline='')
+            self._index_file.truncate(state['index_size'])
+            self._index_file.seek(0, os.SEEK_END)
+            self._event = state['event']
+            self._num_quiet_frames = state['num_quiet_frames']
+        else:
+            self._index_file = open(index_path, 'w', newline='')
+        if index_format == 'csv':
+            self._csv_writer = csv.DictWriter(self._index_file,
+                                              fieldnames=INDEX_FIELDS)
+            if not state:
+                self._csv_writer.writeheader()
+                self._index_file.flush()
+
+    # True while an event is in progress, even if the clip of its next segment
+    # isn't opened yet
+    @property
+    def recording(self):
+        return self._event is not None
+
+    # Add the frame (annotated security feed) to the recording. `occupied` is
+    # True if motion was detected on the frame.
+    def update(self, frame, frame_num, occupied, num_boxes=0):
+        timestamp = datetime.datetime.now()
+        if not self.recording:
+            if not occupied:
+                if self.pre_roll > 0:
+                    # NOTE: the frame is copied since the caller can reuse it
+                    self._pre_roll_frames.append(
+                        (frame_num, timestamp, frame.copy()))
+                return
+            self._start_event(frame, frame_num, timestamp)
+        elif self._writer is None:
+            # First frame of the next segment of the event
+            self._open_clip(frame, frame_num)
+        self._writer.write(frame)
+        event = self._event
+        event['clip_end_frame'] = frame_num
+        if occupied:
+            self._num_quiet_frames = 0
+            event['end_frame'] = frame_num
+            event['end_time'] = timestamp.isoformat()
+            event['num_frames_with_motion'] += 1
+            event['max_boxes'] = max(event['max_boxes'], num_boxes)
+            event['total_boxes'] += num_boxes
+        else:
+            self._num_quiet_frames += 1
+            if self._num_quiet_frames >= self.post_roll:
+                self._end_event()
+
+    # Return what is needed to continue the index later (e.g. from a
+    # checkpoint). The clip of the event being recorded (if any) is closed
+    # first, the event continues in a new segment from the next frame.
+    def get_state(self):
+        self.split_event()
+        self._index_file.flush()
+        return {'num_events': self.num_events,
+                'index_size': self._index_file.tell(),
+                'event': dict(self._event) if self._event else None,
+                'num_quiet_frames': self._num_quiet_frames}
+
+    # Close the clip of the event being recorded (if any) and add it to the
+    # index. The next frames of the event go to a new segment.
+    def split_event(self):
+        if self._writer is None:
+            return
+        self._close_clip()
+        self._event['segment'] += 1
+        self._event['clip'] = None
+
+    # End the event being recorded (if any), whatever the next frames are
+    def end_event(self):
+        if self.recording:
+            self._end_event()
+
+    # Close the current clip (if any) and the index
+    def close(self):
+        self.end_event()
+        if not self._index_file.closed:
+            self._index_file.close()
+
+    def _start_event(self, frame, frame_num, timestamp):
+        self.num_events += 1
+        self._num_quiet_frames = 0
+        self._event = {
+            'event_id': self.num_events,
+            'segment': 1,
+            'clip': None,
+            'start_frame': frame_num,
+            'end_frame': frame_num,
+            'clip_start_frame': frame_num,
+            'clip_end_frame': frame_num,
+            'start_time': timestamp.isoformat(),
+            'end_time': timestamp.isoformat(),
+            'num_frames_with_motion': 0,
+            'max_boxes': 0,
+            'total_boxes': 0
+        }
+        self._open_clip(frame, frame_num)
+        # Pre-roll: frames just before the motion started
+        height, width = frame.shape[:2]
+        for pre_frame_num, _, pre_frame in self._pre_roll_frames:
+            if pre_frame.shape[:2] == (height, width):
+                self._writer.write(pre_frame)
+                self._event['clip_start_frame'] = min(
+                    self._event['clip_start_frame'], pre_frame_num)
+        self._pre_roll_frames.clear()
+        logger.debug("Event #{} started at frame # {}".format(self.num_events,
+                                                              frame_num))
+
+    # Open the clip of the current segment of the event, starting at
+    # `frame_num`
+    def _open_clip(self, frame, frame_num):
+        clip_name = "event_{:06d}_frame_{:06d}.{}".format(
+            self._event['event_id'], frame_num, self.clip_format)
+        height, width = frame.shape[:2]
+        self._writer = cv2.VideoWriter(os.path.join(self.folder, clip_name),
+                                       self.fourcc, self.fps, (width, height))
+        if not self._writer.isOpened():
+            logger.warning("Clip {} couldn't be opened for writing".format(
+                           clip_name))
+        self._event['clip'] = clip_name
+        self._event['clip_start_frame'] = frame_num
+        self._event['clip_end_frame'] = frame_num
+
+    # Release the clip of the current segment and add the segment to the
+    # index
+    def _close_clip(self):
+        self._writer.release()
+        self._writer = None
+        event = self._event
+        if self.index_format == 'csv':
+            self._csv_writer.writerow(event)
+        else:
+            self._index_file.write(json.dumps(event) + '\n')
+        # The index is always up to date on disk, even if the program crashes
+        self._index_file.flush()
+
+    def _end_event(self):
+        # NOTE: a segment without any frame isn't added to the index
+        if self._writer is not None:
+            self._close_clip()
+        event = self._event
+        self._event = None
+        logger.debug("Event #{} ended at frame # {}".format(
+                     event['event_id'], event['clip_end_frame']))
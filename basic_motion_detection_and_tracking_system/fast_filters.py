@@ -0,0 +1,142 @@
+"""
+Faster approximations of the Gaussian blur and of the dilation of the
+processing loop
+
+The blur of each frame (`cv2.GaussianBlur()` with `gaussian_kernel_size`) can
+be replaced by:
+- `box`: `num_boxes` box blurs in a row (`cv2.blur()`, whose cost doesn't
+  depend on the size of the box). By the central limit theorem, 3 boxes are
+  already close to a Gaussian. The box sizes are chosen so that the variance
+  of the result is the variance of the Gaussian kernel.
+- `integral`: the same boxes, computed from the integral image of the frame
+- `pyramid`: the frame is reduced `pyramid_levels` times by 2, blurred with a
+  Gaussian kernel reduced accordingly, and enlarged back
+
+The dilation of the thresholded image (`cv2.dilate()` with a 3x3 square, twice)
+is equivalent to a single dilation with a 5x5 square.
+"""
+import math
+# Third-party modules
+import cv2
+import numpy as np
+
+BLUR_MODES = ['gaussian', 'box', 'integral', 'pyramid']
+
+
+# Return the standard deviation OpenCV uses for a Gaussian kernel of size
+# `ksize` when `sigma` is 0 (see `cv2.getGaussianKernel()`)
+def gaussian_sigma(ksize):
+    return 0.3 * ((ksize - 1) * 0.5 - 1) + 0.8
+
+
+# Return the sizes (odd) of `n` box filters whose successive application has
+# the variance of a Gaussian of standard deviation `sigma`
+# Ref.: W. Wells, "Efficient synthesis of Gaussian filters by cascaded uniform
+# filters", 1986
+def box_sizes(sigma, n=3):
+    ideal = math.sqrt(12 * sigma ** 2 / n + 1)
+    lower = int(ideal)
+    if lower % 2 == 0:
+        lower -= 1
+    lower = max(1, lower)
+    upper = lower + 2
+    # Number of boxes of size `lower`, the others being of size `upper`
+    m = round((12 * sigma ** 2 - n * lower ** 2 - 4 * n * lower - 3 * n) /
+              (-4 * lower - 4))
+    m = min(n, max(0, m))
+    return [lower] * m + [upper] * (n - m)
+
+
+# Box blur of `image` (uint8) with a box of `ksize` (width, height) computed
+# from its integral image. Same borders as `cv2.blur()` (reflected without
+# repeating the border pixel).
+def integral_blur(image, ksize, dst=None):
+    kw, kh = ksize
+    padded = cv2.copyMakeBorder(image, kh // 2, kh // 2, kw // 2, kw // 2,
+                                cv2.BORDER_REFLECT_101)
+    sums = cv2.integral(padded)
+    h, w = image.shape
+    box = sums[kh:kh + h, kw:kw + w] - sums[:h, kw:kw + w] - \
+        sums[kh:kh + h, :w] + sums[:h, :w]
+    area = kw * kh
+    if dst is None:
+        dst = np.empty_like(image)
+    # Rounded to the nearest integer like `cv2.blur()`
+    np.floor_divide(box + area // 2, area, out=box)
+    np.copyto(dst, box, casting='unsafe')
+    return dst
+
+
+# Dilate `thresh` like `cv2.dilate(thresh, None, iterations=iterations)`. With
+# `single_pass`, the dilation is done in one pass with a square of size
+# 2 x `iterations` + 1, which gives the same image.
+def dilate(thresh, iterations=2, single_pass=True, dst=None):
+    if not single_pass or iterations <= 1:
+        return cv2.dilate(thresh, None, iterations=iterations, dst=dst)
+    size = 2 * iterations + 1
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+    return cv2.dilate(thresh, kernel, dst=dst)
+
+
+class Blur:
+    """Blur of the grayscale frames with the Gaussian kernel `ksize` (width,
+    height), or one of its approximations (see the module docstring).
+
+    The intermediate images are reused from one frame to the next.
+    """
+
+    def __init__(self, ksize, mode='gaussian', num_boxes=3, pyramid_levels=1):
+        if mode not in BLUR_MODES:
+            raise ValueError("Unknown blur mode: {}".format(mode))
+        self.ksize = tuple(ksize)
+        self.mode = mode
+        self.num_boxes = num_boxes
+        self.pyramid_levels = pyramid_levels
+        sigmas = [gaussian_sigma(k) for k in self.ksize]
+        # Sizes (width, height) of the successive boxes
+        self.boxes = list(zip(box_sizes(sigmas[0], num_boxes),
+                              box_sizes(sigmas[1], num_boxes)))
+        # Standard deviations of the Gaussian at the reduced scale: the
+        # reduction (area average) and the enlargement (bilinear) blur the
+        # image too, by a box and a triangle of the size of the scale factor
+        f = 2 ** pyramid_levels
+        self.pyramid_sigmas = [
+            math.sqrt(max(0.25, (s ** 2 - (f ** 2 - 1) / 12 -
+                                 (f ** 2 - 1) / 6) / f ** 2))
+            for s in sigmas]
+        self._small = self._small_blurred = self._tmp = None
+
+    def apply(self, gray, dst=None):
+        if self.mode == 'gaussian':
+            return cv2.GaussianBlur(gray, self.ksize, 0, dst=dst)
+        if self.mode == 'pyramid':
+            return self._pyramid_blur(gray, dst)
+        blur = integral_blur if self.mode == 'integral' else \
+            lambda src, ksize, dst: cv2.blur(src, ksize, dst=dst)
+        # The boxes alternate between a temporary buffer and `dst` so that the
+        # last one is written into `dst`
+        tmp = self._buffer('_tmp', gray.shape)
+        for i, ksize in enumerate(self.boxes):
+            out = dst if (len(self.boxes) - 1 - i) % 2 == 0 else tmp
+            gray = blur(gray, ksize, dst=out)
+        return gray
+
+    def _pyramid_blur(self, gray, dst):
+        h, w = gray.shape
+        f = 2 ** self.pyramid_levels
+        size = (max(1, w // f), max(1, h // f))
+        small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA,
+                           dst=self._buffer('_small', size[::-1]))
+        small = cv2.GaussianBlur(small, (0, 0), self.pyramid_sigmas[0],
+                                 sigmaY=self.pyramid_sigmas[1],
+                                 dst=self._buffer('_small_blurred',
+                                                  size[::-1]))
+        return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR,
+                          dst=dst)
+
+    def _buffer(self, name, shape):
+        buffer = getattr(self, name)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, np.uint8)
+            setattr(self, name, buffer)
+        return buffer
@@ -0,0 +1,38 @@
+"""
+Buffers of the processing loop, allocated once per frame size
+
+The intermediate images of the loop (resized frame, grayscale and blurred
+images, thresholded and dilated images, ...) are written into the buffers of a
+`FrameBuffers` with OpenCV's `dst=` outputs, instead of being allocated again
+for every frame. A buffer is only allocated again if the size of the frames
+changes.
+"""
+# Third-party modules
+import cv2
+import numpy as np
+
+# Before OpenCV 3.2, `findContours()` modifies the image given to it, which must
+# then be a copy
+FIND_CONTOURS_MODIFIES_SOURCE = \
+    tuple(int(v) for v in cv2.__version__.split('.')[:2]) < (3, 2)
+
+
+class FrameBuffers:
+    def __init__(self):
+        self._buffers = {}
+        # Number of times a buffer was allocated
+        self.num_allocations = 0
+
+    # Return the buffer `name`, which is allocated if it doesn't exist yet or
+    # if its shape or type changed
+    def get(self, name, shape, dtype=np.uint8):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = self._buffers[name] = np.empty(shape, dtype)
+            self.num_allocations += 1
+        return buffer
+
+    # Total size of the buffers in bytes
+    @property
+    def nbytes(self):
+        return sum(b.nbytes for b in self._buffers.values())
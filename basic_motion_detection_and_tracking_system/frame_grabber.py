@@ -0,0 +1,166 @@
+import collections
+import logging
+import os
+import threading
+import time
+# Third-party modules
+import numpy as np
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+# What the producer does when every slot of the ring buffer is filled:
+# - 'latest': overwrite the oldest unread frame, and `read()` always returns the
+#   newest frame (for live sources like webcams)
+# - 'never_drop': wait until the consumer frees a slot (for video files and
+#   image sequences)
+GRABBER_MODES = ['latest', 'never_drop']
+
+
+class ThreadedFrameGrabber:
+    """Decode frames from a `cv2.VideoCapture` in a producer thread.
+
+    The frames are decoded into a fixed-size ring buffer of preallocated
+    arrays, and the processing loop reads them with `read()` exactly like it
+    would with the capture itself. The frame returned by `read()` belongs to
+    the ring buffer: it stays valid until the next call to `read()`.
+    """
+
+    def __init__(self, camera, buffer_size=8, mode='never_drop'):
+        if buffer_size < 2:
+            raise ValueError("buffer_size should be at least 2: "
+                             "{}".format(buffer_size))
+        if mode not in GRABBER_MODES:
+            raise ValueError("Frame grabber mode ({}) is not supported. "
+                             "Choices are {}".format(mode, GRABBER_MODES))
+        self.camera = camera
+        self.buffer_size = buffer_size
+        self.mode = mode
+        # The slots are allocated once the shape of the frames is known, i.e.
+        # after the first frame is decoded
+        self._slots = [None] * buffer_size
+        self._free = collections.deque(range(buffer_size))
+        self._filled = collections.deque()
+        # Slot of the frame currently used by the consumer
+        self._in_use = None
+        self._cond = threading.Condition()
+        self._finished = False
+        self._stopped = False
+        self._thread = None
+        self._start_time = None
+        self._num_decoded = 0
+        self._num_read = 0
+        self._num_dropped = 0
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._produce,
+                                        name="frame-grabber",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    # Same interface as `cv2.VideoCapture.read()`: return (grabbed, frame)
+    # where `grabbed` is False once the end of the stream is reached
+    def read(self):
+        with self._cond:
+            if self._in_use is not None:
+                self._free.append(self._in_use)
+                self._in_use = None
+                self._cond.notify_all()
+            while not self._filled and not self._finished \
+                    and not self._stopped:
+                self._cond.wait()
+            if not self._filled:
+                return False, None
+            if self.mode == 'latest':
+                # Skip the frames that are already stale
+                while len(self._filled) > 1:
+                    self._free.append(self._filled.popleft())
+                    self._num_dropped += 1
+                self._cond.notify_all()
+            self._in_use = self._filled.popleft()
+            self._num_read += 1
+            return True, self._slots[self._in_use]
+
+    # Wait up to `timeout` seconds for a frame to be decoded. Return True if
+    # `read()` can be called without blocking, i.e. a frame is ready or the
+    # stream has ended.
+    def wait_frame(self, timeout=0):
+        with self._cond:
+            return bool(self._cond.wait_for(
+                lambda: self._filled or self._finished or self._stopped,
+                timeout))
+
+    # Stop the producer thread and release the underlying capture
+    def release(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        # A live source can block the producer while it waits to reconnect
+        # (see `sources.ReconnectingSource`)
+        if hasattr(self.camera, 'interrupt'):
+            self.camera.interrupt()
+        if self._thread:
+            self._thread.join()
+        self.camera.release()
+
+    def stats(self):
+        with self._cond:
+            elapsed = time.perf_counter() - self._start_time \
+                if self._start_time else 0
+            return {
+                'decode_fps': self._num_decoded / elapsed if elapsed else 0.0,
+                'processing_fps': self._num_read / elapsed if elapsed else 0.0,
+                'occupancy': len(self._filled) / self.buffer_size,
+                'decoded': self._num_decoded,
+                'read': self._num_read,
+                'dropped': self._num_dropped
+            }
+
+    # Take a slot to decode the next frame into. Return None if the grabber is
+    # stopped.
+    def _acquire_slot(self):
+        with self._cond:
+            while not self._free and not self._stopped:
+                if self.mode == 'latest' and self._filled:
+                    # Overwrite the oldest frame not yet read
+                    self._num_dropped += 1
+                    return self._filled.popleft()
+                self._cond.wait()
+            if self._stopped:
+                return None
+            return self._free.popleft()
+
+    def _produce(self):
+        while True:
+            idx = self._acquire_slot()
+            if idx is None:
+                break
+            slot = self._slots[idx]
+            if slot is None:
+                grabbed, frame = self.camera.read()
+            else:
+                # Decode directly into the preallocated array
+                grabbed, frame = self.camera.read(image=slot)
+            if grabbed and slot is None:
+                # First frame: now that its shape is known, allocate all the
+                # slots of the ring buffer
+                self._slots = [np.empty_like(frame)
+                               for _ in range(self.buffer_size)]
+                np.copyto(self._slots[idx], frame)
+            elif grabbed and frame is not slot:
+                # The capture couldn't decode into the slot, e.g. the shape of
+                # the frames changed
+                self._slots[idx] = frame
+            with self._cond:
+                if not grabbed:
+                    self._free.append(idx)
+                    self._finished = True
+                    self._cond.notify_all()
+                    break
+                self._filled.append(idx)
+                self._num_decoded += 1
+                self._cond.notify_all()
+        logger.debug("Frame grabber stopped after decoding %s frames",
+                     self._num_decoded)
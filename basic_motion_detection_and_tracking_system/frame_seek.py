@@ -0,0 +1,103 @@
+"""
+Seek a video source to a given frame before processing starts
+
+Strategies:
+- 'pos_frames': set `cv2.CAP_PROP_POS_FRAMES` (video files)
+- 'index': move the image sequence to the file found by indexing the sorted
+  list of images (image directories)
+- 'grab': fast-forward with `grab()`, i.e. without retrieving the frames (any
+  source, including webcams)
+"""
+import logging
+import os
+# Third-party modules
+import cv2
+# Own modules
+from image_sequence import ImageSequenceSource, list_image_sequence
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+SEEK_STRATEGIES = ['auto', 'pos_frames', 'index', 'grab']
+
+
+# Return the strategies to try, in order, for the given source
+def resolve_strategies(strategy, video_filepath, image_dirpath):
+    if strategy == 'auto':
+        if video_filepath:
+            return ['pos_frames', 'grab']
+        elif image_dirpath:
+            return ['index', 'grab']
+        else:
+            return ['grab']
+    elif strategy == 'grab':
+        return ['grab']
+    else:
+        # The fast-forward always works as a last resort
+        return [strategy, 'grab']
+
+
+def seek_pos_frames(camera, index):
+    if not camera.set(cv2.CAP_PROP_POS_FRAMES, index):
+        return False
+    # Some backends accept the property but can't seek accurately
+    return int(camera.get(cv2.CAP_PROP_POS_FRAMES)) == index
+
+
+# Return a capture opened at the image `index` of the sequence, or None if the
+# sequence doesn't have this many images
+def seek_index(image_dirpath, index):
+    images = list_image_sequence(image_dirpath)
+    if index >= len(images):
+        return None
+    # NOTE: when given a filename instead of a pattern, `cv2.CAP_IMAGES`
+    # extracts the pattern and the start number from it
+    camera = cv2.VideoCapture(images[index], cv2.CAP_IMAGES)
+    return camera if camera.isOpened() else None
+
+
+# Skip `num_frames` frames without decoding them into images. Return the number
+# of frames actually skipped.
+def seek_grab(camera, num_frames):
+    for i in range(num_frames):
+        if not camera.grab():
+            return i
+    return num_frames
+
+
+# Move `camera` so that the next frame read is the frame `index` (0-based).
+# Return the camera to use from now on (it can be a new capture) and the
+# strategy that succeeded. `reopen` is called to get a fresh capture if a
+# strategy failed after moving the position of `camera`.
+def seek(camera, index, strategy='auto', video_filepath=None,
+         image_dirpath=None, reopen=None):
+    if index <= 0:
+        return camera, None
+    for s in resolve_strategies(strategy, video_filepath, image_dirpath):
+        if s == 'pos_frames':
+            if seek_pos_frames(camera, index):
+                return camera, s
+            logger.warning("Could not seek with CAP_PROP_POS_FRAMES")
+            if reopen:
+                camera.release()
+                camera = reopen()
+        elif s == 'index':
+            if isinstance(camera, ImageSequenceSource):
+                if seek_pos_frames(camera, index):
+                    return camera, s
+            elif image_dirpath:
+                new_camera = seek_index(image_dirpath, index)
+                if new_camera is not None:
+                    camera.release()
+                    return new_camera, s
+            logger.warning("Could not seek by indexing the image sequence")
+        elif s == 'grab':
+            skipped = seek_grab(camera, index)
+            if skipped < index:
+                logger.warning("The source ended after {} frames, before "
+                               "frame {}".format(skipped, index + 1))
+            return camera, s
+        else:
+            raise ValueError("Seek strategy ({}) is not supported. Choices "
+                             "are {}".format(s, SEEK_STRATEGIES))
+    return camera, None
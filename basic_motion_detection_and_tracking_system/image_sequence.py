@@ -0,0 +1,297 @@
+"""
+Source of the frames of an image sequence (a folder of images)
+
+The images of `image_dirpath` are listed once into an index, sorted in natural
+order (`img2.jpg` before `img10.jpg`), which can be saved in a cache folder and
+reused as long as the folders of the images are not modified. `image_dirpath`
+can be:
+- a path with a printf-style number, e.g. `images/in%06d.jpg`
+- a folder: all its images are used, whatever their names
+- a glob pattern, e.g. `images/*/frame_*.png`
+
+The images are decoded ahead by a pool of threads (OpenCV releases the GIL
+while decoding). The decoded frames, resized to the display width, can also be
+kept in a disk cache so that the next runs over the same images don't decode
+them again.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+# Third-party modules
+import cv2
+from imutils import resize
+import numpy as np
+# Own modules
+from utilities.utils import PER_FRAME
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+IMAGE_EXTENSIONS = ['.bmp', '.jpeg', '.jpg', '.png', '.tif', '.tiff', '.webp']
+
+
+# Key for sorting names in natural order: the numbers are compared as numbers
+def natural_key(name):
+    return [int(part) if part.isdigit() else part.lower()
+            for part in re.split(r'(\d+)', name)]
+
+
+# Return the sorted list of images matching `pattern`, a path whose filename
+# has a printf-style number, e.g. 'images/in%06d.jpg'
+def list_image_sequence(pattern):
+    dirpath, basename = os.path.split(pattern)
+    match = re.search(r'%0?\d*d', basename)
+    if not match:
+        raise ValueError("The filename of the image sequence ({}) has no "
+                         "printf-style number, e.g. %06d".format(pattern))
+    regex = re.compile('^{}(\\d+){}$'.format(
+        re.escape(basename[:match.start()]),
+        re.escape(basename[match.end():])))
+    images = []
+    with os.scandir(dirpath or '.') as it:
+        for entry in it:
+            m = regex.match(entry.name)
+            if m:
+                images.append((int(m.group(1)), entry.path))
+    images.sort()
+    return [path for _, path in images]
+
+
+# Return the sorted list of the images of `image_dirpath` (printf-style
+# pattern, folder or glob pattern)
+def list_images(image_dirpath):
+    if re.search(r'%0?\d*d', os.path.basename(image_dirpath)):
+        return list_image_sequence(image_dirpath)
+    if os.path.isdir(image_dirpath):
+        paths = [entry.path for entry in os.scandir(image_dirpath)
+                 if entry.is_file()]
+    else:
+        paths = glob.glob(image_dirpath)
+    paths = [p for p in paths
+             if os.path.splitext(p)[1].lower() in IMAGE_EXTENSIONS]
+    return sorted(paths, key=natural_key)
+
+
+# Return the modification times of the folders whose content the list of
+# images depends on
+def _folder_mtimes(image_dirpath, paths):
+    folders = {os.path.dirname(p) for p in paths}
+    folders.add(image_dirpath if os.path.isdir(image_dirpath)
+                else os.path.dirname(image_dirpath))
+    return {f: os.stat(f or '.').st_mtime_ns for f in sorted(folders)
+            if os.path.isdir(f or '.')}
+
+
+# Return the list of the images of `image_dirpath`. If `cache_dirpath` is given,
+# the list is saved there and reused by the next calls as long as the folders
+# of the images are not modified (images added, removed or renamed).
+# NOTE: with a glob pattern, new folders matching the pattern are not detected
+def load_index(image_dirpath, cache_dirpath=''):
+    index_path = None
+    if cache_dirpath:
+        name = hashlib.sha1(
+            os.path.abspath(image_dirpath).encode()).hexdigest()[:16]
+        index_path = os.path.join(cache_dirpath, 'index_{}.json'.format(name))
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            if index['image_dirpath'] == image_dirpath and \
+                    index['folders'] == _folder_mtimes(image_dirpath,
+                                                       index['paths']):
+                logger.info("Using the cached list of the {} images".format(
+                            len(index['paths'])))
+                return index['paths']
+    paths = list_images(image_dirpath)
+    if not paths:
+        logger.warning("No images found in {}".format(image_dirpath))
+    elif index_path:
+        os.makedirs(cache_dirpath, exist_ok=True)
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'image_dirpath': image_dirpath,
+                       'folders': _folder_mtimes(image_dirpath, paths),
+                       'paths': paths}, f)
+        os.replace(tmp_path, index_path)
+    return paths
+
+
+class FrameDiskCache:
+    """Decoded frames saved as `.npy` files in `folder`, at most `max_bytes`.
+
+    A frame is identified by the path, size and modification time of its
+    image and by the width it was resized to. When the cache is full, the
+    frames used the least recently are removed (their files are touched each
+    time they are read).
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        # Size of each cached frame, from the least to the most recently used
+        self._sizes = collections.OrderedDict()
+        entries = [e for e in os.scandir(folder) if e.name.endswith('.npy')]
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime_ns):
+            self._sizes[entry.name[:-4]] = entry.stat().st_size
+        self.nbytes = sum(self._sizes.values())
+        self.num_hits = 0
+        self.num_misses = 0
+
+    @staticmethod
+    def key(path, resize_width):
+        stat = os.stat(path)
+        return hashlib.sha1("{}|{}|{}|{}".format(
+            os.path.abspath(path), stat.st_size, stat.st_mtime_ns,
+            resize_width).encode()).hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.folder, key + '.npy')
+        with self._lock:
+            if key not in self._sizes:
+                self.num_misses += 1
+                return None
+            self._sizes.move_to_end(key)
+            self.num_hits += 1
+        try:
+            frame = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            # Removed by another process, or incomplete
+            return None
+        return frame
+
+    def put(self, key, frame):
+        path = os.path.join(self.folder, key + '.npy')
+        tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            np.save(f, frame)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.nbytes += os.path.getsize(path) - self._sizes.pop(key, 0)
+            self._sizes[key] = os.path.getsize(path)
+            while self.nbytes > self.max_bytes and len(self._sizes) > 1:
+                old_key, size = self._sizes.popitem(last=False)
+                self.nbytes -= size
+                try:
+                    os.remove(os.path.join(self.folder, old_key + '.npy'))
+                except FileNotFoundError:
+                    pass
+
+
+class ImageSequenceSource:
+    """Read the images of `paths` in order, decoded ahead by `num_workers`
+    threads (at most `prefetch` images ahead).
+
+    Same interface as `cv2.VideoCapture` (`read()`, `grab()`, `get()`, `set()`
+    with `cv2.CAP_PROP_POS_FRAMES`, `release()`). If `resize_width` isn't 0,
+    the frames are resized to this width like in the pipeline. If
+    `frame_cache` (`FrameDiskCache`) is given, the frames are read from it
+    instead of being decoded when possible. Images that can't be decoded are
+    skipped.
+    """
+
+    def __init__(self, paths, num_workers=4, prefetch=16, resize_width=0,
+                 frame_cache=None):
+        self.paths = list(paths)
+        self.prefetch = max(1, prefetch)
+        self.resize_width = resize_width
+        self.frame_cache = frame_cache
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="image-decoder")
+        # Frames being decoded, in order
+        self._pending = collections.deque()
+        # Index of the next image returned, and of the next image to decode
+        self._next = 0
+        self._scheduled = 0
+        self.num_skipped = 0
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    # NOTE: if `image` is given and has the shape of the frame, the frame is
+    # copied into it like with `cv2.VideoCapture.read()`
+    def read(self, image=None):
+        while self._next < len(self.paths):
+            self._schedule()
+            future = self._pending.popleft()
+            self._next += 1
+            self._schedule()
+            frame = future.result()
+            if frame is not None:
+                if image is not None and image.shape == frame.shape:
+                    np.copyto(image, frame)
+                    return True, image
+                return True, frame
+            logger.warning("Image %s couldn't be read, it is skipped",
+                           self.paths[self._next - 1], extra=PER_FRAME)
+            self.num_skipped += 1
+        return False, None
+
+    # Skip the next image without decoding it
+    def grab(self):
+        if self._next >= len(self.paths):
+            return False
+        if self._pending:
+            self._pending.popleft().cancel()
+        else:
+            self._scheduled += 1
+        self._next += 1
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._next)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.paths))
+        return 0.0
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES or \
+                not 0 <= value <= len(self.paths):
+            return False
+        self._cancel()
+        self._next = self._scheduled = int(value)
+        return True
+
+    def release(self):
+        self._cancel()
+        self._executor.shutdown(wait=True)
+
+    def _schedule(self):
+        while self._scheduled < len(self.paths) and \
+                len(self._pending) < self.prefetch:
+            self._pending.append(self._executor.submit(self._load,
+                                                       self._scheduled))
+            self._scheduled += 1
+
+    def _cancel(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+
+    def _load(self, index):
+        path = self.paths[index]
+        key = None
+        if self.frame_cache:
+            try:
+                key = self.frame_cache.key(path, self.resize_width)
+            except OSError:
+                return None
+            frame = self.frame_cache.get(key)
+            if frame is not None:
+                return frame
+        frame = cv2.imread(path, cv2.IMREAD_COLOR)
+        if frame is None:
+            return None
+        if self.resize_width:
+            frame = resize(frame, width=self.resize_width)
+        if key:
+            self.frame_cache.put(key, frame)
+        return frame
@@ -0,0 +1,291 @@
+"""
+Process the motion detection jobs submitted to a spool directory with a pool of
+warm worker processes
+
+Running `run_system.py` for each short clip pays every time for importing
+OpenCV and for its first calls. The daemon keeps worker processes with
+everything imported and warmed up, and runs the pipeline on each job dropped
+in the spool directory.
+
+A job is a JSON file with the options that override the base configuration,
+e.g. {"video_filepath": "clip.mp4", "min_area": 1000}. The spool directory has
+one folder per state of the jobs:
+- `incoming/`: jobs submitted (see `submit_job()`), processed in the order of
+  submission
+- `running/`: jobs being processed
+- `done/` and `failed/`: jobs processed, each with a `<job>.result.json` file
+  giving its output folder and the stats of its run (or its error)
+"""
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import json
+import logging
+import os
+import pathlib
+import signal
+import time
+import uuid
+# Third-party modules
+import cv2
+import numpy as np
+# Own modules
+from background_models.registry import available_models
+from pipeline import MotionDetectionPipeline, merge_conf
+from utilities.utils import available_cores, load_json, setup_logging, \
+    stop_logging, timestamped, unique_foldername
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+JOB_FOLDERS = ['incoming', 'running', 'done', 'failed']
+
+# True once the worker process is warmed up
+_warmed_up = False
+
+
+class JobError(Exception):
+    """Raised when the video source of a job gave no frame"""
+
+
+# Write the job `job` (options overriding the base configuration) in the spool
+# directory and return its path. The file is renamed once complete so that the
+# daemon never reads a partial job.
+def submit_job(spool_dirpath, job, name=None):
+    name = name or timestamped(uuid.uuid4().hex[:8])
+    incoming = os.path.join(spool_dirpath, 'incoming')
+    pathlib.Path(incoming).mkdir(parents=True, exist_ok=True)
+    job_path = os.path.join(incoming, name + '.json')
+    tmp_path = os.path.join(incoming, '.' + name + '.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f, indent=2)
+    os.replace(tmp_path, job_path)
+    return job_path
+
+
+# Prepare the worker process: run the first calls of OpenCV (thread pool,
+# codecs) and load the background models before any job arrives
+# NOTE: called by the first task of each worker, since the `initializer` of
+# `ProcessPoolExecutor` is new in Python 3.7
+def _warm_up_worker():
+    global _warmed_up
+    if _warmed_up:
+        return
+    _warmed_up = True
+    # NOTE: Ctrl-C is handled by the daemon, which lets the jobs finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # NOTE: the threads writing the log records queued by the daemon are not
+    # copied in the worker processes, their loggers write directly instead
+    stop_logging()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    available_models()
+    frame = np.zeros((120, 160, 3), np.uint8)
+    gray = cv2.cvtColor(cv2.resize(frame, (80, 60)), cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (21, 21), 0)
+    cv2.findContours(cv2.threshold(gray, 25, 255, cv2.THRESH_BINARY)[1],
+                     cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cv2.imencode('.png', frame)
+    cv2.imencode('.jpg', frame)
+
+
+# Warm up the worker process and return its PID
+def _ready():
+    _warm_up_worker()
+    return os.getpid()
+
+
+# Entry point of a job in a worker process: run the pipeline on the base
+# configuration updated with the job. `submit_time` is the time the job was
+# submitted (`time.time()`).
+def _run_job(job_path, base_conf, submit_time):
+    start_time = time.perf_counter()
+    # NOTE: a worker can miss the tasks run by `JobDaemon._start_workers()`
+    _warm_up_worker()
+    wait_time = max(0.0, time.time() - submit_time)
+    name = os.path.splitext(os.path.basename(job_path))[0]
+    conf = merge_conf(base_conf, load_json(job_path))
+    # NOTE 1: the daemon has no display
+    # NOTE 2: the jobs run at the same time would all listen on the same
+    # ports, the metrics and the live preview are not served
+    conf["show_video"] = False
+    conf["metrics"]["http_port"] = 0
+    conf["preview"]["enable"] = False
+    pipeline = MotionDetectionPipeline(conf, name=name, start_time=start_time)
+    saved_folder = None
+    if conf["reports_dirpath"]:
+        saved_folder = unique_foldername(os.path.join(
+            conf["reports_dirpath"], timestamped(name)))
+    pipeline.create_saved_folder(saved_folder)
+    try:
+        # Each job writes its own log file in its folder
+        if not conf["disable_logging"]:
+            setup_logging(conf["logging_conf_path"], conf["saved_folder"],
+                          use_queue=conf["async_logging"])
+        try:
+            pipeline.validate_conf()
+            pipeline.setup()
+            pipeline.run()
+        finally:
+            # Release what was set up (camera, image writer, ...) even if the
+            # setup failed
+            pipeline.close()
+    finally:
+        # NOTE: the worker processes exit without running the `atexit`
+        # functions, the queued log records must be written now
+        stop_logging()
+    stats = pipeline.stats()
+    # NOTE: a source that can't be opened (e.g. missing file) ends like an
+    # empty video
+    if not stats['frames_read']:
+        raise JobError("No frame could be read from the video source, it "
+                       "couldn't be opened or it is empty")
+    stats['saved_folder'] = conf["saved_folder"]
+    stats['wait_time'] = wait_time
+    return stats
+
+
+class JobDaemon:
+    """Run the jobs of a spool directory until it is stopped.
+
+    Each worker process runs one job at a time: a job is only moved to
+    `running/` once a worker is free, so `incoming/` is the queue of the jobs
+    waiting. Setting `num_workers` to 0 sizes the pool to the number of
+    available cores. The jobs left in `running/` by a daemon that was killed
+    are submitted again.
+    """
+
+    def __init__(self, conf, spool_dirpath, num_workers=0, poll_interval=0.2):
+        self.conf = conf
+        self.spool_dirpath = spool_dirpath
+        self.num_workers = num_workers if num_workers > 0 \
+            else available_cores()
+        self.poll_interval = poll_interval
+        self.folders = {state: os.path.join(spool_dirpath, state)
+                        for state in JOB_FOLDERS}
+        self.num_done = 0
+        self.num_failed = 0
+        self._executor = None
+        # Future of each running job -> (name, path in `running/`, pool)
+        self._running = {}
+        self._stopping = False
+
+    # Finish the running jobs, then return from `run()`. Can be called from a
+    # signal handler.
+    def stop(self):
+        self._stopping = True
+
+    def run(self):
+        for folder in self.folders.values():
+            pathlib.Path(folder).mkdir(parents=True, exist_ok=True)
+        for fname in sorted(os.listdir(self.folders['running'])):
+            logger.warning("Job {} was interrupted, it is submitted "
+                           "again".format(fname))
+            os.replace(os.path.join(self.folders['running'], fname),
+                       os.path.join(self.folders['incoming'], fname))
+        self._start_workers()
+        logger.info("Waiting for jobs in {}".format(self.folders['incoming']))
+        try:
+            while not self._stopping:
+                self._submit_jobs()
+                if self._running:
+                    done, _ = concurrent.futures.wait(
+                        self._running, timeout=self.poll_interval,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        self._finish_job(future)
+                else:
+                    time.sleep(self.poll_interval)
+            logger.info("Stopping: waiting for {} running jobs".format(
+                        len(self._running)))
+            for future in list(self._running):
+                concurrent.futures.wait([future])
+                self._finish_job(future)
+        finally:
+            self._executor.shutdown(wait=True)
+        logger.info("Jobs done: {}, failed: {}".format(self.num_done,
+                                                       self.num_failed))
+
+    # Start the worker processes and wait until they are all warmed up
+    def _start_workers(self):
+        t = time.perf_counter()
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.num_workers)
+        # NOTE: one task per worker. A worker warming up doesn't take another
+        # task, so each of them usually gets one.
+        futures = [self._executor.submit(_ready)
+                   for _ in range(self.num_workers)]
+        pids = {future.result() for future in futures}
+        logger.info("{} worker processes ready in {:.2f} s".format(
+                    len(pids), time.perf_counter() - t))
+
+    # Submit the oldest incoming jobs to the free workers
+    def _submit_jobs(self):
+        num_free = self.num_workers - len(self._running)
+        if num_free <= 0:
+            return
+        jobs = []
+        with os.scandir(self.folders['incoming']) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json') and \
+                        not entry.name.startswith('.'):
+                    jobs.append((entry.stat().st_mtime, entry.name))
+        for submit_time, fname in sorted(jobs)[:num_free]:
+            running_path = os.path.join(self.folders['running'], fname)
+            os.replace(os.path.join(self.folders['incoming'], fname),
+                       running_path)
+            name = os.path.splitext(fname)[0]
+            logger.info("Job {} started".format(name))
+            try:
+                future = self._executor.submit(_run_job, running_path,
+                                               self.conf, submit_time)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed): the pool can't be used anymore
+                logger.error("The worker processes stopped, they are started "
+                             "again")
+                os.replace(running_path,
+                           os.path.join(self.folders['incoming'], fname))
+                self._restart_workers()
+                return
+            self._running[future] = (name, running_path, self._executor)
+
+    # Move the job of `future` to `done/` or `failed/` with its result
+    def _finish_job(self, future):
+        name, running_path, executor = self._running.pop(future)
+        try:
+            stats = future.result()
+        except BrokenProcessPool as e:
+            result = {'error': "The worker process stopped: {}".format(e)}
+            # NOTE: all the jobs of the broken pool fail, it is replaced once
+            if executor is self._executor:
+                logger.error("The worker processes stopped, they are started "
+                             "again")
+                self._restart_workers()
+        except Exception as e:
+            result = {'error': "{}: {}".format(type(e).__name__, e)}
+        else:
+            result = stats
+        state = 'failed' if 'error' in result else 'done'
+        if state == 'done':
+            self.num_done += 1
+            logger.info("Job {} done: {} frames in {:.1f} s, first frame "
+                        "after {:.1f} ms (waited {:.1f} ms)".format(
+                         name, stats['frames_processed'], stats['elapsed'],
+                         (stats['startup_time'] or 0.0) * 1000,
+                         stats['wait_time'] * 1000))
+        else:
+            self.num_failed += 1
+            logger.error("Job {} failed: {}".format(name, result['error']))
+        # NOTE: the result is renamed once complete, like the jobs
+        result_path = os.path.join(self.folders[state], name + '.result.json')
+        tmp_path = os.path.join(self.folders[state],
+                                '.' + name + '.result.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f, indent=2)
+        os.replace(tmp_path, result_path)
+        os.replace(running_path, os.path.join(self.folders[state],
+                                              name + '.json'))
+
+    # Replace a broken pool. The jobs still running in it fail.
+    def _restart_workers(self):
+        self._executor.shutdown(wait=False)
+        self._start_workers()
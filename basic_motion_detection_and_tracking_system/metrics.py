@@ -0,0 +1,197 @@
+"""
+Per-stage latency metrics of the processing loop
+
+Each stage of the loop (read, resize, blur, ...) records its duration in a
+rolling window from which the percentiles (p50/p95/p99) are computed. The
+metrics of all the pipelines of a process can be served in the Prometheus text
+format by a local HTTP server, and a summary line can be logged periodically.
+"""
+import logging
+import os
+import threading
+import time
+# Third-party modules
+import numpy as np
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+# Stages of the processing loop, in order
+STAGES = ['read', 'motion_gate', 'resize', 'cvtColor', 'blur', 'roi_preprocess',
+          'get_frame_delta', 'threshold', 'dilate', 'findContours', 'components',
+          'merge', 'drawing', 'tracking', 'events', 'writing', 'preview',
+          'display']
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+class LatencyHistogram:
+    """Rolling window of the last `window` durations (in seconds) of a stage.
+
+    The durations are stored in a preallocated ring buffer, so recording one
+    is only a NumPy item assignment. The totals are kept since the start.
+    """
+
+    def __init__(self, window=1000):
+        self._samples = np.zeros(window)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, duration):
+        self._samples[self.count % len(self._samples)] = duration
+        self.count += 1
+        self.total += duration
+
+    # Return the durations in the window
+    def samples(self):
+        return self._samples[:min(self.count, len(self._samples))].copy()
+
+    def quantiles(self, quantiles=QUANTILES):
+        samples = self.samples()
+        if not len(samples):
+            return [0.0] * len(quantiles)
+        return np.quantile(samples, quantiles).tolist()
+
+
+class PipelineMetrics:
+    # NOTE: if `frame_durations` is True, the durations of the current frame
+    # are also kept (see `pop_frame_durations()`)
+    def __init__(self, window=1000, frame_durations=False):
+        self.window = window
+        self.histograms = {}
+        self.num_frames = 0
+        self.start_time = time.perf_counter()
+        self.frame_durations = {} if frame_durations else None
+
+    # Record the duration of `stage` that started at `start` (a
+    # `time.perf_counter()` value). Return the current time, which can be used
+    # as the start of the next stage.
+    def record(self, stage, start):
+        now = time.perf_counter()
+        self.record_duration(stage, now - start)
+        return now
+
+    def record_duration(self, stage, duration):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram(self.window)
+        histogram.record(duration)
+        if self.frame_durations is not None:
+            self.frame_durations[stage] = \
+                self.frame_durations.get(stage, 0.0) + duration
+
+    def frame_processed(self):
+        self.num_frames += 1
+
+    # Return the durations (in seconds) of the stages recorded since the last
+    # call, e.g. for the current frame, or None if they are not kept
+    # NOTE: with batches, the stages run once per batch (read, preprocessing)
+    # are counted in the first frame of the batch
+    def pop_frame_durations(self):
+        durations = self.frame_durations
+        if durations is not None:
+            self.frame_durations = {}
+        return durations
+
+    # Return the stages recorded so far, in the order of the loop
+    def stages(self):
+        known = [s for s in STAGES if s in self.histograms]
+        return known + sorted(set(self.histograms) - set(STAGES))
+
+    # Return a one-line summary of the latencies in milliseconds
+    def summary(self):
+        elapsed = time.perf_counter() - self.start_time
+        fps = self.num_frames / elapsed if elapsed else 0.0
+        parts = []
+        for stage in self.stages():
+            p50, p95, p99 = self.histograms[stage].quantiles()
+            parts.append("{} {:.2f}/{:.2f}/{:.2f}".format(
+                stage, p50 * 1000, p95 * 1000, p99 * 1000))
+        return "{:.1f} FPS, stage latencies in ms (p50/p95/p99): {}".format(
+            fps, ", ".join(parts))
+
+    # Return the metrics in the Prometheus text format, with the label
+    # `stream`
+    def prometheus_lines(self, stream):
+        lines = []
+        for stage in self.stages():
+            histogram = self.histograms[stage]
+            labels = 'stream="{}",stage="{}"'.format(stream, stage)
+            for q, value in zip(QUANTILES, histogram.quantiles()):
+                lines.append('motion_stage_latency_seconds{{{},quantile="{}"}} '
+                             '{:.9f}'.format(labels, q, value))
+            lines.append('motion_stage_latency_seconds_sum{{{}}} {:.9f}'.format(
+                labels, histogram.total))
+            lines.append('motion_stage_latency_seconds_count{{{}}} {}'.format(
+                labels, histogram.count))
+        lines.append('motion_frames_processed_total{{stream="{}"}} {}'.format(
+            stream, self.num_frames))
+        return lines
+
+
+class MetricsServer:
+    """Local HTTP server exposing the metrics of several pipelines on
+    `/metrics` in the Prometheus text format."""
+
+    def __init__(self, host='127.0.0.1', port=9100):
+        self.host = host
+        self.port = port
+        self._metrics = {}
+        self._server = None
+        self._thread = None
+
+    def add(self, stream, metrics):
+        self._metrics[stream] = metrics
+
+    def render(self):
+        lines = [
+            '# HELP motion_stage_latency_seconds Latency of each stage of '
+            'the processing loop',
+            '# TYPE motion_stage_latency_seconds summary',
+        ]
+        frame_lines = [
+            '# HELP motion_frames_processed_total Number of frames processed',
+            '# TYPE motion_frames_processed_total counter'
+        ]
+        for stream, metrics in list(self._metrics.items()):
+            stream_lines = metrics.prometheus_lines(stream)
+            lines.extend(stream_lines[:-1])
+            frame_lines.append(stream_lines[-1])
+        return "\n".join(lines + frame_lines) + "\n"
+
+    def start(self):
+        # NOTE: imported here since it is slow to import and only needed
+        # when the server is used
+        from http.server import BaseHTTPRequestHandler
+        from utilities.http_server import ThreadingHTTPServer
+        metrics_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics_server.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # No log line per scrape
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="metrics-server", daemon=True)
+        self._thread.start()
+        logger.info("Metrics served on http://{}:{}/metrics".format(
+                    self.host, self._server.server_address[1]))
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,92 @@
+"""
+Motion gate: decide which frames go through the full motion detection
+
+Each frame is first reduced to a tiny grayscale image (e.g. 64 pixels wide),
+and its mean absolute difference (MAD) with a running average of the previous
+tiny images is computed, which costs a few microseconds. The full pipeline
+(blur, frame delta, threshold, contours) runs on every frame while the scene
+is occupied and for `hold_frames` frames after, and on any frame whose MAD is
+above `threshold` (motion onset). Otherwise the scene is idle and only one
+frame out of `idle_stride` is fully processed.
+"""
+# Third-party modules
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    def __init__(self, width=64, threshold=2.0, idle_stride=5, hold_frames=30,
+                 alpha=0.1):
+        if width <= 0 or idle_stride < 1 or hold_frames < 0 or \
+                not 0 < alpha <= 1:
+            raise ValueError("width should be positive, idle_stride at least "
+                             "1, hold_frames positive or 0, and alpha in "
+                             "(0, 1]")
+        self.width = width
+        self.threshold = threshold
+        self.idle_stride = idle_stride
+        self.hold_frames = hold_frames
+        self.alpha = alpha
+        # Running average of the tiny images
+        self._reference = None
+        self._tiny = None
+        self._diff = None
+        # Number of frames still processed at full rate since the scene was
+        # last occupied
+        self._hold = 0
+        # Number of frames since the last fully processed frame
+        self._since_processed = 0
+        self.mad = 0.0
+        self.num_frames = 0
+        self.num_processed = 0
+        self.num_onsets = 0
+
+    # Number of frames that were not fully processed
+    @property
+    def num_skipped(self):
+        return self.num_frames - self.num_processed
+
+    # Return True if the frame (BGR) should go through the full pipeline
+    def should_process(self, frame):
+        self.num_frames += 1
+        tiny = self._tiny_image(frame)
+        if self._reference is None:
+            self._reference = tiny.astype(np.float32)
+            self._diff = np.empty_like(self._reference)
+            return self._processed()
+        cv2.absdiff(tiny.astype(np.float32), self._reference, dst=self._diff)
+        self.mad = cv2.mean(self._diff)[0]
+        cv2.accumulateWeighted(tiny, self._reference, self.alpha)
+
+        if self._hold:
+            # The scene was occupied recently
+            self._hold -= 1
+            return self._processed()
+        if self.mad > self.threshold:
+            self.num_onsets += 1
+            return self._processed()
+        self._since_processed += 1
+        if self._since_processed >= self.idle_stride:
+            return self._processed()
+        return False
+
+    # Tell the gate whether motion was found on the last processed frame
+    def report(self, occupied):
+        if occupied:
+            self._hold = self.hold_frames
+
+    def _processed(self):
+        self.num_processed += 1
+        self._since_processed = 0
+        return True
+
+    def _tiny_image(self, frame):
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, int(round(height * self.width / width))))
+        # NOTE: linear interpolation only reads a few pixels around each
+        # sample, so it costs almost nothing even for large frames
+        self._tiny = cv2.resize(frame, size, dst=self._tiny,
+                                interpolation=cv2.INTER_LINEAR)
+        if self._tiny.ndim == 3:
+            return cv2.cvtColor(self._tiny, cv2.COLOR_BGR2GRAY)
+        return self._tiny
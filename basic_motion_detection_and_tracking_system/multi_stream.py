@@ -0,0 +1,192 @@
+"""
+Run the motion detection pipelines of several video sources in a pool of worker
+processes
+
+The streams are distributed round-robin over the workers, and each worker
+interleaves its pipelines one frame at a time so that live feeds assigned to
+the same worker are all processed.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+import pathlib
+import time
+# Own modules
+from metrics import MetricsServer
+from pipeline import ConfigError, MotionDetectionPipeline, merge_conf
+from preview import PreviewServer
+from utilities.utils import available_cores, setup_logging, stop_logging
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+# Time (s) a worker waits for a frame when none of its streams has one ready
+IDLE_WAIT = 0.005
+
+
+# Return the configuration of each stream: the base configuration updated with
+# the options specific to the stream
+def build_stream_confs(conf, streams):
+    stream_confs = []
+    names = set()
+    for i, stream in enumerate(streams):
+        stream_conf = merge_conf(conf, stream)
+        name = stream_conf.setdefault("name", "stream_{:02d}".format(i))
+        if name in names:
+            raise ConfigError("Stream name ({}) is not unique".format(name))
+        names.add(name)
+        stream_confs.append(stream_conf)
+    return stream_confs
+
+
+def log_stream_stats(stats):
+    skipped = ""
+    if stats['frames_skipped']:
+        skipped = ", {} frames skipped by the motion gate".format(
+            stats['frames_skipped'])
+    logger.info("[{name}] {frames_processed} frames in {elapsed:.1f} s: "
+                "{fps:.1f} FPS".format(**stats) + skipped)
+
+
+# Entry point of a worker process: run the pipelines of `stream_confs`
+# interleaved, and return their throughput
+def _run_worker(worker_id, stream_confs, main_folder, report_interval):
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging_conf = stream_confs[0]
+    if not logging_conf["disable_logging"]:
+        # Each worker writes its own log file to avoid interleaved writes
+        log_folder = None
+        if main_folder:
+            log_folder = os.path.join(main_folder,
+                                      "worker_{:02d}".format(worker_id))
+            pathlib.Path(log_folder).mkdir(parents=True, exist_ok=True)
+        setup_logging(logging_conf["logging_conf_path"], log_folder,
+                      use_queue=logging_conf["async_logging"])
+
+    # One metrics server per worker, serving the metrics of all its streams.
+    # The workers listen on consecutive ports starting at `http_port`.
+    metrics_server = None
+    metrics_cfg = stream_confs[0]["metrics"]
+    if metrics_cfg["http_port"]:
+        metrics_server = MetricsServer(
+            metrics_cfg["http_host"],
+            metrics_cfg["http_port"] + worker_id).start()
+    # Same for the live preview of the streams
+    preview_server = None
+    preview_cfg = stream_confs[0]["preview"]
+    if preview_cfg["enable"]:
+        preview_server = PreviewServer(
+            preview_cfg["http_host"],
+            preview_cfg["http_port"] + worker_id).start()
+
+    pipelines = []
+    try:
+        for stream_conf in stream_confs:
+            # A live source can block for a long time on a read (waiting for
+            # the next frame, or to reconnect): its frames are decoded in a
+            # separate thread so that the worker can skip the stream until a
+            # frame is ready instead of stalling its other streams
+            grabber_cfg = stream_conf["frame_grabber"]
+            if len(stream_confs) > 1 and not grabber_cfg["enable"] and \
+                    not stream_conf["video_filepath"] and \
+                    not stream_conf["image_dirpath"]:
+                logger.info("[{}] The frame grabber is enabled for the live "
+                            "source".format(stream_conf["name"]))
+                grabber_cfg["enable"] = True
+            pipeline = MotionDetectionPipeline(stream_conf,
+                                               name=stream_conf["name"],
+                                               metrics_server=metrics_server,
+                                               preview_server=preview_server)
+            saved_folder = None
+            if main_folder:
+                saved_folder = os.path.join(main_folder, stream_conf["name"])
+            # A stream that can't be set up (e.g. invalid configuration) is
+            # skipped, the other streams of the worker keep going
+            try:
+                pipeline.create_saved_folder(saved_folder)
+                pipeline.validate_conf()
+                pipeline.setup()
+            except Exception as e:
+                logger.error("[{}] The stream couldn't be set up, it is "
+                             "skipped: {}: {}".format(stream_conf["name"],
+                                                      type(e).__name__, e))
+                pipeline.close()
+                continue
+            pipelines.append(pipeline)
+
+        running = list(pipelines)
+        last_report = time.perf_counter()
+        while running:
+            num_stepped = 0
+            for pipeline in list(running):
+                # Skip the live streams without a new frame
+                if not pipeline.frame_ready():
+                    continue
+                num_stepped += 1
+                if not pipeline.step():
+                    pipeline.close()
+                    running.remove(pipeline)
+                    log_stream_stats(pipeline.stats())
+            if not num_stepped:
+                # No stream had a frame: wait a bit instead of spinning
+                running[0].frame_ready(IDLE_WAIT)
+            if report_interval and \
+                    time.perf_counter() - last_report >= report_interval:
+                for pipeline in running:
+                    log_stream_stats(pipeline.stats())
+                last_report = time.perf_counter()
+    finally:
+        # Flush the image writers and release the cameras even if a pipeline
+        # failed
+        for pipeline in pipelines:
+            pipeline.close()
+        if metrics_server:
+            metrics_server.stop()
+        if preview_server:
+            preview_server.stop()
+        # NOTE: the worker processes exit without running the `atexit`
+        # functions, the queued log records must be written now
+        stop_logging()
+    return [pipeline.stats() for pipeline in pipelines]
+
+
+class MultiStreamRunner:
+    """Schedule the pipelines of several streams across worker processes.
+
+    Each stream keeps its own camera and background model. Setting
+    `num_workers` to 0 sizes the pool to the number of available cores (but
+    never more than the number of streams).
+    """
+
+    def __init__(self, stream_confs, num_workers=0, main_folder=None,
+                 report_interval=60):
+        if not stream_confs:
+            raise ConfigError("No streams to process")
+        self.stream_confs = stream_confs
+        if num_workers <= 0:
+            num_workers = available_cores()
+        self.num_workers = min(num_workers, len(stream_confs))
+        self.main_folder = main_folder
+        self.report_interval = report_interval
+
+    # Process all the streams and return the throughput of each of them
+    def run(self):
+        # Round-robin assignment of the streams to the workers
+        groups = [self.stream_confs[i::self.num_workers]
+                  for i in range(self.num_workers)]
+        logger.info("Processing {} streams with {} worker processes".format(
+                    len(self.stream_confs), self.num_workers))
+        all_stats = []
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            futures = [executor.submit(_run_worker, i, group,
+                                       self.main_folder, self.report_interval)
+                       for i, group in enumerate(groups)]
+            for i, future in enumerate(futures):
+                try:
+                    all_stats.extend(future.result())
+                except Exception as e:
+                    # The other workers keep going
+                    logger.error("Worker {} failed: {}".format(i, e))
+        for stats in all_stats:
+            log_stream_stats(stats)
+        return all_stats
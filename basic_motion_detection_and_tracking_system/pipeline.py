@@ -0,0 +1,1474 @@
+"""
+Motion detection pipeline for one video source (video file, sequence of images,
+network stream or webcam feed)
+
+The pipeline is configured with the options from `conf.json`. It can be run to
+completion with `run()`, or driven one frame at a time with `step()` which
+allows a single process to interleave several pipelines (see `multi_stream.py`).
+"""
+import copy
+import datetime
+import inspect
+import json
+import logging
+import os
+import pathlib
+import time
+# Third-party modules
+import cv2
+from imutils import resize
+import numpy as np
+# Own modules
+from background_models.registry import ModelNotFoundError, get_model, \
+    load_plugins
+from checkpoint import CheckpointError, load_checkpoint, save_checkpoint
+from detection_region import DetectionRegion
+from detections import DetectionWriter, EXTRACTION_METHODS, \
+    FrameRecordWriter, MERGE_METHODS, component_boxes, contour_boxes, \
+    draw_boxes, make_detections, merge_boxes
+from encoding import IMAGE_FORMATS, ImageEncoder, MASK_FORMATS, MASK_SETS, \
+    PROFILE_SETS
+from event_recorder import EventRecorder, INDEX_FORMATS
+from fast_filters import BLUR_MODES, Blur, dilate
+from frame_buffers import FIND_CONTOURS_MODIFIES_SOURCE, FrameBuffers
+from frame_grabber import GRABBER_MODES, ThreadedFrameGrabber
+from frame_seek import SEEK_STRATEGIES, seek
+from image_sequence import FrameDiskCache, ImageSequenceSource, load_index
+from metrics import MetricsServer, PipelineMetrics
+from motion_gate import MotionGate
+from preview import PREVIEW_IMAGES, PreviewPublisher, PreviewServer
+from results_archive import ArchiveWriter, CODECS, MASK_CODECS
+from sources import ReconnectingSource, open_capture, redact_url
+from tracker import ASSOCIATIONS, Tracker, TrajectoryWriter, \
+    linear_sum_assignment
+from utilities.image_writer import AsyncImageWriter, BACKPRESSURE_POLICIES
+from utilities.utils import PER_FRAME, available_cores, \
+    get_full_command_line, timestamped, unique_foldername, write_image
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+IMAGE_SETS = ["security_feed", "thresh", "frame_delta"]
+# Sets of images that can be stored in an archive instead of image files
+ARCHIVE_IMAGE_SETS = ["thresh", "frame_delta"]
+
+
+class ConfigError(Exception):
+    """Raised when a configuration option is not valid"""
+
+
+# Return a copy of `conf` updated with `overrides`. Options that are `dict`s
+# (e.g. `gaussian_kernel_size`) are merged instead of being replaced.
+def merge_conf(conf, overrides):
+    merged = copy.deepcopy(conf)
+    for k, v in overrides.items():
+        if isinstance(v, dict) and isinstance(merged.get(k), dict):
+            merged[k] = merge_conf(merged[k], v)
+        else:
+            merged[k] = copy.deepcopy(v)
+    return merged
+
+
+# Open the video source: video file, list of images, network stream, or webcam
+# feed
+def open_camera(conf):
+    if conf["video_filepath"]:
+        # Reading from a video file
+        logger.info("Reading video file ...")
+        camera = cv2.VideoCapture(conf["video_filepath"])
+        logger.info("Finished reading video file")
+    elif conf["image_dirpath"]:
+        # Reading from a list of images, decoded ahead by a pool of threads
+        logger.info("Reading images ...")
+        seq_cfg = conf["image_sequence"]
+        paths = load_index(conf["image_dirpath"], seq_cfg["cache_dirpath"])
+        frame_cache = None
+        if seq_cfg["cache_dirpath"] and seq_cfg["cache_frames"]:
+            frame_cache = FrameDiskCache(
+                os.path.join(seq_cfg["cache_dirpath"], 'frames'),
+                seq_cfg["frame_cache_max_mb"] * 1e6)
+        # NOTE: the ROI is cropped from the original frames, which can't be
+        # resized beforehand
+        detection_cfg = conf["detection"]
+        resize_width = conf["resize_image_width"]
+        if detection_cfg["width"] or detection_cfg["roi_rectangles"] or \
+                detection_cfg["roi_polygons"]:
+            resize_width = 0
+        camera = ImageSequenceSource(paths,
+                                     num_workers=seq_cfg["num_workers"] or
+                                     available_cores(),
+                                     prefetch=seq_cfg["prefetch"],
+                                     resize_width=resize_width,
+                                     frame_cache=frame_cache)
+        logger.info("Finished reading images: {} images".format(len(paths)))
+    else:
+        # Reading from a network stream (RTSP, HTTP, ...) or a webcam feed
+        # (capture device)
+        if conf["stream_url"]:
+            source = conf["stream_url"]
+            logger.info("Reading network stream {} ...".format(
+                        redact_url(source)))
+        else:
+            source = conf["device_index"]
+            logger.info("Reading webcam feed (device {}) ...".format(source))
+        live_cfg = conf["live_source"]
+        if live_cfg["reconnect"]:
+            camera = ReconnectingSource(
+                source,
+                initial_delay=live_cfg["initial_delay"],
+                max_delay=live_cfg["max_delay"],
+                max_attempts=live_cfg["max_attempts"],
+                timeout=live_cfg["timeout"],
+                drain_max_frames=live_cfg["drain_max_frames"])
+        else:
+            camera = open_capture(source, live_cfg["timeout"])
+        # Let the capture device warm up (e.g. exposure) before the first
+        # frame is read
+        if not conf["stream_url"] and live_cfg["warmup_delay"]:
+            time.sleep(live_cfg["warmup_delay"])
+        logger.info("Finished reading {}".format(
+                    "network stream" if conf["stream_url"] else "webcam feed"))
+    return camera
+
+
+class MotionDetectionPipeline:
+    """Detect motion on the frames of one video source.
+
+    Each pipeline has its own camera, background model and output folder, so
+    several pipelines can run side by side in the same process.
+    """
+
+    # NOTE 1: a `camera` given to the pipeline is used as is, i.e. it should
+    # already be at `start_frame`
+    # NOTE 2: if `batch_size` > 1, the frame deltas of `batch_size` frames are
+    # computed with a single call to the background model (video files and
+    # image sequences only)
+    # NOTE 3: the metrics of the pipeline are added to `metrics_server` if
+    # given, otherwise the pipeline starts its own server (if `http_port` is
+    # set). Same for the live preview and `preview_server`.
+    # NOTE 4: the startup to the first frame is measured from `start_time` (a
+    # `time.perf_counter()` value, e.g. taken when the script started), or
+    # from the creation of the pipeline if it is None
+    def __init__(self, conf, name=None, camera=None, batch_size=1,
+                 metrics_server=None, preview_server=None, start_time=None):
+        self.conf = conf
+        self.name = name
+        self.camera = camera
+        self.batch_size = batch_size
+        self.metrics = PipelineMetrics()
+        self.metrics_server = metrics_server
+        self._owns_metrics_server = False
+        # Publisher of the frames shown in the live preview, if enabled
+        self.preview = None
+        self.preview_server = preview_server
+        self._owns_preview_server = False
+        self._last_display_time = 0.0
+        self._last_summary_time = None
+        self.background_model_cls = None
+        self.background_model_params = {}
+        self.background_model = None
+        self.image_writer = None
+        # File format and encoding parameters of each set of saved images
+        self.encoder = None
+        # Archive of each set of images stored in the results archive
+        self.archives = {}
+        self.event_recorder = None
+        self.tracker = None
+        self.trajectory_writer = None
+        # Boxes found in the current frame (see `detections.DETECTION_DTYPE`)
+        self.detections = None
+        self.detection_writer = None
+        # JSON lines of the boxes and stage durations of each frame
+        self.frame_record_writer = None
+        self.motion_gate = None
+        # Buffers of the intermediate images, if they are preallocated
+        self.buffers = None
+        # ROI and scale used for detecting motion, created once the shape of
+        # the frames is known
+        self.region = None
+        # Blur of the grayscale frames (Gaussian or an approximation)
+        self.blur = None
+        # The first frame is the background image and is numbered as frame
+        # number `start_frame` (1 by default)
+        self.frame_num = 2
+        self.num_frames_processed = 0
+        # Frames read from the camera, including the background frame
+        self.num_frames_read = 0
+        # True once the end of the frames is reached
+        self.finished = False
+        # State of the checkpoint the run is resumed from, if any
+        self.resume_state = None
+        self._checkpoint_interval = 0
+        self._last_checkpoint_frame = None
+        self._start_time = None
+        self._end_time = None
+        self._startup_start_time = start_time or time.perf_counter()
+        # Seconds from the startup to the first frame read
+        self.startup_time = None
+
+    # Create the 'main' directory for storing image results, and the folders
+    # for each set of images. If `saved_folder` is None, a timestamped folder is
+    # created within `reports_dirpath`.
+    def create_saved_folder(self, saved_folder=None):
+        conf = self.conf
+        if not conf["reports_dirpath"]:
+            logger.info("Images will not be saved")
+            conf["saved_folder"] = None
+            return None
+        if saved_folder is None:
+            # TODO: first check that `reports_dirpath` exists. If it doesn't
+            # exit create it.
+            saved_folder = os.path.join(conf["reports_dirpath"],
+                                        timestamped("image_results"))
+            saved_folder = unique_foldername(saved_folder)
+        logger.debug("Creating folder {}".format(saved_folder))
+        pathlib.Path(saved_folder).mkdir(parents=True, exist_ok=True)
+        conf["saved_folder"] = saved_folder
+        # Create folders for each set of images
+        for fname in IMAGE_SETS:
+            if conf["results_archive"]["enable"] and \
+                    fname in ARCHIVE_IMAGE_SETS:
+                logger.debug("{} images will be stored in {}.data".format(
+                             fname, fname))
+            elif conf["save_{}_images".format(fname)]:
+                image_folder = os.path.join(saved_folder, fname)
+                logger.debug("Creating folder {}".format(image_folder))
+                pathlib.Path(image_folder).mkdir(parents=True, exist_ok=True)
+            else:
+                logger.debug("Folder for {} images not created".format(fname))
+        if conf["event_recording"]["enable"]:
+            events_folder = os.path.join(saved_folder, "events")
+            logger.debug("Creating folder {}".format(events_folder))
+            pathlib.Path(events_folder).mkdir(parents=True, exist_ok=True)
+        return saved_folder
+
+    # Validate the configuration options. Options that can be fixed are
+    # replaced with their default value, otherwise `ConfigError` is raised.
+    def validate_conf(self):
+        conf = self.conf
+
+        # Validate background model and its parameters
+        try:
+            load_plugins(conf["background_model_plugins"])
+        except ImportError as e:
+            raise ConfigError("Background model plugin couldn't be loaded: "
+                              "{}".format(e))
+        try:
+            self.background_model_cls = get_model(conf["background_model"])
+        except ModelNotFoundError as e:
+            raise ConfigError(e)
+        logger.info("Background model used: {}".format(
+                    conf["background_model"]))
+        params = conf["background_model_params"].get(conf["background_model"],
+                                                     {})
+        try:
+            # The first two arguments are the first frame and the saving
+            # configuration
+            inspect.signature(self.background_model_cls).bind(None, None,
+                                                              **params)
+        except TypeError as e:
+            raise ConfigError("Parameters of the background model ({}) are not "
+                              "valid: {}".format(conf["background_model"], e))
+        self.background_model_params = params
+
+        # Validate gaussian kernel size
+        ksize = conf["gaussian_kernel_size"]
+        if not ksize["width"] % 2 or ksize["width"] <= 0:
+            raise ConfigError("Width of Gaussian kernel should be odd and "
+                              "positive")
+        if not ksize["height"] % 2 or ksize["height"] <= 0:
+            raise ConfigError("Height of Gaussian kernel should be odd and "
+                              "positive")
+
+        # Validate image sequence
+        seq_cfg = conf["image_sequence"]
+        if seq_cfg["num_workers"] < 0 or seq_cfg["prefetch"] <= 0:
+            raise ConfigError("num_workers of the image sequence should be "
+                              "positive or 0, and prefetch positive")
+        if seq_cfg["frame_cache_max_mb"] <= 0:
+            raise ConfigError("frame_cache_max_mb of the image sequence "
+                              "should be positive")
+        if seq_cfg["cache_frames"] and not seq_cfg["cache_dirpath"]:
+            logger.warning("The decoded images will not be cached since "
+                           "cache_dirpath of the image sequence is empty")
+
+        # Validate blur and dilation filters
+        filters_cfg = conf["filters"]
+        if filters_cfg["blur_mode"] not in BLUR_MODES:
+            logger.warning("Blur mode ({}) is not supported. gaussian will be "
+                           "used".format(filters_cfg["blur_mode"]))
+            filters_cfg["blur_mode"] = 'gaussian'
+        if filters_cfg["num_boxes"] <= 0 or filters_cfg["pyramid_levels"] <= 0:
+            raise ConfigError("num_boxes and pyramid_levels of the filters "
+                              "should be positive")
+
+        # Validate extraction and merging of the bounding boxes
+        boxes_cfg = conf["boxes"]
+        if boxes_cfg["extraction"] not in EXTRACTION_METHODS:
+            logger.warning("Extraction method ({}) is not supported. "
+                           "contours will be used".format(
+                            boxes_cfg["extraction"]))
+            boxes_cfg["extraction"] = 'contours'
+        if boxes_cfg["merge"] not in MERGE_METHODS:
+            logger.warning("Merge method ({}) is not supported. The boxes "
+                           "will not be merged".format(boxes_cfg["merge"]))
+            boxes_cfg["merge"] = 'none'
+        if boxes_cfg["merge_distance"] < 0:
+            raise ConfigError("merge_distance of the boxes should be positive "
+                              "or 0")
+        if not 0 <= boxes_cfg["nms_iou_threshold"] <= 1:
+            raise ConfigError("nms_iou_threshold of the boxes should be "
+                              "between 0 and 1")
+
+        # Validate detection scale and ROI
+        detection_cfg = conf["detection"]
+        if detection_cfg["width"] < 0:
+            raise ConfigError("Detection width should be positive or 0")
+        for rect in detection_cfg["roi_rectangles"]:
+            if len(rect) != 4 or rect[2] <= 0 or rect[3] <= 0:
+                raise ConfigError("ROI rectangle ({}) should be [x, y, w, h] "
+                                  "with positive w and h".format(rect))
+        for polygon in detection_cfg["roi_polygons"]:
+            if len(polygon) < 3 or any(len(pt) != 2 for pt in polygon):
+                raise ConfigError("ROI polygon ({}) should have at least 3 "
+                                  "points [x, y]".format(polygon))
+        if detection_cfg["width"] and conf["resize_image_width"] and \
+                detection_cfg["width"] > conf["resize_image_width"]:
+            logger.warning("Detection width ({}) is greater than the display "
+                           "width ({})".format(detection_cfg["width"],
+                                               conf["resize_image_width"]))
+
+        # Validate event recording
+        events_cfg = conf["event_recording"]
+        if events_cfg["index_format"] not in INDEX_FORMATS:
+            logger.warning("Event index format ({}) is not supported. csv will "
+                           "be used".format(events_cfg["index_format"]))
+            events_cfg["index_format"] = 'csv'
+        if events_cfg["pre_roll"] < 0 or events_cfg["post_roll"] < 0 or \
+                events_cfg["fps"] <= 0:
+            raise ConfigError("pre_roll and post_roll of the event recording "
+                              "should be positive or 0, and fps positive")
+        if events_cfg["enable"] and not conf["reports_dirpath"]:
+            logger.warning("Events will not be recorded since reports_dirpath "
+                           "is empty")
+
+        # Validate tracking
+        tracking_cfg = conf["tracking"]
+        # NOTE: the association is only checked if it is used
+        if tracking_cfg["enable"]:
+            if tracking_cfg["association"] not in ASSOCIATIONS:
+                logger.warning("Association ({}) is not supported. hungarian "
+                               "will be used".format(
+                                tracking_cfg["association"]))
+                tracking_cfg["association"] = 'hungarian'
+            if tracking_cfg["association"] == 'hungarian' and \
+                    linear_sum_assignment is None:
+                logger.warning("SciPy is not installed, the greedy "
+                               "association will be used for tracking")
+                tracking_cfg["association"] = 'greedy'
+        if not 0 < tracking_cfg["iou_threshold"] <= 1:
+            raise ConfigError("iou_threshold of the tracking should be in "
+                              "(0, 1]")
+        if tracking_cfg["max_distance"] < 0 or \
+                tracking_cfg["max_missed"] < 0 or tracking_cfg["min_hits"] < 1:
+            raise ConfigError("max_distance and max_missed of the tracking "
+                              "should be positive or 0, and min_hits at least "
+                              "1")
+
+        # Validate motion gate
+        gate_cfg = conf["motion_gate"]
+        if gate_cfg["width"] <= 0 or gate_cfg["idle_stride"] < 1 or \
+                gate_cfg["hold_frames"] < 0 or \
+                not 0 < gate_cfg["alpha"] <= 1:
+            raise ConfigError("width of the motion gate should be positive, "
+                              "idle_stride at least 1, hold_frames positive or "
+                              "0, and alpha in (0, 1]")
+
+        # Validate live source
+        if conf["device_index"] < 0:
+            raise ConfigError("device_index should be positive or 0")
+        live_cfg = conf["live_source"]
+        if live_cfg["initial_delay"] <= 0 or \
+                live_cfg["max_delay"] < live_cfg["initial_delay"]:
+            raise ConfigError("initial_delay of the live source should be "
+                              "positive and not greater than max_delay")
+        if live_cfg["max_attempts"] < 0 or live_cfg["timeout"] < 0 or \
+                live_cfg["drain_max_frames"] < 0 or \
+                live_cfg["warmup_delay"] < 0:
+            raise ConfigError("max_attempts, timeout, drain_max_frames and "
+                              "warmup_delay of the live source should be "
+                              "positive or 0")
+
+        # Validate image format and encoding profiles
+        if conf["image_format"] not in IMAGE_FORMATS:
+            logger.warning("Image format ({}) is not supported. png will be "
+                           "used".format(conf["image_format"]))
+            conf["image_format"] = 'png'
+        encoding_cfg = conf["encoding"]
+        for iname in PROFILE_SETS:
+            profile = encoding_cfg[iname]
+            formats = IMAGE_FORMATS + \
+                (MASK_FORMATS if iname in MASK_SETS else [])
+            if profile["format"] and profile["format"] not in formats:
+                logger.warning("Image format of the {} images ({}) is not "
+                               "supported. {} will be used".format(
+                                iname, profile["format"],
+                                conf["image_format"]))
+                profile["format"] = ''
+            if not -1 <= profile["png_compression"] <= 9:
+                logger.warning("png_compression of the {} images ({}) should "
+                               "be between -1 and 9. -1 will be used".format(
+                                iname, profile["png_compression"]))
+                profile["png_compression"] = -1
+            if not 0 <= profile["jpeg_quality"] <= 100 or \
+                    not 1 <= profile["webp_quality"] <= 101:
+                raise ConfigError("jpeg_quality of the {0} images should be "
+                                  "between 0 and 100 and webp_quality of the "
+                                  "{0} images between 1 and 101".format(iname))
+        adaptive_cfg = encoding_cfg["adaptive"]
+        if not 0 <= adaptive_cfg["low_occupancy"] <= \
+                adaptive_cfg["high_occupancy"] <= 1:
+            raise ConfigError("low_occupancy and high_occupancy of the "
+                              "adaptive encoding should be between 0 and 1, "
+                              "with low_occupancy not greater than "
+                              "high_occupancy")
+        if adaptive_cfg["write_budget_ms"] < 0:
+            raise ConfigError("write_budget_ms of the adaptive encoding "
+                              "should be positive or 0")
+
+        # Validate results archive
+        archive_cfg = conf["results_archive"]
+        if archive_cfg["mask_codec"] not in CODECS:
+            logger.warning("Codec of the masks ({}) is not supported. "
+                           "packbits_zlib will be used".format(
+                            archive_cfg["mask_codec"]))
+            archive_cfg["mask_codec"] = 'packbits_zlib'
+        # NOTE: the bit-packing codecs would lose the values of the 'frame
+        # delta' images
+        if archive_cfg["delta_codec"] not in CODECS or \
+                archive_cfg["delta_codec"] in MASK_CODECS:
+            logger.warning("Codec of the frame delta images ({}) is not "
+                           "supported. zlib will be used".format(
+                            archive_cfg["delta_codec"]))
+            archive_cfg["delta_codec"] = 'zlib'
+        if not 0 <= archive_cfg["zlib_level"] <= 9:
+            logger.warning("zlib_level ({}) should be between 0 and 9. 1 will "
+                           "be used".format(archive_cfg["zlib_level"]))
+            archive_cfg["zlib_level"] = 1
+        if archive_cfg["flush_interval"] <= 0:
+            raise ConfigError("flush_interval of the results archive should "
+                              "be positive")
+
+        # Validate checkpoints
+        checkpoint_cfg = conf["checkpoint"]
+        if checkpoint_cfg["interval"] <= 0:
+            raise ConfigError("interval of the checkpoints should be positive")
+        if checkpoint_cfg["enable"] and not conf["reports_dirpath"]:
+            logger.warning("Checkpoints will not be saved since "
+                           "reports_dirpath is empty")
+
+        # Validate image writer
+        writer_cfg = conf["image_writer"]
+        if writer_cfg["backpressure"] not in BACKPRESSURE_POLICIES:
+            logger.warning("Backpressure policy ({}) is not supported. block "
+                           "will be used".format(writer_cfg["backpressure"]))
+            writer_cfg["backpressure"] = 'block'
+        if writer_cfg["num_workers"] <= 0 or writer_cfg["queue_size"] <= 0:
+            raise ConfigError("num_workers and queue_size of the image writer "
+                              "should be positive")
+
+        # Validate frame grabber
+        grabber_cfg = conf["frame_grabber"]
+        if grabber_cfg["mode"] not in GRABBER_MODES + ['auto']:
+            logger.warning("Frame grabber mode ({}) is not supported. auto "
+                           "will be used".format(grabber_cfg["mode"]))
+            grabber_cfg["mode"] = 'auto'
+        if grabber_cfg["buffer_size"] < 2:
+            raise ConfigError("buffer_size of the frame grabber should be at "
+                              "least 2")
+
+        # Validate metrics
+        metrics_cfg = conf["metrics"]
+        if metrics_cfg["window"] <= 0:
+            raise ConfigError("window of the metrics should be positive")
+        if not 0 <= metrics_cfg["http_port"] <= 65535:
+            raise ConfigError("http_port of the metrics ({}) is not a valid "
+                              "port".format(metrics_cfg["http_port"]))
+
+        # Validate display and live preview
+        if conf["display_max_fps"] < 0:
+            raise ConfigError("display_max_fps should be positive or 0")
+        preview_cfg = conf["preview"]
+        if preview_cfg["enable"]:
+            if preview_cfg["max_fps"] <= 0:
+                raise ConfigError("max_fps of the preview should be positive")
+            if not 0 <= preview_cfg["jpeg_quality"] <= 100:
+                raise ConfigError("jpeg_quality of the preview should be "
+                                  "between 0 and 100")
+            if not 0 <= preview_cfg["http_port"] <= 65535:
+                raise ConfigError("http_port of the preview ({}) is not a "
+                                  "valid port".format(preview_cfg["http_port"]))
+            unknown = set(preview_cfg["images"]) - set(PREVIEW_IMAGES)
+            if unknown:
+                logger.warning("Preview images {} are not supported. They "
+                               "will be ignored".format(sorted(unknown)))
+                preview_cfg["images"] = [i for i in preview_cfg["images"]
+                                         if i in PREVIEW_IMAGES]
+            if not preview_cfg["images"]:
+                logger.warning("No images to preview. security_feed will be "
+                               "used")
+                preview_cfg["images"] = ['security_feed']
+
+        if conf["resize_image_width"] == 0:
+            logger.info("Images will not be resized")
+
+        # Validate `start_frame`
+        if conf["start_frame"] == 0 or not conf["start_frame"]:
+            logger.warning("start_frame will be changed from {} to 1".format(
+                           conf["start_frame"]))
+            conf["start_frame"] = 1
+
+        # Validate seek strategy
+        if conf["seek_strategy"] not in SEEK_STRATEGIES:
+            logger.warning("Seek strategy ({}) is not supported. auto will be "
+                           "used".format(conf["seek_strategy"]))
+            conf["seek_strategy"] = 'auto'
+
+        # Validate `end_frame`
+        if conf["end_frame"] == 0 or not conf["end_frame"]:
+            logger.info("end_frame is set to {}, thus motion detection will "
+                        "run until last image".format(conf["end_frame"]))
+            # TODO: use inf instead?
+            conf["end_frame"] = 1000000
+
+    # Continue the run whose output folder is `saved_folder` from its last
+    # checkpoint (see `checkpoint.py`). Must be called before `setup()`.
+    # Return False if the run was already complete.
+    def resume_from_checkpoint(self):
+        conf = self.conf
+        if not (conf["video_filepath"] or conf["image_dirpath"]):
+            raise ConfigError("Only the processing of video files and image "
+                              "sequences can be resumed")
+        try:
+            self.resume_state = load_checkpoint(conf["saved_folder"])
+        except CheckpointError as e:
+            raise ConfigError(e)
+        return not self.resume_state['completed']
+
+    # Open the camera, start the image writer and save the configuration. Must
+    # be called after `validate_conf()`.
+    def setup(self):
+        conf = self.conf
+        # State saved in the checkpoint, if the run is resumed
+        resume = self.resume_state or {}
+
+        # Setup camera: video file, list of images, or webcam feed
+        if self.camera is None:
+            logger.info("Setup camera")
+            self.camera = open_camera(conf)
+
+            # Go directly to `start_frame` (or to the frame after the
+            # checkpoint) instead of reading all the frames before it
+            first_frame = resume.get('frame_num', conf["start_frame"])
+            if first_frame > 1:
+                logger.info("Seeking to frame # {} ...".format(first_frame))
+                self.camera, strategy = seek(
+                    self.camera, first_frame - 1,
+                    strategy=conf["seek_strategy"],
+                    video_filepath=conf["video_filepath"],
+                    image_dirpath=conf["image_dirpath"],
+                    reopen=lambda: open_camera(conf))
+                logger.info("Seek done with strategy: {}".format(strategy))
+
+            # Decode the frames in a separate thread so that decoding and
+            # processing can overlap
+            grabber_cfg = conf["frame_grabber"]
+            if grabber_cfg["enable"]:
+                grabber_mode = grabber_cfg["mode"]
+                if grabber_mode == 'auto':
+                    # Only the newest frame matters for a live feed, but every
+                    # frame of a video file or image sequence must be processed
+                    if conf["video_filepath"] or conf["image_dirpath"]:
+                        grabber_mode = 'never_drop'
+                    else:
+                        grabber_mode = 'latest'
+                logger.info("Frames will be decoded in a separate thread "
+                            "(buffer size={}, mode={})".format(
+                             grabber_cfg["buffer_size"], grabber_mode))
+                self.camera = ThreadedFrameGrabber(
+                    self.camera,
+                    buffer_size=grabber_cfg["buffer_size"],
+                    mode=grabber_mode).start()
+
+        # Save configuration file and command line
+        if conf["saved_folder"]:
+            logger.info("Saving configuration file and command line")
+            with open(os.path.join(conf["saved_folder"], 'conf.json'), 'w') \
+                    as outfile:
+                # ref.: https://stackoverflow.com/a/20776329
+                json.dump(conf, outfile, indent=4, ensure_ascii=False)
+            # NOTE: the command of a resumed run is added after the first one
+            with open(os.path.join(conf["saved_folder"], 'command.txt'),
+                      'a' if resume else 'w') as outfile:
+                outfile.write(("\n" if resume else "") +
+                              get_full_command_line())
+
+        # Setup image writer: images are encoded and written to disk by a pool
+        # of workers so that the processing loop doesn't wait on the disk
+        writer_cfg = conf["image_writer"]
+        if conf["saved_folder"] and writer_cfg["enable"]:
+            logger.info("Images will be written asynchronously ({} workers, "
+                        "queue size={}, backpressure={})".format(
+                         writer_cfg["num_workers"], writer_cfg["queue_size"],
+                         writer_cfg["backpressure"]))
+            self.image_writer = AsyncImageWriter(
+                num_workers=writer_cfg["num_workers"],
+                queue_size=writer_cfg["queue_size"],
+                backpressure=writer_cfg["backpressure"],
+                use_processes=writer_cfg["use_processes"])
+
+        # Setup encoding of the saved images
+        if conf["saved_folder"]:
+            encoding_cfg = conf["encoding"]
+            self.encoder = ImageEncoder(
+                {iname: encoding_cfg[iname] for iname in PROFILE_SETS},
+                default_format=conf["image_format"],
+                adaptive=encoding_cfg["adaptive"])
+
+        # Setup results archive: the thresholded and frame delta images are
+        # stored in one file per set instead of one image file per frame
+        archive_cfg = conf["results_archive"]
+        if conf["saved_folder"] and archive_cfg["enable"]:
+            codecs = {'thresh': archive_cfg["mask_codec"],
+                      'frame_delta': archive_cfg["delta_codec"]}
+            for iname in ARCHIVE_IMAGE_SETS:
+                if conf["save_{}_images".format(iname)]:
+                    self.archives[iname] = ArchiveWriter(
+                        os.path.join(conf["saved_folder"], iname),
+                        codecs[iname], level=archive_cfg["zlib_level"],
+                        flush_interval=archive_cfg["flush_interval"],
+                        state=resume.get('archives', {}).get(iname))
+            logger.info("Images stored in the results archive: {}".format(
+                        ", ".join("{} ({})".format(iname, codecs[iname])
+                                  for iname in self.archives) or "none"))
+
+        if self.batch_size > 1 and not (conf["video_filepath"] or
+                                        conf["image_dirpath"]):
+            logger.warning("Batches of frames are only supported for video "
+                           "files and image sequences, the frames will be "
+                           "processed one at a time")
+            self.batch_size = 1
+        elif self.batch_size > 1:
+            logger.info("Frames will be processed in batches of {}".format(
+                        self.batch_size))
+
+        # The intermediate images of the loop are written into buffers
+        # allocated once instead of new arrays for every frame
+        if conf["preallocate_buffers"]:
+            self.buffers = FrameBuffers()
+
+        # Blur of the grayscale frames
+        filters_cfg = conf["filters"]
+        ksize = conf["gaussian_kernel_size"]
+        self.blur = Blur((ksize["width"], ksize["height"]),
+                         **self._blur_options())
+        if filters_cfg["blur_mode"] != 'gaussian':
+            logger.info("The Gaussian blur is approximated with the {} "
+                        "mode".format(filters_cfg["blur_mode"]))
+
+        # The background image is the frame `start_frame`, the motion detection
+        # starts at the next frame
+        self.frame_num = conf["start_frame"] + 1
+
+        # Setup event recording: one video clip per motion event
+        events_cfg = conf["event_recording"]
+        if conf["saved_folder"] and events_cfg["enable"]:
+            logger.info("Motion events will be recorded ({} frames of "
+                        "pre-roll, {} frames of post-roll)".format(
+                         events_cfg["pre_roll"], events_cfg["post_roll"]))
+            self.event_recorder = EventRecorder(
+                os.path.join(conf["saved_folder"], "events"),
+                pre_roll=events_cfg["pre_roll"],
+                post_roll=events_cfg["post_roll"],
+                fps=events_cfg["fps"],
+                fourcc=events_cfg["fourcc"],
+                clip_format=events_cfg["clip_format"],
+                index_format=events_cfg["index_format"],
+                state=resume.get('event_recorder'))
+
+        # Setup motion gate: the full motion detection only runs on the frames
+        # that may have motion
+        gate_cfg = conf["motion_gate"]
+        if gate_cfg["enable"] and self.batch_size > 1:
+            logger.warning("The motion gate is not used when frames are "
+                           "processed in batches")
+        elif gate_cfg["enable"]:
+            logger.info("Motion gate enabled (threshold={}, 1 frame out of {} "
+                        "processed when idle)".format(
+                         gate_cfg["threshold"], gate_cfg["idle_stride"]))
+            self.motion_gate = MotionGate(
+                width=gate_cfg["width"],
+                threshold=gate_cfg["threshold"],
+                idle_stride=gate_cfg["idle_stride"],
+                hold_frames=gate_cfg["hold_frames"],
+                alpha=gate_cfg["alpha"])
+
+        # Setup tracking: persistent IDs for the bounding boxes
+        tracking_cfg = conf["tracking"]
+        if tracking_cfg["enable"]:
+            logger.info("Bounding boxes will be tracked ({} association{})"
+                        .format(tracking_cfg["association"],
+                                ", Kalman filter" if tracking_cfg["kalman"]
+                                else ""))
+            self.tracker = Tracker(
+                association=tracking_cfg["association"],
+                iou_threshold=tracking_cfg["iou_threshold"],
+                max_distance=tracking_cfg["max_distance"],
+                max_missed=tracking_cfg["max_missed"],
+                min_hits=tracking_cfg["min_hits"],
+                kalman=tracking_cfg["kalman"])
+            if conf["saved_folder"] and tracking_cfg["save_trajectories"]:
+                self.trajectory_writer = TrajectoryWriter(
+                    os.path.join(conf["saved_folder"], "trajectories.bin"),
+                    state=resume.get('trajectory_writer'))
+
+        # Setup the file of the boxes found in each frame
+        boxes_cfg = conf["boxes"]
+        if conf["saved_folder"] and boxes_cfg["save_detections"]:
+            logger.info("The boxes of each frame will be saved ({}{})".format(
+                        boxes_cfg["extraction"],
+                        ", {} merge".format(boxes_cfg["merge"])
+                        if boxes_cfg["merge"] != 'none' else ""))
+            self.detection_writer = DetectionWriter(
+                os.path.join(conf["saved_folder"], "detections.bin"),
+                state=resume.get('detection_writer'))
+
+        # Setup the JSON lines of each frame
+        records_cfg = conf["frame_records"]
+        if conf["saved_folder"] and records_cfg["enable"]:
+            logger.info("The boxes{} of each frame will be saved in "
+                        "frames.jsonl".format(
+                         " and stage durations"
+                         if records_cfg["include_durations"] else ""))
+            self.frame_record_writer = FrameRecordWriter(
+                os.path.join(conf["saved_folder"], "frames.jsonl"),
+                state=resume.get('frame_record_writer'))
+
+        # Setup metrics: latency of each stage of the processing loop
+        metrics_cfg = conf["metrics"]
+        self.metrics = PipelineMetrics(
+            window=metrics_cfg["window"],
+            frame_durations=self.frame_record_writer is not None and
+            records_cfg["include_durations"])
+        if self.metrics_server is None and metrics_cfg["http_port"]:
+            self.metrics_server = MetricsServer(
+                metrics_cfg["http_host"], metrics_cfg["http_port"]).start()
+            self._owns_metrics_server = True
+        if self.metrics_server:
+            self.metrics_server.add(self.name or "main", self.metrics)
+
+        # Setup the live preview: the newest frames are encoded in a separate
+        # thread and served over HTTP, instead of being shown on screen
+        preview_cfg = conf["preview"]
+        if preview_cfg["enable"]:
+            self.preview = PreviewPublisher(preview_cfg["images"],
+                                            preview_cfg["max_fps"],
+                                            preview_cfg["jpeg_quality"])
+            if self.preview_server is None:
+                self.preview_server = PreviewServer(
+                    preview_cfg["http_host"], preview_cfg["http_port"]).start()
+                self._owns_preview_server = True
+            self.preview_server.add(self.name or "main", self.preview)
+
+        # Setup checkpoints: the state of the pipeline is saved periodically
+        # so that the run can be resumed
+        checkpoint_cfg = conf["checkpoint"]
+        if conf["saved_folder"] and checkpoint_cfg["enable"]:
+            logger.info("A checkpoint will be saved every {} frames".format(
+                        checkpoint_cfg["interval"]))
+            self._checkpoint_interval = checkpoint_cfg["interval"]
+        if resume:
+            self._restore(resume)
+        self._last_checkpoint_frame = self.frame_num
+
+        logger.info("Start of images/video processing ...")
+        self._start_time = time.perf_counter()
+        self._last_summary_time = self._start_time
+
+    # Restore the state saved in a checkpoint: the processing continues at the
+    # frame after the checkpoint
+    def _restore(self, state):
+        logger.info("Resuming from the checkpoint at frame # {}".format(
+                    state['frame_num']))
+        self.num_frames_processed = state['num_frames_processed']
+        self.frame_num = state['frame_num']
+        model = state['background_model']
+        if model is None:
+            # The first frame read starts the model again
+            logger.warning("The state of the background model ({}) wasn't "
+                           "saved, it starts again from frame # {}".format(
+                            self.conf["background_model"], self.frame_num))
+            self.frame_num += 1
+        else:
+            model.saving_cfg = self._saving_cfg()
+            self.background_model = model
+        if state['tracker'] is not None:
+            self.tracker = state['tracker']
+        if state['motion_gate'] is not None:
+            self.motion_gate = state['motion_gate']
+
+    # Save a checkpoint in the output folder. The buffered outputs are written
+    # first, so that the checkpoint matches what is on disk.
+    def save_checkpoint(self):
+        t = time.perf_counter()
+        if self.image_writer:
+            self.image_writer.flush()
+        model = self.background_model
+        state = {
+            'frame_num': self.frame_num,
+            'num_frames_processed': self.num_frames_processed,
+            'completed': self.finished,
+            'background_model': model if model is not None and
+            model.resumable else None,
+            'tracker': self.tracker,
+            'motion_gate': self.motion_gate,
+            'trajectory_writer': self.trajectory_writer.get_state()
+            if self.trajectory_writer else None,
+            'detection_writer': self.detection_writer.get_state()
+            if self.detection_writer else None,
+            'frame_record_writer': self.frame_record_writer.get_state()
+            if self.frame_record_writer else None,
+            'archives': {iname: archive.get_state()
+                         for iname, archive in self.archives.items()},
+            'event_recorder': self.event_recorder.get_state()
+            if self.event_recorder else None
+        }
+        save_checkpoint(self.conf["saved_folder"], state)
+        self._last_checkpoint_frame = self.frame_num
+        logger.debug("Checkpoint saved at frame # %s (%.1f ms)",
+                     self.frame_num, (time.perf_counter() - t) * 1000)
+
+    # Process all the frames, then release the resources
+    def run(self):
+        try:
+            while self.step():
+                pass
+            # NOTE: the last checkpoint isn't saved if the loop was interrupted
+            # (e.g. Ctrl-C) in the middle of a frame
+            if self._checkpoint_interval:
+                # The event still being recorded ends with the run
+                if self.event_recorder:
+                    self.event_recorder.end_event()
+                self.save_checkpoint()
+        finally:
+            self.close()
+
+    # Process the next frame (or batch of frames). Return False when there are
+    # no more frames to process (or the user asked to quit).
+    def step(self):
+        if self.batch_size > 1 and self.background_model is not None:
+            running = self._step_batch()
+        else:
+            running = self._step_frame()
+        if running and self._checkpoint_interval and \
+                self.frame_num - self._last_checkpoint_frame >= \
+                self._checkpoint_interval:
+            self.save_checkpoint()
+        return running
+
+    # Return True if `step()` won't wait for the next frame, waiting up to
+    # `timeout` seconds for it. Only the frames decoded by the frame grabber
+    # can be checked: for the other cameras, `step()` may block.
+    def frame_ready(self, timeout=0):
+        # NOTE: no frame is read once `end_frame` is passed
+        if isinstance(self.camera, ThreadedFrameGrabber) and \
+                self.frame_num <= self.conf["end_frame"]:
+            return self.camera.wait_frame(timeout)
+        return True
+
+    # Same as `step()` for a single frame
+    def _step_frame(self):
+        conf = self.conf
+        frame_num = self.frame_num
+        # NOTE: the background frame is the frame before the first frame
+        # processed (`start_frame`), `frame_num` is only incremented after it
+        if self.background_model is None:
+            logger.debug("Processing frame #%s (background)", frame_num - 1)
+        else:
+            logger.debug("Processing frame #%s", frame_num, extra=PER_FRAME)
+        if frame_num > conf["end_frame"]:
+            logger.info("Reached end of frames: frame # {}".format(frame_num))
+            self.finished = True
+            return False
+
+        frame = self._grab_frame()
+        if frame is None:
+            return False
+
+        # Skip the full motion detection on frames where the cheap check of the
+        # motion gate found nothing while the scene is idle
+        if self.motion_gate and self.background_model is not None:
+            t = time.perf_counter()
+            process = self.motion_gate.should_process(frame)
+            self.metrics.record('motion_gate', t)
+            if not process:
+                logger.debug("Frame #%s skipped by the motion gate (MAD=%.2f)",
+                             frame_num, self.motion_gate.mad, extra=PER_FRAME)
+                # The durations of the skipped frames are not recorded
+                self.metrics.pop_frame_durations()
+                self.frame_num += 1
+                return True
+
+        frame, gray = self._preprocess_frame(frame)
+
+        # Initialize the first/average frame in the video file/webcam stream
+        # NOTE 1: first frame can be used to model the background of the video
+        # stream. We assume that the first frame should not have motion, it
+        # should just contain background
+        # NOTE 2: the weighted mean of frames frame can also be used to model
+        # the background of the video stream
+        if self.background_model is None:
+            logger.debug("Starting background model ({})...".format(
+                         conf["background_model"]))
+            # NOTE: `gray` is copied since it can be a buffer that is reused
+            # by the next frame
+            self.background_model = self.background_model_cls(
+                gray.copy(), self._saving_cfg(),
+                **self.background_model_params)
+            self.metrics.pop_frame_durations()
+            return True
+
+        t = time.perf_counter()
+        frameDelta = self.background_model.get_frame_delta(gray)
+        self.metrics.record('get_frame_delta', t)
+        return self._detect_motion(frame, frameDelta)
+
+    # Same as `step()` but the frame deltas of up to `batch_size` frames are
+    # computed at once
+    def _step_batch(self):
+        conf = self.conf
+        if self.frame_num > conf["end_frame"]:
+            logger.info("Reached end of frames: frame # {}".format(
+                        self.frame_num))
+            self.finished = True
+            return False
+
+        frames = []
+        grays = []
+        end_of_video = False
+        for i in range(min(self.batch_size,
+                           conf["end_frame"] - self.frame_num + 1)):
+            # NOTE: the frames must be kept until the whole batch is read, thus
+            # they can't be buffers of the frame grabber
+            frame, gray = self._read_frame(batch_index=i)
+            if frame is None:
+                end_of_video = True
+                break
+            frames.append(frame)
+            grays.append(gray)
+
+        if frames:
+            t = time.perf_counter()
+            if self.buffers:
+                # The grayscale frames were written in the rows of a single
+                # buffer
+                grays = self.buffers.get(
+                    'gray_blurred_batch',
+                    (self.batch_size,) + grays[0].shape)[:len(grays)]
+            else:
+                grays = np.stack(grays)
+            frame_deltas = self.background_model.get_frame_deltas(grays)
+            # The time of the batch is shared equally by its frames
+            duration = (time.perf_counter() - t) / len(frames)
+            for frame, frameDelta in zip(frames, frame_deltas):
+                self.metrics.record_duration('get_frame_delta', duration)
+                logger.debug("Processing frame #%s", self.frame_num,
+                             extra=PER_FRAME)
+                if not self._detect_motion(frame, frameDelta):
+                    return False
+        return not end_of_video
+
+    # Saving configuration of the background model (for the background images)
+    def _saving_cfg(self):
+        return {'saved_folder': self.conf['saved_folder'],
+                'image_format': self.conf['image_format'],
+                'image_writer': self.image_writer,
+                'encoder': self.encoder}
+
+    # Grab the next frame. Return None at the end of the video.
+    def _grab_frame(self):
+        # Grab the current frame
+        # `grabbed` (bool): indicates if `frame` was successfully read from
+        # the buffer
+        t = time.perf_counter()
+        (grabbed, frame) = self.camera.read()
+        self.metrics.record('read', t)
+        if self.startup_time is None:
+            self.startup_time = time.perf_counter() - self._startup_start_time
+            logger.info("Startup to first frame: {:.1f} ms".format(
+                        self.startup_time * 1000))
+
+        # If the frame could not be grabbed, then we have reached the end of
+        # the video
+        if not grabbed:
+            logger.info("End of video")
+            self.finished = True
+            return None
+        self.num_frames_read += 1
+        return frame
+
+    # Read the next frame and prepare it for motion analysis. Return the frame
+    # and its preprocessed grayscale image, or (None, None) at the end of the
+    # video.
+    # NOTE: `batch_index` is the position of the frame in the current batch.
+    # The frames of a batch are all kept until the batch is processed.
+    def _read_frame(self, batch_index=None):
+        frame = self._grab_frame()
+        if frame is None:
+            return None, None
+        return self._preprocess_frame(frame, batch_index)
+
+    # Return the frame resized for display and its preprocessed grayscale
+    # image
+    def _preprocess_frame(self, frame, batch_index=None):
+        conf = self.conf
+        metrics = self.metrics
+        buffers = self.buffers
+        t = time.perf_counter()
+        raw_frame = frame
+
+        # Preprocessing: prepare current frame for motion analysis
+        # Resize the frame to 500 pixels wide, convert it to grayscale, and
+        # blur it
+        # NOTE: image width is used when image is resized. If width is 0, or
+        # if the image already has this width (e.g. the images resized by
+        # `ImageSequenceSource`), image will not be resized.
+        width = conf["resize_image_width"]
+        if width > 0 and frame.shape[1] != width:
+            if frame.shape[1] < width:
+                logger.debug("Image is being resized to a width (%s) that is "
+                             "greater than its actual width (%s)", width,
+                             frame.shape[1], extra=PER_FRAME)
+            if buffers:
+                # Same size as `imutils.resize()`
+                (h, w) = frame.shape[:2]
+                size = (width, int(h * width / float(w)))
+                frame = cv2.resize(
+                    frame, size, interpolation=cv2.INTER_AREA,
+                    dst=self._buffer('frame', (size[1], size[0]) +
+                                     frame.shape[2:], batch_index))
+            else:
+                frame = resize(frame, width=width)
+            t = metrics.record('resize', t)
+        elif batch_index is not None:
+            if buffers:
+                dst = self._buffer('frame', frame.shape, batch_index)
+                np.copyto(dst, frame)
+                frame = dst
+            else:
+                frame = frame.copy()
+        ksize = conf["gaussian_kernel_size"]
+        detection_cfg = conf["detection"]
+        if detection_cfg["width"] or detection_cfg["roi_rectangles"] or \
+                detection_cfg["roi_polygons"]:
+            # Only the ROI is converted to grayscale and blurred, at the
+            # detection scale
+            if self.region is None:
+                self.region = DetectionRegion(
+                    raw_frame.shape,
+                    detection_width=detection_cfg["width"],
+                    display_width=conf["resize_image_width"],
+                    rectangles=detection_cfg["roi_rectangles"],
+                    polygons=detection_cfg["roi_polygons"],
+                    ksize=(ksize["width"], ksize["height"]),
+                    reuse_buffers=bool(buffers),
+                    blur_options=self._blur_options())
+                logger.info("Motion detected on a {}x{} crop with a {}x{} "
+                            "Gaussian kernel".format(*self.region.crop_size,
+                                                     *self.region.ksize))
+            dst = None
+            if buffers:
+                dst = self._buffer('gray_blurred', self.region.crop_size[::-1],
+                                   batch_index)
+            gray = self.region.preprocess(raw_frame, dst=dst)
+            metrics.record('roi_preprocess', t)
+        elif buffers:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY,
+                                dst=buffers.get('gray', frame.shape[:2]))
+            t = metrics.record('cvtColor', t)
+            gray = self.blur.apply(
+                gray, dst=self._buffer('gray_blurred', gray.shape,
+                                       batch_index))
+            metrics.record('blur', t)
+        else:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            t = metrics.record('cvtColor', t)
+            gray = self.blur.apply(gray)
+            metrics.record('blur', t)
+        return frame, gray
+
+    # Return the buffer `name` of the given shape. The frames of a batch each
+    # have their own row in a buffer of `batch_size` rows.
+    def _buffer(self, name, shape, batch_index=None):
+        if batch_index is None:
+            return self.buffers.get(name, shape)
+        return self.buffers.get(name + '_batch',
+                                (self.batch_size,) + shape)[batch_index]
+
+    # Find the moving objects given the frame delta, draw them on the frame,
+    # and save/show the images. Return False if the user asked to quit.
+    def _detect_motion(self, frame, frameDelta):
+        conf = self.conf
+        metrics = self.metrics
+        frame_num = self.frame_num
+        boxes_cfg = conf["boxes"]
+        text = "Unoccupied"  # No activity in the room
+
+        # =====================================================================
+        #              Start of motion detection and tracking
+        # =====================================================================
+        min_area = conf["min_area"]
+        if self.region:
+            # Ignore the motion outside the ROI
+            frameDelta = self.region.apply_mask(frameDelta)
+            min_area = self.region.detection_area(min_area)
+
+        # Threshold the delta image, dilate the thresholded image to fill
+        # in holes, then find the moving regions on thresholded image
+        t = time.perf_counter()
+        buffers = self.buffers
+        if buffers:
+            shape = frameDelta.shape
+            _, thresh = cv2.threshold(frameDelta, conf["delta_thresh"], 255,
+                                      cv2.THRESH_BINARY,
+                                      dst=buffers.get('thresh', shape))
+            t = metrics.record('threshold', t)
+            thresh = dilate(thresh, iterations=2,
+                            single_pass=conf["filters"]["single_pass_dilation"],
+                            dst=buffers.get('dilated', shape))
+            t = metrics.record('dilate', t)
+        else:
+            _, thresh = cv2.threshold(frameDelta,
+                                      conf["delta_thresh"],
+                                      255,
+                                      cv2.THRESH_BINARY)
+            t = metrics.record('threshold', t)
+            thresh = dilate(thresh, iterations=2,
+                            single_pass=conf["filters"]["single_pass_dilation"])
+            t = metrics.record('dilate', t)
+        if boxes_cfg["extraction"] == 'components':
+            # Boxes and areas of all the regions in one call
+            boxes, areas = component_boxes(thresh, min_area)
+            t = metrics.record('components', t)
+        else:
+            contours_image = thresh
+            if not buffers:
+                contours_image = thresh.copy()
+            elif FIND_CONTOURS_MODIFIES_SOURCE:
+                contours_image = buffers.get('contours', thresh.shape)
+                np.copyto(contours_image, thresh)
+            # NOTE: `findContours()` returns 3 values in OpenCV 3 but 2 values
+            # in OpenCV 4, the contours are always the second to last
+            cnts = cv2.findContours(contours_image, cv2.RETR_EXTERNAL,
+                                    cv2.CHAIN_APPROX_SIMPLE)[-2]
+            # `min-area`: minimum size (pixels) for a region of an image to be
+            # considered actual “motion”
+            boxes, areas = contour_boxes(cnts, min_area)
+            t = metrics.record('findContours', t)
+        if boxes_cfg["merge"] != 'none':
+            boxes, areas = merge_boxes(boxes, areas, boxes_cfg["merge"],
+                                       boxes_cfg["merge_distance"],
+                                       boxes_cfg["nms_iou_threshold"])
+            t = metrics.record('merge', t)
+
+        # Map the bounding boxes onto the displayed frame and draw them
+        if self.region:
+            boxes = self.region.to_display_boxes(boxes)
+        num_boxes = len(boxes)
+        if num_boxes:
+            text = "Occupied"
+        draw_boxes(frame, boxes)
+        self.detections = make_detections(frame_num, boxes, areas)
+        if self.detection_writer:
+            self.detection_writer.write(self.detections)
+
+        if self.region and conf["detection"]["draw_roi"]:
+            self.region.draw(frame, conf["detection"]["roi_rectangles"],
+                             conf["detection"]["roi_polygons"])
+
+        # Draw the text (top left), timestamp (bottom left), and frame #
+        # (top right) on the current frame
+        # TODO: add as option the "Room Status" message
+        # cv2.putText(frame, "Room Status: {}".format(text), (10, 20),
+        #             cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+        if conf["show_datetime"]:
+            datetime_now = datetime.datetime.now()
+            # TODO: remove the following
+            datetime_now = datetime_now.replace(hour=15)
+            cv2.putText(frame,
+                        datetime_now.strftime("%A %d %B %Y %I:%M:%S%p"),
+                        (10, frame.shape[0] - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX,
+                        0.35,
+                        (0, 0, 255),
+                        1)
+        cv2.putText(frame,
+                    "Frame # {}".format(frame_num),
+                    (frame.shape[1] - 90, 20),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.35,
+                    (0, 0, 255),
+                    1)
+        t = metrics.record('drawing', t)
+
+        # Assign the ID of its track to each bounding box
+        track_ids = None
+        if self.tracker:
+            track_ids = self.tracker.update(boxes)
+            if conf["tracking"]["draw_ids"]:
+                for (x, y, w, h), track_id in zip(boxes.tolist(),
+                                                  track_ids):
+                    if track_id:
+                        cv2.putText(frame, "#{}".format(track_id),
+                                    (x, max(y - 5, 10)),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.4,
+                                    (0, 255, 0), 1)
+            if self.trajectory_writer:
+                self.trajectory_writer.write(frame_num, track_ids, boxes)
+            t = metrics.record('tracking', t)
+
+        # Add the annotated frame to the current motion event (if any)
+        if self.event_recorder:
+            self.event_recorder.update(frame, frame_num, text == "Occupied",
+                                       num_boxes)
+            t = metrics.record('events', t)
+
+        # NOTE: path to the folder where three sets of images (security feed,
+        # thresold and frame delta) will be saved
+        if conf["saved_folder"]:
+            image_sets = {'security_feed': frame,
+                          'thresh': thresh,
+                          'frame_delta': frameDelta}
+            for iname, image in image_sets.items():
+                if iname in self.archives:
+                    self.archives[iname].write(frame_num, image)
+                elif conf["save_{}_images".format(iname)]:
+                    inum = "{0:06d}".format(frame_num)
+                    image_format, params = self.encoder.params(iname)
+                    fname = "{}_{}.{}".format(iname,
+                                              inum,
+                                              image_format)
+                    fname = os.path.join(conf["saved_folder"], iname, fname)
+                    if self.image_writer:
+                        self.image_writer.write(fname, image, params)
+                    else:
+                        write_image(fname, image, params=params)
+                else:
+                    logger.debug("%s image not saved: frame # %s", iname,
+                                 frame_num, extra=PER_FRAME)
+            # The encoder effort is lowered if the writing is saturated
+            self.encoder.update(
+                self.image_writer.occupancy() if self.image_writer else None,
+                (time.perf_counter() - t) * 1000)
+            t = metrics.record('writing', t)
+
+        # Publish the frames to the live preview, only if someone is watching
+        # and at most `max_fps` times per second
+        if self.preview and self.preview.ready():
+            self.preview.publish({'security_feed': frame,
+                                  'thresh': thresh,
+                                  'frame_delta': frameDelta})
+            t = metrics.record('preview', t)
+
+        # Check to see if the frames should be displayed to screen, at most
+        # `display_max_fps` times per second
+        if conf["show_video"] and \
+                time.perf_counter() - self._last_display_time >= \
+                self._display_interval():
+            self._last_display_time = time.perf_counter()
+            # Show the frame and record if the user presses a key
+            try:
+                cv2.imshow(self._window_name("Security Feed"), frame)
+                cv2.imshow(self._window_name("Thresh"), thresh)
+                cv2.imshow(self._window_name("Frame Delta"), frameDelta)
+                key = cv2.waitKey(1) & 0xFF
+            except cv2.error as e:
+                # E.g. on a server without display, or OpenCV built without
+                # GUI support
+                logger.warning("The frames can't be shown on screen: {}. "
+                               "show_video is disabled (see the preview "
+                               "option)".format(str(e).strip()))
+                conf["show_video"] = False
+                key = None
+            metrics.record('display', t)
+
+            # If the `q` key is pressed, break from the loop
+            if key == ord("q"):
+                logger.info("Q key pressed. Quitting program ...")
+                return False
+
+        self.num_frames_processed += 1
+        metrics.frame_processed()
+        if self.frame_record_writer:
+            self.frame_record_writer.write(
+                frame_num, self.detections, text == "Occupied", track_ids,
+                metrics.pop_frame_durations())
+        if self.motion_gate:
+            self.motion_gate.report(text == "Occupied")
+
+        # Summary of the stage latencies, instead of one log line per frame
+        summary_interval = conf["metrics"]["summary_interval"]
+        if summary_interval and \
+                time.perf_counter() - self._last_summary_time >= \
+                summary_interval:
+            self.log_metrics_summary()
+            self._last_summary_time = time.perf_counter()
+
+        # Report the throughput of the frame grabber
+        grabber_cfg = conf["frame_grabber"]
+        if isinstance(self.camera, ThreadedFrameGrabber) and \
+                grabber_cfg["report_interval"] and \
+                not frame_num % grabber_cfg["report_interval"]:
+            self.log_grabber_stats()
+
+        # Update frame number
+        self.frame_num += 1
+        return True
+
+    # Write the images still in the queue, and release the camera. Can be
+    # called on a pipeline whose setup failed or wasn't done.
+    def close(self):
+        if self._end_time is not None:
+            return
+        self._end_time = time.perf_counter()
+        # NOTE: no frame was processed if the setup didn't complete
+        if self._start_time is not None:
+            self.log_processing_summary()
+        if self._owns_metrics_server:
+            self.metrics_server.stop()
+        if self.preview:
+            self.preview.close()
+            logger.info("Frames published to the preview: {}".format(
+                        self.preview.num_published))
+        if self._owns_preview_server:
+            self.preview_server.stop()
+
+        # Write the images still in the queue
+        if self.image_writer:
+            logger.info("Flushing image writer ...")
+            self.image_writer.close()
+            logger.info("Images queued: {queued}, written: {written}, "
+                        "dropped: {dropped}, failed: {failed}".format(
+                         **self.image_writer.counters))
+        if self.encoder and self.encoder.adaptive:
+            logger.info("Encoder effort lowered {} times".format(
+                        self.encoder.num_saturations))
+
+        if self.motion_gate:
+            gate = self.motion_gate
+            logger.info("Motion gate: {} of {} frames skipped ({:.0%}), {} "
+                        "motion onsets".format(
+                         gate.num_skipped, gate.num_frames,
+                         gate.num_skipped / max(1, gate.num_frames),
+                         gate.num_onsets))
+
+        # Write the images of the archives still in the buffer
+        for iname, archive in self.archives.items():
+            archive.close()
+            logger.info("{} archive: {} frames, {:.1f} MB".format(
+                        iname, archive.num_frames, archive.nbytes / 1e6))
+
+        # Write the trajectories still in the buffer
+        if self.trajectory_writer:
+            self.trajectory_writer.close()
+            logger.info("Number of tracks created: {}, trajectory records saved: "
+                        "{}".format(self.tracker.next_id - 1,
+                                    self.trajectory_writer.num_records))
+
+        # Write the boxes still in the buffer
+        if self.detection_writer:
+            self.detection_writer.close()
+            logger.info("Boxes saved: {}".format(
+                        self.detection_writer.num_records))
+
+        if self.frame_record_writer:
+            self.frame_record_writer.close()
+            logger.info("Frame records saved: {}".format(
+                        self.frame_record_writer.num_records))
+
+        # Close the clip of the current motion event
+        if self.event_recorder:
+            self.event_recorder.close()
+            logger.info("Number of motion events recorded: {}".format(
+                        self.event_recorder.num_events))
+
+        # Cleanup the camera and close any open windows
+        if self.camera is not None:
+            self.camera.release()
+        if self.conf["show_video"]:
+            cv2.destroyAllWindows()
+
+    # Return the throughput of the pipeline since `setup()` was called
+    def stats(self):
+        if self._start_time is None:
+            elapsed = 0.0
+        else:
+            end_time = self._end_time or time.perf_counter()
+            elapsed = end_time - self._start_time
+        return {
+            'name': self.name,
+            'frames_read': self.num_frames_read,
+            'frames_processed': self.num_frames_processed,
+            'frames_skipped': self.motion_gate.num_skipped
+            if self.motion_gate else 0,
+            'elapsed': elapsed,
+            'fps': self.num_frames_processed / elapsed if elapsed else 0.0,
+            'startup_time': self.startup_time
+        }
+
+    def log_processing_summary(self):
+        logger.info("End of images/video processing")
+        logger.info("Number of frames processed: {}".format(
+                    self.frame_num - self.conf["start_frame"]))
+        if isinstance(self.camera, ThreadedFrameGrabber):
+            self.log_grabber_stats()
+        source = getattr(self.camera, 'camera', self.camera)
+        if isinstance(source, ReconnectingSource):
+            logger.info("Reconnections: {}, stale frames drained: {}".format(
+                        source.num_reconnects, source.num_drained))
+        if isinstance(source, ImageSequenceSource) and source.frame_cache:
+            cache = source.frame_cache
+            logger.info("Frame cache: {} hits, {} misses, {:.1f} MB".format(
+                        cache.num_hits, cache.num_misses, cache.nbytes / 1e6))
+        if self.metrics.num_frames:
+            self.log_metrics_summary()
+
+    def log_grabber_stats(self):
+        stats = self.camera.stats()
+        logger.info("Decode FPS: {:.1f}, processing FPS: {:.1f}, buffer "
+                    "occupancy: {:.0%}, frames dropped: {}".format(
+                     stats['decode_fps'], stats['processing_fps'],
+                     stats['occupancy'], stats['dropped']))
+
+    def log_metrics_summary(self):
+        prefix = "[{}] ".format(self.name) if self.name else ""
+        logger.info("{}{}".format(prefix, self.metrics.summary()))
+
+    # Options of `Blur` (besides the kernel size) from the `filters` option
+    def _blur_options(self):
+        filters_cfg = self.conf["filters"]
+        return {'mode': filters_cfg["blur_mode"],
+                'num_boxes': filters_cfg["num_boxes"],
+                'pyramid_levels': filters_cfg["pyramid_levels"]}
+
+    # Minimum time between two frames shown on screen
+    def _display_interval(self):
+        max_fps = self.conf["display_max_fps"]
+        return 1 / max_fps if max_fps else 0.0
+
+    # Windows are suffixed with the name of the pipeline so that several
+    # pipelines can display their frames at the same time
+    def _window_name(self, title):
+        if self.name:
+            return "{} ({})".format(title, self.name)
+        return title
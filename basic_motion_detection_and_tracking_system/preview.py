@@ -0,0 +1,216 @@
+"""
+Live preview of the pipelines in a browser, without any window
+
+The processing loop hands its annotated frames to a `PreviewPublisher`, which
+keeps only the newest ones, at most `max_fps` times per second and only while
+someone is watching. They are JPEG-encoded in a separate thread, so the loop
+never waits on the encoding or on the viewers. A `PreviewServer` serves the
+frames of the publishers of a process over HTTP:
+- `/`: page showing the streams of all the pipelines
+- `/<stream>/<image>.mjpg`: MJPEG stream (`multipart/x-mixed-replace`), e.g.
+  `/main/security_feed.mjpg`
+- `/<stream>/<image>.jpg`: newest frame
+"""
+import html
+import logging
+import os
+import threading
+import time
+# Third-party modules
+import cv2
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+PREVIEW_IMAGES = ['security_feed', 'thresh', 'frame_delta']
+BOUNDARY = 'frame'
+
+
+class PreviewPublisher:
+    def __init__(self, images=('security_feed',), max_fps=10, jpeg_quality=70):
+        if max_fps <= 0 or not 0 <= jpeg_quality <= 100:
+            raise ValueError("max_fps should be positive and jpeg_quality "
+                             "between 0 and 100")
+        self.images = list(images)
+        self.interval = 1 / max_fps
+        self.jpeg_quality = jpeg_quality
+        self._cond = threading.Condition()
+        # Frames waiting to be encoded, and newest JPEG of each image
+        self._pending = None
+        self._jpegs = {}
+        # Incremented each time new JPEGs are available
+        self.seq = 0
+        self.num_viewers = 0
+        self.num_published = 0
+        self._last_publish = 0.0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run,
+                                        name="preview-encoder", daemon=True)
+        self._thread.start()
+
+    # Return True if the next frames should be published: someone is watching
+    # and the last frames were published more than `1 / max_fps` seconds ago.
+    # Cheap enough to be called on every frame.
+    def ready(self):
+        return self.num_viewers > 0 and \
+            time.perf_counter() - self._last_publish >= self.interval
+
+    # Hand the newest frames (`dict` image name -> image) to the encoder. The
+    # images are copied since the loop reuses its buffers. Frames that were not
+    # encoded yet are replaced.
+    def publish(self, images):
+        self._last_publish = time.perf_counter()
+        pending = {name: images[name].copy() for name in self.images}
+        with self._cond:
+            self._pending = pending
+            self.num_published += 1
+            self._cond.notify_all()
+
+    # Wait for JPEGs newer than `seq`. Return (seq, JPEG of `image`), or
+    # (seq, None) after `timeout` seconds or if the publisher is closed.
+    def next_jpeg(self, image, seq, timeout=None):
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._stopped or
+                (self.seq > seq and image in self._jpegs), timeout)
+            return self.seq, self._jpegs.get(image) if self.seq > seq \
+                else None
+
+    def add_viewer(self):
+        with self._cond:
+            self.num_viewers += 1
+
+    def remove_viewer(self):
+        with self._cond:
+            self.num_viewers -= 1
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopped or self._pending is not None)
+                if self._stopped:
+                    return
+                pending, self._pending = self._pending, None
+            jpegs = {}
+            for name, image in pending.items():
+                encoded, buf = cv2.imencode('.jpg', image, params)
+                if encoded:
+                    jpegs[name] = buf.tobytes()
+            with self._cond:
+                self._jpegs.update(jpegs)
+                self.seq += 1
+                self._cond.notify_all()
+
+
+class PreviewServer:
+    """Local HTTP server of the previews of several pipelines."""
+
+    def __init__(self, host='127.0.0.1', port=8080):
+        self.host = host
+        self.port = port
+        self._publishers = {}
+        self._server = None
+        self._thread = None
+
+    def add(self, stream, publisher):
+        self._publishers[stream] = publisher
+
+    def render_index(self):
+        rows = []
+        for stream, publisher in list(self._publishers.items()):
+            stream = html.escape(stream)
+            imgs = "".join(
+                '<img src="/{0}/{1}.mjpg" title="{0}: {1}">'.format(
+                    stream, image) for image in publisher.images)
+            rows.append("<h2>{}</h2><div>{}</div>".format(stream, imgs))
+        return ("<!DOCTYPE html><html><head><title>Motion detection preview"
+                "</title></head><body>{}</body></html>".format("".join(rows)))
+
+    def start(self):
+        # NOTE: imported here since it is slow to import and only needed
+        # when the server is used
+        from http.server import BaseHTTPRequestHandler
+        from utilities.http_server import ThreadingHTTPServer
+        preview_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/':
+                    self._send(preview_server.render_index().encode('utf-8'),
+                               'text/html; charset=utf-8')
+                    return
+                parts = self.path.strip('/').split('/')
+                publisher = None
+                if len(parts) == 2:
+                    publisher = preview_server._publishers.get(parts[0])
+                    image, ext = os.path.splitext(parts[1])
+                if publisher is None or image not in publisher.images or \
+                        ext not in ['.jpg', '.mjpg']:
+                    self.send_error(404)
+                    return
+                publisher.add_viewer()
+                try:
+                    if ext == '.jpg':
+                        _, jpeg = publisher.next_jpeg(image, 0, timeout=5)
+                        if jpeg is None:
+                            self.send_error(503)
+                        else:
+                            self._send(jpeg, 'image/jpeg')
+                    else:
+                        self._stream(publisher, image)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The viewer left
+                    pass
+                finally:
+                    publisher.remove_viewer()
+
+            def _send(self, body, content_type):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, publisher, image):
+                self.send_response(200)
+                self.send_header(
+                    'Content-Type',
+                    'multipart/x-mixed-replace; boundary={}'.format(BOUNDARY))
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                seq = 0
+                while True:
+                    seq, jpeg = publisher.next_jpeg(image, seq)
+                    if jpeg is None:
+                        # The publisher was closed
+                        return
+                    self.wfile.write(
+                        "--{}\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                        "{}\r\n\r\n".format(BOUNDARY, len(jpeg)).encode())
+                    self.wfile.write(jpeg)
+                    self.wfile.write(b"\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="preview-server", daemon=True)
+        self._thread.start()
+        logger.info("Preview served on http://{}:{}/".format(
+                    self.host, self._server.server_address[1]))
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,225 @@
+"""
+Compact binary storage of the thresholded and 'frame delta' images
+
+Instead of one PNG/JPEG file per frame, the images of a set (e.g. `thresh`)
+are stored in two files:
+- `<set>.data`: the encoded images, appended one after the other. The masks
+  are bit-packed (1 bit per pixel, then optionally zlib-compressed) and the
+  'frame delta' images are zlib-compressed.
+- `<set>.index`: a header followed by one fixed-size record per frame number
+  (offset and size of its image in the data file, height and width). The
+  record of frame `n` is at position `n - first_frame`, so reading any frame
+  is a lookup in the memory-mapped index followed by a slice of the
+  memory-mapped data file, without scanning anything. Frames that were not
+  stored have a record of size 0.
+
+The data is always written before the index records pointing to it, so that
+the archive stays readable if the process is killed.
+"""
+import os
+import zlib
+# Third-party modules
+import numpy as np
+
+ARCHIVE_MAGIC = b'MDARCH01'
+CODECS = ['raw', 'zlib', 'packbits', 'packbits_zlib']
+# Codecs that only keep whether each pixel is 0 or not
+MASK_CODECS = ['packbits', 'packbits_zlib']
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('codec', 'S16'),
+                         ('first_frame', '<i8')])
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('size', '<u4'),
+                        ('height', '<u2'), ('width', '<u2')])
+
+
+# Return the paths of the data and index files of the archive `path` (path
+# without extension, e.g. `.../thresh`)
+def archive_paths(path):
+    return path + '.data', path + '.index'
+
+
+def encode_image(image, codec, level=1):
+    if codec in MASK_CODECS:
+        data = np.packbits(image, axis=None)
+        if codec == 'packbits_zlib':
+            return zlib.compress(data, level)
+        return data.tobytes()
+    if codec == 'zlib':
+        return zlib.compress(np.ascontiguousarray(image), level)
+    return np.ascontiguousarray(image).tobytes()
+
+
+# Return the image (uint8, height x width) decoded from `data`. Masks are
+# decoded with the values 0 and 255.
+def decode_image(data, codec, height, width):
+    if codec in ['zlib', 'packbits_zlib']:
+        data = zlib.decompress(data)
+    data = np.frombuffer(data, np.uint8)
+    if codec in MASK_CODECS:
+        mask = np.unpackbits(data, count=height * width)
+        return (mask * 255).reshape(height, width)
+    return data.reshape(height, width)
+
+
+class ArchiveWriter:
+    """Append the images of one set to an archive (see the module docstring).
+
+    The images must be single-channel uint8 images. The encoded images and
+    their index records are buffered and written every `flush_interval`
+    frames.
+
+    If `state` (from `get_state()`) is given, the writer continues an existing
+    archive, whose files are first truncated to their size at the time of
+    `state`.
+    """
+
+    def __init__(self, path, codec, level=1, flush_interval=100, state=None):
+        if codec not in CODECS:
+            raise ValueError("Unknown codec: {}".format(codec))
+        self.path = path
+        self.codec = codec
+        self.level = level
+        self.flush_interval = flush_interval
+        data_path, index_path = archive_paths(path)
+        if state:
+            self.first_frame = state['first_frame']
+            self.num_frames = state['num_frames']
+            self._data_file = open(data_path, 'r+b')
+            self._index_file = open(index_path, 'r+b')
+            for f, size in [(self._data_file, state['data_size']),
+                            (self._index_file, state['index_size'])]:
+                f.truncate(size)
+                f.seek(0, os.SEEK_END)
+        else:
+            self.first_frame = None
+            self.num_frames = 0
+            self._data_file = open(data_path, 'wb')
+            self._index_file = open(index_path, 'wb')
+        self._offset = self._data_file.tell()
+        # Total size of the encoded images in bytes
+        self.nbytes = self._offset
+        self._chunks = []
+        # Index records not written yet: slot of the first one and records
+        self._pending_slot = None
+        self._pending = []
+
+    def write(self, frame_num, image):
+        if self.first_frame is None:
+            self.first_frame = frame_num
+            header = np.zeros(1, HEADER_DTYPE)
+            header[0] = (ARCHIVE_MAGIC, self.codec.encode(), frame_num)
+            self._index_file.write(header.tobytes())
+        slot = frame_num - self.first_frame
+        if self._pending_slot is not None and \
+                slot != self._pending_slot + len(self._pending):
+            # Not the next frame: write the records of the previous frames
+            # first
+            self.flush()
+        if slot < 0 or (self._pending_slot is None and
+                        slot < self._num_slots()):
+            raise ValueError("Frame #{} is already in the archive or before "
+                             "its first frame".format(frame_num))
+        data = encode_image(image, self.codec, self.level)
+        if self._pending_slot is None:
+            self._pending_slot = slot
+        self._pending.append((self._offset, len(data), image.shape[0],
+                              image.shape[1]))
+        self._chunks.append(data)
+        self._offset += len(data)
+        self.nbytes += len(data)
+        self.num_frames += 1
+        if len(self._pending) >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        self._data_file.write(b''.join(self._chunks))
+        self._data_file.flush()
+        records = np.array(self._pending, INDEX_DTYPE)
+        # NOTE: writing past the end of the index leaves zeros (size 0) in the
+        # slots of the skipped frames
+        self._index_file.seek(HEADER_DTYPE.itemsize +
+                              self._pending_slot * INDEX_DTYPE.itemsize)
+        self._index_file.write(records.tobytes())
+        self._index_file.flush()
+        self._chunks = []
+        self._pending = []
+        self._pending_slot = None
+
+    # Write the buffered images and return what is needed to continue the
+    # archive later (e.g. from a checkpoint)
+    def get_state(self):
+        self.flush()
+        # NOTE: the header can still be in the buffer of the index file
+        self._index_file.flush()
+        return {'first_frame': self.first_frame,
+                'num_frames': self.num_frames,
+                'data_size': self._data_file.tell(),
+                'index_size': self._index_file.tell()}
+
+    def close(self):
+        if not self._data_file.closed:
+            self.flush()
+            self._data_file.close()
+            self._index_file.close()
+
+    # Number of index records already written
+    def _num_slots(self):
+        return (self._index_file.tell() - HEADER_DTYPE.itemsize) // \
+            INDEX_DTYPE.itemsize
+
+
+class ArchiveReader:
+    """Random access to the images of an archive written by `ArchiveWriter`.
+
+    Both files are memory-mapped: `read()` decodes only the requested image.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        data_path, index_path = archive_paths(path)
+        header = np.fromfile(index_path, HEADER_DTYPE, count=1)
+        if len(header) == 0:
+            # Nothing was written to the archive
+            self.codec, self.first_frame = None, 0
+            self._index = np.zeros(0, INDEX_DTYPE)
+        else:
+            if header['magic'][0] != ARCHIVE_MAGIC:
+                raise ValueError("{} is not an archive index".format(
+                                 index_path))
+            self.codec = header['codec'][0].decode()
+            self.first_frame = int(header['first_frame'][0])
+            num_slots = (os.path.getsize(index_path) -
+                         HEADER_DTYPE.itemsize) // INDEX_DTYPE.itemsize
+            self._index = np.memmap(index_path, INDEX_DTYPE, 'r',
+                                    offset=HEADER_DTYPE.itemsize,
+                                    shape=(num_slots,)) \
+                if num_slots else np.zeros(0, INDEX_DTYPE)
+        self._data = np.memmap(data_path, np.uint8, 'r') \
+            if os.path.getsize(data_path) else np.zeros(0, np.uint8)
+
+    # Return the frame numbers stored in the archive, in increasing order
+    def frame_nums(self):
+        return np.flatnonzero(self._index['size']) + self.first_frame
+
+    def contains(self, frame_num):
+        slot = frame_num - self.first_frame
+        return 0 <= slot < len(self._index) and self._index[slot]['size'] > 0
+
+    # Return the image of frame `frame_num`, or None if it wasn't stored
+    def read(self, frame_num):
+        if not self.contains(frame_num):
+            return None
+        offset, size, height, width = \
+            self._index[frame_num - self.first_frame].tolist()
+        return decode_image(self._data[offset:offset + size], self.codec,
+                            height, width)
+
+    # Return the frame numbers and images of all the frames of the archive
+    def iter_frames(self):
+        for frame_num in self.frame_nums():
+            yield int(frame_num), self.read(frame_num)
+
+    def close(self):
+        # NOTE: the memory maps are closed when they are garbage collected
+        self._index = self._data = None
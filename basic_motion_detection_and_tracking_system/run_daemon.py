@@ -0,0 +1,81 @@
+"""
+Run the motion detection and tracking system as a daemon that processes the
+jobs submitted to a spool directory
+
+The worker processes are started once, with OpenCV imported and warmed up, so
+that a job (e.g. a short clip) starts processing frames right away instead of
+paying for the startup of `run_system.py`. See `job_daemon.py` for the format
+of the jobs and of the spool directory.
+
+Submit a job from Python with `job_daemon.submit_job()`, or write a JSON file
+in `<spool>/incoming/` (write it under another name first, then rename it).
+"""
+import argparse
+import json
+import logging.config
+import os
+import signal
+import sys
+# Own modules
+from job_daemon import JobDaemon
+from utilities.utils import setup_logging
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(os.path.basename(os.getcwd()),
+                                          os.path.splitext(__file__)[0]))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    # construct the argument parser and parse the arguments
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c",
+                    "--conf",
+                    required=True,
+                    help="path to the JSON configuration file, whose options "
+                         "are overridden by each job")
+    ap.add_argument("-s",
+                    "--spool",
+                    required=True,
+                    help="spool directory where the jobs are submitted")
+    ap.add_argument("-w",
+                    "--num-workers",
+                    type=int,
+                    default=0,
+                    help="number of worker processes, 0 for the number of "
+                         "available cores")
+    ap.add_argument("-p",
+                    "--poll-interval",
+                    type=float,
+                    default=0.2,
+                    help="seconds between two checks for new jobs")
+    args = vars(ap.parse_args())
+
+    # load the configuration file
+    conf = json.load(open(args["conf"]))
+
+    logger.info("Starting daemon")
+    if not conf["disable_logging"]:
+        # The daemon logs in the spool directory, and each job in its own
+        # output folder
+        logger.debug("Setup logging")
+        os.makedirs(args["spool"], exist_ok=True)
+        try:
+            setup_logging(conf["logging_conf_path"], args["spool"],
+                          append=True, use_queue=conf["async_logging"])
+        except (KeyError, OSError, ValueError) as e:
+            logger.error(e)
+            logger.warning("Logging couldn't be setup. The program will exit")
+            sys.exit(1)
+        else:
+            logger.info("Logging was setup successfully!")
+
+    daemon = JobDaemon(conf, args["spool"],
+                       num_workers=args["num_workers"],
+                       poll_interval=args["poll_interval"])
+    # Stop on Ctrl-C or `kill` once the running jobs are done
+    for signum in [signal.SIGINT, signal.SIGTERM]:
+        signal.signal(signum, lambda *_: daemon.stop())
+    daemon.run()
+
+    logger.info("End of daemon")
@@ -0,0 +1,79 @@
+"""
+Run the motion detection and tracking system on several video sources at once
+
+The base options are read from the main configuration file (e.g. `conf.json`)
+and the sources are defined in a streams file (e.g. `streams_conf.json`) where
+each stream can override any option of the base configuration.
+"""
+import argparse
+import json
+import logging.config
+import os
+import pathlib
+import sys
+# Own modules
+from multi_stream import MultiStreamRunner, build_stream_confs
+from pipeline import ConfigError
+from utilities.utils import setup_logging, timestamped, unique_foldername
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(os.path.basename(os.getcwd()),
+                                          os.path.splitext(__file__)[0]))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    # construct the argument parser and parse the arguments
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c",
+                    "--conf",
+                    required=True,
+                    help="path to the JSON configuration file")
+    ap.add_argument("-s",
+                    "--streams",
+                    required=True,
+                    help="path to the JSON file defining the streams")
+    args = vars(ap.parse_args())
+
+    # load the configuration files
+    conf = json.load(open(args["conf"]))
+    streams_conf = json.load(open(args["streams"]))
+
+    # Create 'main' directory for storing the results of all the streams: each
+    # stream has its own folder within it
+    main_folder = None
+    if conf["reports_dirpath"]:
+        main_folder = os.path.join(conf["reports_dirpath"],
+                                   timestamped("image_results"))
+        main_folder = unique_foldername(main_folder)
+        logger.debug("Creating folder {}".format(main_folder))
+        pathlib.Path(main_folder).mkdir(parents=True, exist_ok=True)
+
+    logger.info("Starting application")
+    if not conf["disable_logging"]:
+        logger.debug("Setup logging")
+        try:
+            setup_logging(conf["logging_conf_path"], main_folder,
+                          use_queue=conf["async_logging"])
+        except (KeyError, OSError, ValueError) as e:
+            logger.error(e)
+            logger.warning("Logging couldn't be setup. The program will exit")
+            sys.exit(1)
+        else:
+            logger.info("Logging was setup successfully!")
+
+    try:
+        stream_confs = build_stream_confs(conf, streams_conf["streams"])
+        runner = MultiStreamRunner(
+            stream_confs,
+            num_workers=streams_conf["num_workers"],
+            main_folder=main_folder,
+            report_interval=streams_conf["report_interval"])
+    except ConfigError as e:
+        logger.error(e)
+        logger.warning("Program will exit")
+        sys.exit(1)
+
+    runner.run()
+
+    logger.info("End of application")
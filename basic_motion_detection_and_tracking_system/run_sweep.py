@@ -0,0 +1,102 @@
+"""
+Evaluate a grid of parameter sets of the motion detection on one video
+
+The base options (video, resizing, options not swept) are read from the main
+configuration file (e.g. `conf.json`) and the grid from a sweep file (e.g.
+`sweep_conf.json`). The video is decoded once, see `sweep.py`. The summary of
+each parameter set (frames with motion, motion events, runtime) is printed and
+saved in `sweep_results.csv`.
+"""
+import argparse
+import json
+import logging.config
+import os
+import pathlib
+import sys
+import tempfile
+# Own modules
+from pipeline import ConfigError
+from sweep import FrameCache, ParameterSweep, write_summaries
+from utilities.utils import setup_logging, timestamped, unique_foldername
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(os.path.basename(os.getcwd()),
+                                          os.path.splitext(__file__)[0]))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    # construct the argument parser and parse the arguments
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c",
+                    "--conf",
+                    required=True,
+                    help="path to the JSON configuration file")
+    ap.add_argument("-s",
+                    "--sweep",
+                    required=True,
+                    help="path to the JSON file defining the parameter grid")
+    args = vars(ap.parse_args())
+
+    # load the configuration files
+    conf = json.load(open(args["conf"]))
+    sweep_conf = json.load(open(args["sweep"]))
+
+    # Create 'main' directory for storing the results of the sweep
+    main_folder = None
+    if conf["reports_dirpath"]:
+        main_folder = os.path.join(conf["reports_dirpath"],
+                                   timestamped("sweep_results"))
+        main_folder = unique_foldername(main_folder)
+        logger.debug("Creating folder {}".format(main_folder))
+        pathlib.Path(main_folder).mkdir(parents=True, exist_ok=True)
+
+    logger.info("Starting application")
+    if not conf["disable_logging"]:
+        logger.debug("Setup logging")
+        try:
+            setup_logging(conf["logging_conf_path"], main_folder,
+                          use_queue=conf["async_logging"])
+        except (KeyError, OSError, ValueError) as e:
+            logger.error(e)
+            logger.warning("Logging couldn't be setup. The program will exit")
+            sys.exit(1)
+        else:
+            logger.info("Logging was setup successfully!")
+
+    # The cached frames are kept for the next sweeps only if a cache folder is
+    # given
+    temp_dir = None
+    cache_folder = sweep_conf["cache_dirpath"]
+    if not cache_folder:
+        temp_dir = tempfile.TemporaryDirectory(prefix="sweep_cache_")
+        cache_folder = temp_dir.name
+    pathlib.Path(cache_folder).mkdir(parents=True, exist_ok=True)
+
+    try:
+        sweep = ParameterSweep(conf, sweep_conf["grid"],
+                               FrameCache(cache_folder, conf),
+                               num_workers=sweep_conf["num_workers"])
+        summaries = sweep.run()
+    except ConfigError as e:
+        logger.error(e)
+        logger.warning("Program will exit")
+        sys.exit(1)
+    finally:
+        if temp_dir:
+            temp_dir.cleanup()
+
+    logger.info("{:>18} {:>8} {:>6} {:>8} {:>14} {:>7} {:>9} {:>8}".format(
+                "model", "kernel", "delta", "min_area", "motion frames",
+                "events", "runtime", "FPS"))
+    for s in summaries:
+        logger.info("{background_model:>18} {gaussian_kernel_size:>8} "
+                    "{delta_thresh:>6} {min_area:>8} {motion_frames:>6} "
+                    "({motion_ratio:>5.1%}) {events:>7} {runtime:>8.2f}s "
+                    "{fps:>8.1f}".format(**s))
+    if main_folder:
+        write_summaries(summaries, os.path.join(main_folder,
+                                                "sweep_results.csv"))
+        logger.info("Summaries saved in {}".format(main_folder))
+
+    logger.info("End of application")
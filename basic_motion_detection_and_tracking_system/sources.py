@@ -0,0 +1,164 @@
+"""
+Live video sources: network streams (RTSP, HTTP MJPEG, ...) and capture devices
+
+`ReconnectingSource` wraps a `cv2.VideoCapture`. When a frame can't be read,
+the capture is opened again with an exponential backoff instead of ending the
+processing. Right after a reconnection, the frames already buffered by the
+capture are old: they are drained so that the latency stays bounded.
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+# Third-party modules
+import cv2
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+
+# Return the URL without the password (if any), for logging
+def redact_url(url):
+    parts = urlsplit(url)
+    if not parts.password:
+        return url
+    netloc = "{}:***@{}".format(parts.username, parts.hostname)
+    if parts.port:
+        netloc += ":{}".format(parts.port)
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+# Open a capture on a device index (int) or a stream URL (str). `timeout` (ms)
+# bounds the time spent opening the stream and waiting for a frame, if
+# supported by the OpenCV version (4.5.2 and later).
+def open_capture(source, timeout=0):
+    # NOTE: the constructor with parameters doesn't exist in older versions
+    # of OpenCV, it is only used for the timeouts
+    if isinstance(source, int) or timeout <= 0 or \
+            not hasattr(cv2, 'CAP_PROP_OPEN_TIMEOUT_MSEC') or \
+            not hasattr(cv2, 'CAP_PROP_READ_TIMEOUT_MSEC'):
+        return cv2.VideoCapture(source)
+    params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout,
+              cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout]
+    return cv2.VideoCapture(source, cv2.CAP_ANY, params)
+
+
+class ReconnectingSource:
+    """Capture of a live source that reconnects when reading fails.
+
+    Same interface as `cv2.VideoCapture` for what the pipeline uses (`read()`,
+    `grab()`, `get()`, `set()`, `isOpened()` and `release()`). After
+    `max_attempts` failed reconnections (0 means no limit), `read()` returns
+    (False, None) like at the end of a video.
+    """
+
+    def __init__(self, source, initial_delay=0.5, max_delay=30.0,
+                 max_attempts=0, timeout=5000, drain_max_frames=100):
+        self.source = source
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.drain_max_frames = drain_max_frames
+        self.num_reconnects = 0
+        self.num_drained = 0
+        # Set when the source is released, to stop waiting to reconnect
+        self._released = threading.Event()
+        # True if a frame was grabbed (but not retrieved) while draining
+        self._pending_frame = False
+        self.capture = open_capture(source, timeout)
+        if not self.capture.isOpened():
+            logger.warning("{} couldn't be opened, it will be retried".format(
+                           self.description))
+
+    @property
+    def description(self):
+        if isinstance(self.source, int):
+            return "Device {}".format(self.source)
+        return "Stream {}".format(redact_url(self.source))
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self, image=None):
+        while not self._released.is_set():
+            if self.capture.isOpened():
+                if self._pending_frame:
+                    self._pending_frame = False
+                    grabbed, frame = self.capture.retrieve(image)
+                else:
+                    grabbed, frame = self.capture.read(image)
+                if grabbed:
+                    return True, frame
+                logger.warning("%s couldn't be read", self.description)
+            if not self._reconnect():
+                break
+        return False, None
+
+    def grab(self):
+        self._pending_frame = False
+        return self.capture.grab()
+
+    def get(self, prop_id):
+        return self.capture.get(prop_id)
+
+    def set(self, prop_id, value):
+        return self.capture.set(prop_id, value)
+
+    # Stop waiting to reconnect, e.g. so that a thread blocked in `read()`
+    # returns
+    def interrupt(self):
+        self._released.set()
+
+    def release(self):
+        self._released.set()
+        self.capture.release()
+
+    # Open the capture again, waiting longer after each failed attempt. Return
+    # False if all the attempts failed or the source was released.
+    def _reconnect(self):
+        self.capture.release()
+        delay = self.initial_delay
+        attempt = 0
+        while not self.max_attempts or attempt < self.max_attempts:
+            attempt += 1
+            logger.info("Reconnecting to {} in {:.1f} s (attempt {})".format(
+                        self.description, delay, attempt))
+            if self._released.wait(delay):
+                return False
+            self.capture = open_capture(self.source, self.timeout)
+            if self.capture.isOpened():
+                self.num_reconnects += 1
+                num_drained = self._drain()
+                logger.info("Reconnected to {} ({} stale frames "
+                            "drained)".format(self.description, num_drained))
+                return True
+            self.capture.release()
+            delay = min(delay * 2, self.max_delay)
+        if not self._released.is_set():
+            logger.error("Couldn't reconnect to {} after {} attempts".format(
+                         self.description, attempt))
+        return False
+
+    # Skip the frames buffered by the capture: they are returned immediately,
+    # whereas the next live frame takes about a frame interval to arrive. The
+    # last frame grabbed is retrieved by the next `read()`. Return the number
+    # of frames skipped.
+    def _drain(self):
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        # Half a frame interval
+        threshold = 0.5 / fps if 0 < fps < 1000 else 0.01
+        num_grabbed = 0
+        for i in range(self.drain_max_frames):
+            start = time.perf_counter()
+            if not self.capture.grab():
+                break
+            num_grabbed += 1
+            # NOTE: the first grab also includes the time to set up the stream
+            if i and time.perf_counter() - start >= threshold:
+                break
+        self._pending_frame = num_grabbed > 0
+        num_drained = max(0, num_grabbed - 1)
+        self.num_drained += num_drained
+        return num_drained
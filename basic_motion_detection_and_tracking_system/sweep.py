@@ -0,0 +1,387 @@
+"""
+Parameter sweep: evaluate many configurations of the motion detection on the
+same video without decoding it again for each of them
+
+The frames are decoded, resized and converted to grayscale once, and stored in
+a memory-mapped file of the cache folder. They are then blurred once per
+Gaussian kernel of the grid, into another memory-mapped file per kernel, which
+all the worker processes read through the page cache.
+
+The parameter sets sharing the same kernel and background model are evaluated
+in the same pass over the frames: the frame deltas are computed once, and the
+thresholded image and its regions once per `delta_thresh`. A frame has motion
+for `min_area` if its largest region is at least `min_area` big, like in the
+processing loop of the pipeline, so all the values of `min_area` cost nothing
+more.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import itertools
+import json
+import logging
+import math
+import os
+import time
+# Third-party modules
+import cv2
+from imutils import resize
+import numpy as np
+# Own modules
+from background_models.registry import ModelNotFoundError, get_model, \
+    load_plugins
+from detections import EXTRACTION_METHODS
+from fast_filters import BLUR_MODES, Blur, dilate
+from frame_seek import seek
+from pipeline import ConfigError, merge_conf, open_camera
+from utilities.utils import available_cores
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+# Options that can be swept
+SWEEP_PARAMS = ['background_model', 'gaussian_kernel_size', 'delta_thresh',
+                'min_area']
+SUMMARY_FIELDS = ['background_model', 'gaussian_kernel_size', 'delta_thresh',
+                  'min_area', 'motion_frames', 'motion_ratio', 'events',
+                  'runtime', 'fps']
+# Options that change the cached grayscale frames
+_CACHE_KEY_OPTIONS = ['video_filepath', 'image_dirpath', 'resize_image_width',
+                      'start_frame', 'end_frame']
+
+
+# Return the list of parameter sets of the grid, e.g. {"delta_thresh": [5, 10],
+# "min_area": [500]}, one `dict` per combination of values
+def build_param_sets(grid):
+    for name, values in grid.items():
+        if name not in SWEEP_PARAMS:
+            raise ConfigError("Option {} can't be swept. Choices are "
+                              "{}".format(name, SWEEP_PARAMS))
+        if not isinstance(values, list) or not values:
+            raise ConfigError("Values of {} should be a non-empty list".format(
+                              name))
+    names = list(grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*grid.values())]
+
+
+def kernel_name(ksize):
+    return "{}x{}".format(ksize["width"], ksize["height"])
+
+
+# Return the number of motion events in the `occupied` flags of the frames. An
+# event ends after `post_roll` frames without motion, like in
+# `event_recorder.EventRecorder`.
+def count_events(occupied, post_roll):
+    indices = np.flatnonzero(occupied)
+    if not len(indices):
+        return 0
+    return 1 + int(np.count_nonzero(np.diff(indices) - 1 >= post_roll))
+
+
+def write_summaries(summaries, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+
+class FrameCache:
+    """Grayscale frames of a video, decoded once and memory-mapped.
+
+    The folder holds `gray.npy` (N x H x W), one `blurred_<w>x<h>.npy` per
+    Gaussian kernel (suffixed with the blur mode if the Gaussian blur is
+    approximated, see the `filters` option), and `cache.json` with the options the frames depend on,
+    so that a cache folder is reused by the next sweeps of the same video.
+    """
+
+    def __init__(self, folder, conf):
+        self.folder = folder
+        self.conf = conf
+        self.key = {k: conf[k] for k in _CACHE_KEY_OPTIONS}
+        self._meta_path = os.path.join(folder, 'cache.json')
+        self.meta = {}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            if meta['key'] == self.key:
+                self.meta = meta
+            else:
+                logger.info("The cache folder {} is for other frames, they "
+                            "will be decoded again".format(folder))
+
+    @property
+    def gray_path(self):
+        return os.path.join(self.folder, 'gray.npy')
+
+    def blurred_path(self, ksize):
+        return os.path.join(self.folder,
+                            'blurred_{}.npy'.format(self.blur_name(ksize)))
+
+    # Return the name of the blurred frames of the kernel `ksize`
+    def blur_name(self, ksize):
+        filters_cfg = self.conf["filters"]
+        mode = filters_cfg["blur_mode"]
+        if mode == 'gaussian':
+            return kernel_name(ksize)
+        param = filters_cfg["pyramid_levels"] if mode == 'pyramid' \
+            else filters_cfg["num_boxes"]
+        return "{}_{}{}".format(kernel_name(ksize), mode, param)
+
+    # Options of `fast_filters.Blur` (besides the kernel size)
+    def blur_options(self):
+        filters_cfg = self.conf["filters"]
+        return {'mode': filters_cfg["blur_mode"],
+                'num_boxes': filters_cfg["num_boxes"],
+                'pyramid_levels': filters_cfg["pyramid_levels"]}
+
+    @property
+    def num_frames(self):
+        return self.meta['shape'][0]
+
+    # Decode the frames and store them in grayscale, unless they are already
+    # in the cache
+    def decode(self):
+        if self.meta and os.path.exists(self.gray_path):
+            logger.info("Using the {} cached frames of {}".format(
+                        self.num_frames, self.folder))
+            return
+        conf = self.conf
+        start = time.perf_counter()
+        camera = open_camera(conf)
+        if conf["start_frame"] > 1:
+            camera, _ = seek(camera, conf["start_frame"] - 1,
+                             strategy=conf["seek_strategy"],
+                             video_filepath=conf["video_filepath"],
+                             image_dirpath=conf["image_dirpath"],
+                             reopen=lambda: open_camera(conf))
+        max_frames = conf["end_frame"] - conf["start_frame"] + 1 \
+            if conf["end_frame"] else None
+        # NOTE: the number of frames isn't known in advance (the frame count
+        # of a video can be wrong), so the frames are first written to a raw
+        # file
+        raw_path = os.path.join(self.folder, 'gray.raw')
+        num_frames, shape = 0, None
+        with open(raw_path, 'wb') as f:
+            while max_frames is None or num_frames < max_frames:
+                grabbed, frame = camera.read()
+                if not grabbed:
+                    break
+                if conf["resize_image_width"] > 0:
+                    frame = resize(frame, width=conf["resize_image_width"])
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                if shape is None:
+                    shape = gray.shape
+                f.write(gray.tobytes())
+                num_frames += 1
+        camera.release()
+        if num_frames < 2:
+            os.remove(raw_path)
+            raise ConfigError("At least 2 frames are needed for the sweep, {} "
+                              "were read".format(num_frames))
+        raw = np.memmap(raw_path, np.uint8, 'r', shape=(num_frames,) + shape)
+        gray = np.lib.format.open_memmap(self.gray_path, 'w+', np.uint8,
+                                         raw.shape)
+        gray[:] = raw
+        gray.flush()
+        del raw, gray
+        os.remove(raw_path)
+        self.meta = {'key': self.key, 'shape': [num_frames, *shape],
+                     'decode_time': time.perf_counter() - start,
+                     'blur_times': {}}
+        self._save_meta()
+        logger.info("{} frames decoded in {:.1f} s".format(
+                    num_frames, self.meta['decode_time']))
+
+    # Return the kernels of `ksizes` whose blurred frames aren't cached yet
+    def missing_kernels(self, ksizes):
+        return [k for k in ksizes
+                if self.blur_name(k) not in self.meta['blur_times'] or
+                not os.path.exists(self.blurred_path(k))]
+
+    def set_blur_time(self, ksize, elapsed):
+        self.meta['blur_times'][self.blur_name(ksize)] = elapsed
+        self._save_meta()
+
+    def blur_time(self, ksize):
+        return self.meta['blur_times'][self.blur_name(ksize)]
+
+    def _save_meta(self):
+        with open(self._meta_path, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+
+# Blur the frames of `gray_path` with the kernel `ksize` into `blurred_path`.
+# `blur_options` are the options of `fast_filters.Blur`. Return the time it
+# took.
+def _blur_frames(gray_path, blurred_path, ksize, blur_options):
+    start = time.perf_counter()
+    gray = np.load(gray_path, mmap_mode='r')
+    blurred = np.lib.format.open_memmap(blurred_path, 'w+', np.uint8,
+                                        gray.shape)
+    blur = Blur((ksize["width"], ksize["height"]), **blur_options)
+    for i in range(len(gray)):
+        blur.apply(gray[i], dst=blurred[i])
+    blurred.flush()
+    return time.perf_counter() - start
+
+
+# Entry point of a worker: run the background model on the blurred frames and,
+# for each value of `delta_threshs`, return the area of the largest region of
+# each frame (the first frame is the initial background) and the time spent
+# on the threshold and regions. The time spent by the model is also returned.
+def _evaluate(blurred_path, model_name, model_params, plugins, delta_threshs,
+              single_pass_dilation=True, extraction='contours',
+              chunk_size=32):
+    load_plugins(plugins)
+    blurred = np.load(blurred_path, mmap_mode='r')
+    model = get_model(model_name)(np.array(blurred[0]), {}, **model_params)
+    max_areas = np.zeros((len(delta_threshs), len(blurred) - 1))
+    model_time = 0.0
+    thresh_times = np.zeros(len(delta_threshs))
+    for start in range(1, len(blurred), chunk_size):
+        t = time.perf_counter()
+        frame_deltas = model.get_frame_deltas(
+            np.array(blurred[start:start + chunk_size]))
+        model_time += time.perf_counter() - t
+        for j, delta_thresh in enumerate(delta_threshs):
+            t = time.perf_counter()
+            for i, frame_delta in enumerate(frame_deltas):
+                _, thresh = cv2.threshold(frame_delta, delta_thresh, 255,
+                                          cv2.THRESH_BINARY)
+                thresh = dilate(thresh, iterations=2,
+                                single_pass=single_pass_dilation)
+                if extraction == 'components':
+                    stats = cv2.connectedComponentsWithStats(
+                        thresh, connectivity=8, ltype=cv2.CV_32S)[2]
+                    max_areas[j, start - 1 + i] = \
+                        stats[1:, cv2.CC_STAT_AREA].max(initial=-1)
+                    continue
+                cnts = cv2.findContours(thresh, cv2.RETR_EXTERNAL,
+                                        cv2.CHAIN_APPROX_SIMPLE)[-2]
+                max_areas[j, start - 1 + i] = max(
+                    [cv2.contourArea(c) for c in cnts], default=-1)
+            thresh_times[j] += time.perf_counter() - t
+    return max_areas, model_time, thresh_times
+
+
+class ParameterSweep:
+    """Evaluate each parameter set of a grid on the frames of a `FrameCache`.
+
+    Options that are not in the grid keep their value from `conf`. Setting
+    `num_workers` to 0 sizes the pool to the number of available cores.
+    """
+
+    def __init__(self, conf, grid, cache, num_workers=0):
+        if not (conf["video_filepath"] or conf["image_dirpath"]):
+            raise ConfigError("A sweep needs a video file or an image "
+                              "sequence")
+        if conf["detection"]["width"] or conf["detection"]["roi_rectangles"] \
+                or conf["detection"]["roi_polygons"]:
+            logger.warning("The detection options (scale and ROI) are ignored "
+                           "by the sweep, motion is detected on the whole "
+                           "frames")
+        if conf["filters"]["blur_mode"] not in BLUR_MODES:
+            raise ConfigError("Blur mode ({}) is not supported. Choices are "
+                              "{}".format(conf["filters"]["blur_mode"],
+                                          BLUR_MODES))
+        if conf["boxes"]["extraction"] not in EXTRACTION_METHODS:
+            raise ConfigError("Extraction method ({}) is not supported. "
+                              "Choices are {}".format(
+                               conf["boxes"]["extraction"],
+                               EXTRACTION_METHODS))
+        self.conf = conf
+        self.param_sets = [merge_conf({k: conf[k] for k in SWEEP_PARAMS},
+                                      params)
+                           for params in build_param_sets(grid)]
+        try:
+            load_plugins(conf["background_model_plugins"])
+            for params in self.param_sets:
+                get_model(params["background_model"])
+        except (ImportError, ModelNotFoundError) as e:
+            raise ConfigError(e)
+        for params in self.param_sets:
+            ksize = params["gaussian_kernel_size"]
+            if not ksize["width"] % 2 or not ksize["height"] % 2 or \
+                    ksize["width"] <= 0 or ksize["height"] <= 0:
+                raise ConfigError("Gaussian kernel ({}) should be odd and "
+                                  "positive".format(kernel_name(ksize)))
+        self.cache = cache
+        self.num_workers = num_workers if num_workers > 0 \
+            else available_cores()
+
+    # Evaluate all the parameter sets and return their summaries
+    def run(self):
+        conf = self.conf
+        cache = self.cache
+        cache.decode()
+        # Passes over the frames: parameter sets sharing the kernel and model
+        groups = {}
+        for params in self.param_sets:
+            key = (kernel_name(params["gaussian_kernel_size"]),
+                   params["background_model"])
+            groups.setdefault(key, []).append(params)
+        ksizes = {kernel_name(p["gaussian_kernel_size"]):
+                  p["gaussian_kernel_size"] for p in self.param_sets}
+        logger.info("Evaluating {} parameter sets in {} passes over {} frames "
+                    "with {} worker processes".format(
+                     len(self.param_sets), len(groups), cache.num_frames,
+                     self.num_workers))
+
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            # Blur the frames once per kernel
+            missing = cache.missing_kernels(ksizes.values())
+            futures = [executor.submit(_blur_frames, cache.gray_path,
+                                       cache.blurred_path(k), k,
+                                       cache.blur_options())
+                       for k in missing]
+            for ksize, future in zip(missing, futures):
+                cache.set_blur_time(ksize, future.result())
+
+            # If there are less passes than workers, the values of
+            # `delta_thresh` of a pass are split over several workers
+            num_splits = math.ceil(self.num_workers / len(groups))
+            tasks = []
+            for (kname, model_name), params_list in groups.items():
+                delta_threshs = sorted({p["delta_thresh"]
+                                        for p in params_list})
+                for split in np.array_split(
+                        delta_threshs, min(num_splits, len(delta_threshs))):
+                    split = [int(v) for v in split]
+                    future = executor.submit(
+                        _evaluate, cache.blurred_path(ksizes[kname]),
+                        model_name,
+                        conf["background_model_params"].get(model_name, {}),
+                        conf["background_model_plugins"], split,
+                        conf["filters"]["single_pass_dilation"],
+                        conf["boxes"]["extraction"])
+                    tasks.append((kname, model_name, split, future))
+
+            results = {}
+            for kname, model_name, delta_threshs, future in tasks:
+                max_areas, model_time, thresh_times = future.result()
+                for j, delta_thresh in enumerate(delta_threshs):
+                    results[kname, model_name, delta_thresh] = \
+                        (max_areas[j], model_time, thresh_times[j])
+
+        post_roll = conf["event_recording"]["post_roll"]
+        summaries = []
+        for params in self.param_sets:
+            ksize = params["gaussian_kernel_size"]
+            kname = kernel_name(ksize)
+            max_areas, model_time, thresh_time = results[
+                kname, params["background_model"], params["delta_thresh"]]
+            occupied = max_areas >= params["min_area"]
+            # NOTE: time to process the frames with this parameter set only,
+            # without decoding
+            runtime = cache.blur_time(ksize) + model_time + thresh_time
+            summaries.append({
+                'background_model': params["background_model"],
+                'gaussian_kernel_size': kname,
+                'delta_thresh': params["delta_thresh"],
+                'min_area': params["min_area"],
+                'motion_frames': int(occupied.sum()),
+                'motion_ratio': round(float(occupied.mean()), 4),
+                'events': count_events(occupied, post_roll),
+                'runtime': round(runtime, 3),
+                'fps': round(cache.num_frames / runtime, 1)})
+        return summaries
@@ -0,0 +1,372 @@
+"""
+Multi-object tracking of the bounding boxes found by the motion detection
+
+On each frame, the boxes are associated with the tracks by their IoU with the
+predicted box of each track or, if they don't overlap enough, by the distance
+between their centers. The association is solved over a NumPy cost matrix with
+the Hungarian algorithm (SciPy, optional) or greedily. The boxes of the tracks
+are predicted with a constant-velocity Kalman filter (optional) run on all the
+tracks at once, so that a track survives a few frames without detection (e.g.
+an occlusion).
+
+A track is confirmed once it was detected on `min_hits` consecutive frames, and
+deleted after `max_missed` frames without detection. The boxes of the
+confirmed tracks can be saved in a compact binary file (see
+`TrajectoryWriter` and `load_trajectories()`).
+"""
+import logging
+import os
+# Third-party modules
+import numpy as np
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    # SciPy is optional: without it, the association is greedy
+    linear_sum_assignment = None
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+ASSOCIATIONS = ['hungarian', 'greedy']
+# Cost of a (track, box) pair that can't be associated
+INVALID_COST = 1e6
+# Trajectory file: magic number followed by int32 records
+TRAJECTORY_MAGIC = b'MDTRAJ01'
+TRAJECTORY_DTYPE = np.dtype([('frame', '<i4'), ('track_id', '<i4'),
+                             ('x', '<i4'), ('y', '<i4'), ('w', '<i4'),
+                             ('h', '<i4')])
+
+
+# Return the IoU between the boxes `a` (N x 4) and `b` (N x 4), row by row.
+# The boxes are [x, y, w, h].
+def paired_iou(a, b):
+    inter = np.clip(np.minimum(a[:, 0] + a[:, 2], b[:, 0] + b[:, 2]) -
+                    np.maximum(a[:, 0], b[:, 0]), 0, None) * \
+        np.clip(np.minimum(a[:, 1] + a[:, 3], b[:, 1] + b[:, 3]) -
+                np.maximum(a[:, 1], b[:, 1]), 0, None)
+    union = a[:, 2] * a[:, 3] + b[:, 2] * b[:, 3] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+# Return the T x N cost matrix of associating the tracks (predicted boxes) with
+# the boxes. Pairs that overlap enough cost less than 1, pairs that are only
+# close enough cost between 1 and 2, and the other pairs can't be associated.
+# NOTE: the IoU and distance are only computed for the pairs whose centers are
+# close enough for the boxes to overlap or be within `max_distance`, which are
+# few even with hundreds of boxes
+def association_costs(tracks, boxes, iou_threshold=0.3, max_distance=50):
+    ct = tracks[:, :2] + tracks[:, 2:] / 2
+    cb = boxes[:, :2] + boxes[:, 2:] / 2
+    dx = np.abs(ct[:, None, 0] - cb[None, :, 0])
+    dy = np.abs(ct[:, None, 1] - cb[None, :, 1])
+    candidates = (dx < (tracks[:, None, 2] + boxes[None, :, 2]) / 2) & \
+        (dy < (tracks[:, None, 3] + boxes[None, :, 3]) / 2)
+    if max_distance > 0:
+        candidates |= (dx <= max_distance) & (dy <= max_distance)
+    rows, cols = np.nonzero(candidates)
+
+    iou = paired_iou(tracks[rows], boxes[cols])
+    overlap = iou >= iou_threshold
+    pair_costs = np.where(overlap, 1 - iou, INVALID_COST)
+    if max_distance > 0:
+        dist = np.hypot(dx[rows, cols], dy[rows, cols])
+        close = ~overlap & (dist <= max_distance)
+        pair_costs[close] = 1 + dist[close] / max_distance
+    cost = np.full(candidates.shape, INVALID_COST)
+    cost[rows, cols] = pair_costs
+    return cost
+
+
+# Return the (track, box) pairs (M x 2) associated greedily: the pairs are
+# taken by increasing cost
+def associate_greedy(cost):
+    # Only the pairs that can be associated are sorted
+    valid = np.flatnonzero(cost < INVALID_COST)
+    order = valid[np.argsort(cost.ravel()[valid], kind='stable')]
+    rows, cols = np.unravel_index(order, cost.shape)
+    used_rows = set()
+    used_cols = set()
+    matches = []
+    for r, c in zip(rows.tolist(), cols.tolist()):
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        matches.append((r, c))
+        if len(matches) == min(cost.shape):
+            break
+    return np.array(matches, dtype=np.intp).reshape(-1, 2)
+
+
+# Return the (track, box) pairs (M x 2) of minimum total cost
+def associate_hungarian(cost):
+    rows, cols = linear_sum_assignment(cost)
+    valid = cost[rows, cols] < INVALID_COST
+    return np.stack([rows[valid], cols[valid]], axis=1)
+
+
+class KalmanBoxFilter:
+    """Constant-velocity Kalman filter of boxes, run on many boxes at once.
+
+    The state of a box is its center, width and height, and their velocities.
+    The noise is proportional to the size of the box.
+    """
+
+    def __init__(self, std_position=1 / 20, std_velocity=1 / 160):
+        self.std_position = std_position
+        self.std_velocity = std_velocity
+        # Transition matrix: the velocities are added to the positions
+        self._transition = np.eye(8)
+        self._transition[:4, 4:] = np.eye(4)
+
+    # Return the states (T x 8) and covariances (T x 8 x 8) of new boxes
+    def initiate(self, boxes):
+        means = np.zeros((len(boxes), 8))
+        means[:, :4] = _to_cwh(boxes)
+        scale = np.tile(means[:, 2:4], 2)
+        std = np.concatenate([2 * self.std_position * scale,
+                              10 * self.std_velocity * scale], axis=1)
+        return means, _diagonal(std ** 2)
+
+    def predict(self, means, covs):
+        scale = np.tile(means[:, 2:4], 2)
+        std = np.concatenate([self.std_position * scale,
+                              self.std_velocity * scale], axis=1)
+        means = means @ self._transition.T
+        covs = self._transition @ covs @ self._transition.T + \
+            _diagonal(std ** 2)
+        return means, covs
+
+    # Correct the states with the measured boxes (T x 4)
+    def update(self, means, covs, boxes):
+        scale = np.tile(means[:, 2:4], 2)
+        # Covariance of the innovation, and Kalman gain
+        innovation_cov = covs[:, :4, :4] + _diagonal(
+            (self.std_position * scale) ** 2)
+        gain = np.linalg.solve(innovation_cov,
+                               covs[:, :4, :]).transpose(0, 2, 1)
+        innovation = _to_cwh(boxes) - means[:, :4]
+        means = means + (gain @ innovation[..., None])[..., 0]
+        covs = covs - gain @ innovation_cov @ gain.transpose(0, 2, 1)
+        return means, covs
+
+    # Return the boxes [x, y, w, h] of the states
+    @staticmethod
+    def boxes(means):
+        cwh = means[:, :4].copy()
+        cwh[:, 2:] = np.maximum(cwh[:, 2:], 1)
+        return np.concatenate([cwh[:, :2] - cwh[:, 2:] / 2, cwh[:, 2:]],
+                              axis=1)
+
+
+class Tracker:
+    """Assign persistent IDs to the boxes of consecutive frames.
+
+    The state of all the tracks is kept in NumPy arrays (one row per track),
+    so the cost of a frame is a few vectorized operations plus the
+    association.
+    """
+
+    def __init__(self, association='hungarian', iou_threshold=0.3,
+                 max_distance=50, max_missed=10, min_hits=3, kalman=True):
+        if association not in ASSOCIATIONS:
+            raise ValueError("Association ({}) is not supported. Choices are "
+                             "{}".format(association, ASSOCIATIONS))
+        if association == 'hungarian' and linear_sum_assignment is None:
+            logger.warning("SciPy is not installed: the greedy association "
+                           "will be used")
+            association = 'greedy'
+        self.association = association
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self.kalman = KalmanBoxFilter() if kalman else None
+        self.next_id = 1
+        # State of the tracks
+        self.ids = np.empty(0, np.int64)
+        self.boxes = np.empty((0, 4))
+        self.hits = np.empty(0, np.int64)
+        self.missed = np.empty(0, np.int64)
+        self.confirmed = np.empty(0, bool)
+        self.means = np.empty((0, 8))
+        self.covs = np.empty((0, 8, 8))
+
+    # Number of tracks (tentative or confirmed)
+    @property
+    def num_tracks(self):
+        return len(self.ids)
+
+    # Associate the boxes (N x 4, [x, y, w, h]) of the next frame with the
+    # tracks. Return the ID of the track of each box, 0 if the track is not
+    # confirmed yet.
+    def update(self, boxes):
+        boxes = np.asarray(boxes, np.float64).reshape(-1, 4)
+        # Predicted boxes of the tracks
+        if self.kalman and self.num_tracks:
+            self.means, self.covs = self.kalman.predict(self.means, self.covs)
+            self.boxes = self.kalman.boxes(self.means)
+
+        matches = np.empty((0, 2), np.intp)
+        if self.num_tracks and len(boxes):
+            cost = association_costs(self.boxes, boxes, self.iou_threshold,
+                                     self.max_distance)
+            if self.association == 'hungarian':
+                matches = associate_hungarian(cost)
+            else:
+                matches = associate_greedy(cost)
+        rows, cols = matches[:, 0], matches[:, 1]
+
+        # Matched tracks
+        self.hits[rows] += 1
+        self.missed[rows] = 0
+        self.confirmed[rows] |= self.hits[rows] >= self.min_hits
+        if self.kalman:
+            self.means[rows], self.covs[rows] = self.kalman.update(
+                self.means[rows], self.covs[rows], boxes[cols])
+        self.boxes[rows] = boxes[cols]
+        ids = np.zeros(len(boxes), np.int64)
+        ids[cols] = np.where(self.confirmed[rows], self.ids[rows], 0)
+
+        # Unmatched tracks keep their predicted box. Tentative tracks are
+        # deleted as soon as they are missed, confirmed ones after
+        # `max_missed` frames.
+        unmatched = np.ones(self.num_tracks, bool)
+        unmatched[rows] = False
+        self.missed[unmatched] += 1
+        self.hits[unmatched] = 0
+        keep = ~unmatched | (self.confirmed &
+                             (self.missed <= self.max_missed))
+        if not keep.all():
+            self._select(keep)
+
+        # New tracks for the unmatched boxes
+        new = np.ones(len(boxes), bool)
+        new[cols] = False
+        num_new = int(new.sum())
+        if num_new:
+            new_ids = np.arange(self.next_id, self.next_id + num_new)
+            self.next_id += num_new
+            confirmed = self.min_hits <= 1
+            if confirmed:
+                ids[new] = new_ids
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.boxes = np.concatenate([self.boxes, boxes[new]])
+            self.hits = np.concatenate([self.hits, np.ones(num_new, np.int64)])
+            self.missed = np.concatenate([self.missed,
+                                          np.zeros(num_new, np.int64)])
+            self.confirmed = np.concatenate([self.confirmed,
+                                             np.full(num_new, confirmed)])
+            if self.kalman:
+                means, covs = self.kalman.initiate(boxes[new])
+                self.means = np.concatenate([self.means, means])
+                self.covs = np.concatenate([self.covs, covs])
+        return ids
+
+    def _select(self, keep):
+        self.ids = self.ids[keep]
+        self.boxes = self.boxes[keep]
+        self.hits = self.hits[keep]
+        self.missed = self.missed[keep]
+        self.confirmed = self.confirmed[keep]
+        if self.kalman:
+            self.means = self.means[keep]
+            self.covs = self.covs[keep]
+
+
+class TrajectoryWriter:
+    """Write the boxes of the confirmed tracks to a binary file.
+
+    The file starts with `TRAJECTORY_MAGIC`, followed by one record of six
+    little-endian int32 per box: frame number, track ID, x, y, w and h. The
+    records are buffered and appended `buffer_size` at a time.
+
+    If `state` (from `get_state()`) is given, the writer continues an existing
+    file, which is first truncated to its size at the time of `state`.
+    """
+
+    def __init__(self, path, buffer_size=1024, state=None):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._records = []
+        self._num_pending = 0
+        if state:
+            self.num_records = state['num_records']
+            self._file = open(path, 'r+b')
+            self._file.truncate(state['size'])
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self.num_records = 0
+            self._file = open(path, 'wb')
+            self._file.write(TRAJECTORY_MAGIC)
+
+    # Add the boxes (N x 4) of the frame that belong to confirmed tracks
+    # (`ids` > 0)
+    def write(self, frame_num, ids, boxes):
+        ids = np.asarray(ids)
+        tracked = ids > 0
+        if not tracked.any():
+            return
+        records = np.empty(int(tracked.sum()), TRAJECTORY_DTYPE)
+        records['frame'] = frame_num
+        records['track_id'] = ids[tracked]
+        boxes = np.asarray(boxes).reshape(-1, 4)[tracked]
+        for i, field in enumerate(['x', 'y', 'w', 'h']):
+            records[field] = boxes[:, i]
+        self._records.append(records)
+        self._num_pending += len(records)
+        if self._num_pending >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._records:
+            records = np.concatenate(self._records)
+            self._file.write(records.tobytes())
+            self._file.flush()
+            self.num_records += len(records)
+            self._records = []
+            self._num_pending = 0
+
+    # Write the buffered records and return what is needed to continue the
+    # file later (e.g. from a checkpoint)
+    def get_state(self):
+        self.flush()
+        # NOTE: the magic number can still be in the buffer of the file
+        self._file.flush()
+        return {'size': self._file.tell(), 'num_records': self.num_records}
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+# Return the records of a trajectory file as a structured array (see
+# `TRAJECTORY_DTYPE`), in the order they were written
+def load_trajectories(path):
+    with open(path, 'rb') as f:
+        if f.read(len(TRAJECTORY_MAGIC)) != TRAJECTORY_MAGIC:
+            raise ValueError("{} is not a trajectory file".format(path))
+    return np.fromfile(path, TRAJECTORY_DTYPE, offset=len(TRAJECTORY_MAGIC))
+
+
+# Return a dict mapping each track ID to its records, ordered by frame
+def split_tracks(records):
+    records = records[np.lexsort((records['frame'], records['track_id']))]
+    track_ids, starts = np.unique(records['track_id'], return_index=True)
+    return {int(track_id): track_records for track_id, track_records in
+            zip(track_ids, np.split(records, starts[1:]))}
+
+
+# Return the boxes [x, y, w, h] (T x 4) as centers, widths and heights
+def _to_cwh(boxes):
+    return np.concatenate([boxes[:, :2] + boxes[:, 2:] / 2, boxes[:, 2:]],
+                          axis=1)
+
+
+# Return the T x n x n diagonal matrices of the rows of `values` (T x n)
+def _diagonal(values):
+    n = values.shape[1]
+    matrices = np.zeros(values.shape + (n,))
+    matrices[:, np.arange(n), np.arange(n)] = values
+    return matrices
@@ -0,0 +1,192 @@
+"""
+Test of the checkpoints of the motion detection system with motion events that
+are being recorded when a checkpoint is saved or when the run ends
+
+A synthetic clip is written with two periods of motion, the second one lasting
+until the last frame, and processed by `run_system.py` with the checkpoints and
+the event recording enabled:
+- run ending mid-event: the run must leave a last checkpoint, and resuming it
+  must report that the processing is already complete
+- crash mid-event: a second run is killed once a checkpoint was saved during
+  the second event, then resumed. The index of the events (without the
+  timestamps), the clips and the boxes must be the same as those of the
+  uninterrupted run.
+
+Run from `test_code/` with the system's modules on the path:
+
+    $ PYTHONPATH=..:../basic_motion_detection_and_tracking_system \
+        python checkpoint_resume_test.py -n 300 -i 20
+"""
+import argparse
+import csv
+import filecmp
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+# Third-party modules
+import cv2
+import numpy as np
+# Own modules
+from checkpoint import CheckpointError, load_checkpoint
+
+SYSTEM_DIRPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              os.pardir,
+                              'basic_motion_detection_and_tracking_system')
+# Outputs compared between the uninterrupted run and the resumed run, besides
+# the events
+COMPARED_FILES = ['trajectories.bin', 'detections.bin', 'frames.jsonl']
+
+
+# Write a clip of `num_frames` frames with a moving square from 10% to 40% of
+# the frames, and from 50% to the end
+def write_clip(clip_path, num_frames, width=320, height=240):
+    writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*'MJPG'), 20,
+                             (width, height))
+    for i in range(num_frames):
+        frame = np.full((height, width, 3), 90, np.uint8)
+        if num_frames // 10 <= i < num_frames * 4 // 10 or \
+                i >= num_frames // 2:
+            x = (i * 3) % (width - 60)
+            cv2.rectangle(frame, (x, 80), (x + 60, 160), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+
+def run_system(*args):
+    return subprocess.Popen(
+        [sys.executable, 'run_system.py'] + list(args), cwd=SYSTEM_DIRPATH,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True)
+
+
+# Run `run_system.py` to completion and return its exit code and output
+def run_to_completion(*args):
+    process = run_system(*args)
+    output = process.communicate()[0]
+    return process.returncode, output
+
+
+# Return the only output folder created in `reports_dirpath` since `known`
+def new_folder(reports_dirpath, known):
+    folders = set(os.listdir(reports_dirpath)) - known
+    assert len(folders) == 1, folders
+    return os.path.join(reports_dirpath, folders.pop())
+
+
+# Return the rows of the index of the events without their timestamps
+def load_events(folder):
+    with open(os.path.join(folder, 'events', 'events.csv')) as f:
+        return [{k: v for k, v in row.items()
+                 if k not in ['start_time', 'end_time']}
+                for row in csv.DictReader(f)]
+
+
+def check(name, passed, details=""):
+    print("{} {}{}".format("PASS" if passed else "FAIL", name,
+                           ": " + details if details and not passed else ""))
+    return passed
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--conf",
+                    default=os.path.join(SYSTEM_DIRPATH, 'conf.json'),
+                    help="base configuration file of the system")
+    ap.add_argument("-n", "--num-frames", type=int, default=300,
+                    help="number of frames of the synthetic clip")
+    ap.add_argument("-i", "--interval", type=int, default=20,
+                    help="number of frames between two checkpoints")
+    args = ap.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dirpath:
+        clip_path = os.path.join(tmp_dirpath, 'clip.avi')
+        write_clip(clip_path, args.num_frames)
+        with open(args.conf) as f:
+            conf = json.load(f)
+        reports_dirpath = os.path.join(tmp_dirpath, 'reports')
+        os.makedirs(reports_dirpath)
+        conf.update(video_filepath=clip_path, image_dirpath="", stream_url="",
+                    reports_dirpath=reports_dirpath, start_frame=1,
+                    end_frame=0, show_video=False, disable_logging=True)
+        conf["checkpoint"].update(enable=True, interval=args.interval)
+        # NOTE: the frames of the pre-roll aren't saved in the checkpoints
+        conf["event_recording"].update(enable=True, pre_roll=0, post_roll=10)
+        conf["tracking"].update(enable=True, save_trajectories=True)
+        conf["boxes"]["save_detections"] = True
+        conf["frame_records"].update(enable=True, include_durations=False)
+        conf_path = os.path.join(tmp_dirpath, 'conf.json')
+        with open(conf_path, 'w') as f:
+            json.dump(conf, f)
+
+        # Run ending mid-event
+        known = set(os.listdir(reports_dirpath))
+        returncode, output = run_to_completion('-c', conf_path)
+        ref_folder = new_folder(reports_dirpath, known)
+        results.append(check("uninterrupted run", returncode == 0, output))
+        try:
+            state = load_checkpoint(ref_folder)
+        except CheckpointError as e:
+            state = None
+            results.append(check("last checkpoint saved", False, str(e)))
+        else:
+            results.append(check("last checkpoint saved",
+                                 state['completed'] and
+                                 state['event_recorder']['event'] is None))
+        returncode, output = run_to_completion('-r', ref_folder)
+        results.append(check("resume of the complete run",
+                             returncode == 0 and "already complete" in output,
+                             output))
+        ref_events = load_events(ref_folder)
+        results.append(check("event recorded until the last frame",
+                             ref_events and int(ref_events[-1]['end_frame'])
+                             >= args.num_frames - 1, str(ref_events)))
+
+        # Crash mid-event: killed after a checkpoint saved during the second
+        # event
+        known = set(os.listdir(reports_dirpath))
+        process = run_system('-c', conf_path)
+        kill_frame = args.num_frames * 3 // 4
+        killed_frame = None
+        while process.poll() is None:
+            time.sleep(0.005)
+            folders = set(os.listdir(reports_dirpath)) - known
+            if not folders:
+                continue
+            try:
+                state = load_checkpoint(os.path.join(reports_dirpath,
+                                                     folders.pop()))
+            except CheckpointError:
+                continue
+            if state['frame_num'] >= kill_frame:
+                process.kill()
+                killed_frame = state['frame_num']
+                break
+        process.communicate()
+        run_folder = new_folder(reports_dirpath, known)
+        if not check("run killed mid-event", killed_frame is not None and
+                     state['event_recorder']['event'] is not None,
+                     "the run ended before it was killed, use more frames"):
+            sys.exit(1)
+        print("Killed after the checkpoint at frame # {}".format(killed_frame))
+        returncode, output = run_to_completion('-r', run_folder)
+        results.append(check("resume of the killed run", returncode == 0,
+                             output))
+        events = load_events(run_folder)
+        results.append(check("same events", events == ref_events,
+                             "\n{}\n{}".format(ref_events, events)))
+        results.append(check("same clips",
+                             sorted(os.listdir(os.path.join(ref_folder,
+                                                            'events'))) ==
+                             sorted(os.listdir(os.path.join(run_folder,
+                                                            'events')))))
+        for fname in COMPARED_FILES:
+            results.append(check(
+                "same {}".format(fname),
+                filecmp.cmp(os.path.join(ref_folder, fname),
+                            os.path.join(run_folder, fname), shallow=False)))
+    print("{} of {} checks passed".format(sum(results), len(results)))
+    sys.exit(0 if all(results) else 1)
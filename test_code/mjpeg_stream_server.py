@@ -0,0 +1,182 @@
+"""
+Loopback MJPEG stream server replaying a video file
+
+Stand-in for a network camera: the frames of the video are encoded as JPEG and
+sent to all the clients of http://HOST:PORT/stream.mjpg
+(`multipart/x-mixed-replace`) at the FPS of the video, in a loop. Connections
+can be dropped every N frames (`-d`) and the server can refuse connections
+for some time after that (`-o`, HTTP 503), to test the reconnection of a live
+source. The number of each frame is drawn in its top-left corner.
+
+    $ python mjpeg_stream_server.py -v test.avi -p 8090 -d 150 -o 2
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import socketserver
+import threading
+import time
+# Third-party modules
+import cv2
+
+BOUNDARY = "frame"
+# The number of each frame is drawn in its top-left corner as NUM_BITS blocks
+# (white for 1) so that a client can measure how many frames it is behind
+NUM_BITS = 16
+BLOCK_SIZE = 8
+
+
+# NOTE: same as `http.server.ThreadingHTTPServer`, which is new in Python 3.7
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def stamp_frame_num(frame, frame_num):
+    for bit in range(NUM_BITS):
+        value = 255 if (frame_num >> bit) & 1 else 0
+        frame[:BLOCK_SIZE, bit * BLOCK_SIZE:(bit + 1) * BLOCK_SIZE] = value
+
+
+def read_frame_num(frame):
+    frame_num = 0
+    for bit in range(NUM_BITS):
+        block = frame[:BLOCK_SIZE, bit * BLOCK_SIZE:(bit + 1) * BLOCK_SIZE]
+        if block.mean() > 127:
+            frame_num |= 1 << bit
+    return frame_num
+
+
+class StreamReplayer:
+    def __init__(self, video_filepath, fps=0, jpeg_quality=80):
+        self.video_filepath = video_filepath
+        capture = cv2.VideoCapture(video_filepath)
+        if not capture.isOpened():
+            raise IOError("Couldn't open {}".format(video_filepath))
+        self.fps = fps or capture.get(cv2.CAP_PROP_FPS) or 25
+        self.jpeg_quality = jpeg_quality
+        self._capture = capture
+        self._cond = threading.Condition()
+        self._jpeg = None
+        # Number of frames sent so far, the clients wait for it to change
+        self.frame_num = 0
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._capture.release()
+
+    # Wait for the frame after `frame_num`. Return (frame number, JPEG bytes),
+    # or (None, None) if the server is stopped
+    def next_frame(self, frame_num):
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._stopped or self.frame_num > frame_num)
+            if self._stopped:
+                return None, None
+            return self.frame_num, self._jpeg
+
+    def _run(self):
+        interval = 1 / self.fps
+        next_time = time.perf_counter()
+        while True:
+            grabbed, frame = self._capture.read()
+            if not grabbed:
+                # Loop the video
+                self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            stamp_frame_num(frame, (self.frame_num + 1) % (1 << NUM_BITS))
+            _, jpeg = cv2.imencode(
+                ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            next_time += interval
+            time.sleep(max(0, next_time - time.perf_counter()))
+            with self._cond:
+                if self._stopped:
+                    return
+                self._jpeg = jpeg.tobytes()
+                self.frame_num += 1
+                self._cond.notify_all()
+
+
+# Return a running HTTP server (on a daemon thread) streaming `replayer`. Every
+# connection is closed after `disconnect_every` frames (0 means never) and new
+# connections are refused for `outage` seconds after that.
+def serve_stream(replayer, host="127.0.0.1", port=0, disconnect_every=0,
+                 outage=0.0):
+    # Time until which connections are refused
+    state = {'refuse_until': 0.0}
+
+    class StreamHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/stream.mjpg":
+                self.send_error(404)
+                return
+            if time.monotonic() < state['refuse_until']:
+                self.send_error(503)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type",
+                             "multipart/x-mixed-replace; boundary={}".format(
+                              BOUNDARY))
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            frame_num, num_sent = replayer.frame_num, 0
+            try:
+                while not disconnect_every or num_sent < disconnect_every:
+                    frame_num, jpeg = replayer.next_frame(frame_num)
+                    if jpeg is None:
+                        break
+                    self.wfile.write("--{}\r\nContent-Type: image/jpeg\r\n"
+                                     "Content-Length: {}\r\n\r\n".format(
+                                      BOUNDARY, len(jpeg)).encode())
+                    self.wfile.write(jpeg)
+                    self.wfile.write(b"\r\n")
+                    num_sent += 1
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            if disconnect_every:
+                state['refuse_until'] = time.monotonic() + outage
+            self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), StreamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-v", "--video", required=True,
+                    help="video file replayed by the server")
+    ap.add_argument("-H", "--host", default="127.0.0.1")
+    ap.add_argument("-p", "--port", type=int, default=8090)
+    ap.add_argument("-f", "--fps", type=float, default=0,
+                    help="FPS of the stream (default: FPS of the video)")
+    ap.add_argument("-d", "--disconnect-every", type=int, default=0,
+                    help="close the connections every N frames")
+    ap.add_argument("-o", "--outage", type=float, default=0,
+                    help="seconds during which connections are refused after "
+                         "a disconnection")
+    args = ap.parse_args()
+
+    replayer = StreamReplayer(args.video, args.fps)
+    replayer.start()
+    server = serve_stream(replayer, args.host, args.port,
+                          args.disconnect_every, args.outage)
+    print("Streaming {} at {:.1f} FPS on http://{}:{}/stream.mjpg".format(
+          args.video, replayer.fps, *server.server_address))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    replayer.stop()
@@ -0,0 +1,70 @@
+"""
+Test of the reconnection of a live source against the loopback MJPEG server
+
+Replays a video with `mjpeg_stream_server.py`, dropping the connection every
+`-d` frames and refusing new ones for `-o` seconds, and reads the stream
+through `sources.ReconnectingSource`. Prints the number of reconnections and
+drained frames, and the lag of the frames read (number of frames the server
+had sent since).
+
+Run from `test_code/` with the system's modules on the path:
+
+    $ PYTHONPATH=../basic_motion_detection_and_tracking_system \
+        python stream_reconnect_test.py -v test.avi -n 300
+"""
+import argparse
+import logging
+import time
+# Third-party modules
+import numpy as np
+# Own modules
+from mjpeg_stream_server import StreamReplayer, read_frame_num, serve_stream
+from sources import ReconnectingSource
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-v", "--video", required=True,
+                    help="video file replayed by the server")
+    ap.add_argument("-n", "--num-frames", type=int, default=300,
+                    help="number of frames read by the client")
+    ap.add_argument("-d", "--disconnect-every", type=int, default=100)
+    ap.add_argument("-o", "--outage", type=float, default=1.0)
+    ap.add_argument("-s", "--slow", type=float, default=0,
+                    help="processing time per frame of the client (s), to "
+                         "let frames pile up in the capture")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    replayer = StreamReplayer(args.video)
+    replayer.start()
+    server = serve_stream(replayer, port=0,
+                          disconnect_every=args.disconnect_every,
+                          outage=args.outage)
+    url = "http://{}:{}/stream.mjpg".format(*server.server_address)
+    source = ReconnectingSource(url, initial_delay=0.2, max_delay=2,
+                                max_attempts=10, timeout=3000)
+    lags = []
+    start = time.perf_counter()
+    for _ in range(args.num_frames):
+        grabbed, frame = source.read()
+        if not grabbed:
+            print("The stream couldn't be read anymore")
+            break
+        lags.append(replayer.frame_num - read_frame_num(frame))
+        time.sleep(args.slow)
+    elapsed = time.perf_counter() - start
+    source.release()
+    server.shutdown()
+    replayer.stop()
+
+    lags = np.array(lags)
+    print("Frames read: {} in {:.1f} s (stream at {:.1f} FPS)".format(
+          len(lags), elapsed, replayer.fps))
+    print("Reconnections: {}, stale frames drained: {}".format(
+          source.num_reconnects, source.num_drained))
+    if len(lags):
+        print("Lag (frames): mean {:.1f}, p95 {:.0f}, max {}, last 50 mean "
+              "{:.1f}".format(lags.mean(), np.percentile(lags, 95), lags.max(),
+                             lags[-50:].mean()))
@@ -0,0 +1,8 @@
+from http.server import HTTPServer
+import socketserver
+
+
+# HTTP server handling each request in its own thread (metrics, live preview)
+# NOTE: same as `http.server.ThreadingHTTPServer`, which is new in Python 3.7
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
@@ -0,0 +1,171 @@
+import collections
+# NOTE: `concurrent.futures` imports the process pool (and `multiprocessing`)
+# the first time it is used
+import concurrent.futures
+import logging
+import os
+import threading
+# Own modules
+from utilities.utils import WriteImageError, write_image
+# Get the logger
+logger = logging.getLogger('{}.{}'.format(
+    os.path.basename(os.path.dirname(__file__)), __name__))
+
+# What to do when an image is submitted while the queue is full:
+# - 'block': wait until a worker frees a slot in the queue
+# - 'drop_oldest': discard the oldest pending image to make room for the new one
+# - 'drop_newest': discard the image being submitted
+BACKPRESSURE_POLICIES = ['block', 'drop_oldest', 'drop_newest']
+
+
+class ImageWriterClosedError(Exception):
+    """Raised when an image is submitted to a writer that was closed"""
+
+
+class AsyncImageWriter:
+    """Write images to disk from a pool of workers fed by a bounded queue.
+
+    The caller (e.g. the motion detection loop) only pays for a copy of the
+    image; the encoding and the disk I/O are done by `num_workers` threads. If
+    `use_processes` is True, each worker thread hands its image to a process
+    pool so that the encoding is not limited by the GIL.
+    """
+
+    def __init__(self, num_workers=2, queue_size=64, backpressure='block',
+                 use_processes=False):
+        if num_workers <= 0:
+            raise ValueError("num_workers should be positive: "
+                             "{}".format(num_workers))
+        if queue_size <= 0:
+            raise ValueError("queue_size should be positive: "
+                             "{}".format(queue_size))
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError("Backpressure policy ({}) is not supported. "
+                             "Choices are {}".format(backpressure,
+                                                     BACKPRESSURE_POLICIES))
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self.backpressure = backpressure
+        self.use_processes = use_processes
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        # Number of images taken from the queue but not yet written
+        self._in_progress = 0
+        self._counters = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0}
+        self._executor = None
+        if use_processes:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_workers)
+        self._workers = []
+        for i in range(num_workers):
+            t = threading.Thread(target=self._worker,
+                                 name="image-writer-{}".format(i),
+                                 daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def counters(self):
+        with self._cond:
+            counters = dict(self._counters)
+            counters['pending'] = len(self._queue) + self._in_progress
+            return counters
+
+    # Return the fraction of the queue that is currently filled, between 0 and 1
+    def occupancy(self):
+        with self._cond:
+            return len(self._queue) / self.queue_size
+
+    # Submit an image for writing, encoded with the `cv2.imwrite()` parameters
+    # `params`. The image is copied since the caller is free to modify it
+    # (e.g. draw on it, or reuse its buffer) once this returns.
+    # Return True if the image was queued, False if it was dropped.
+    def write(self, path, image, params=None):
+        with self._cond:
+            if self._closed:
+                raise ImageWriterClosedError(
+                    "Image '{}' submitted to a closed writer".format(path))
+            if len(self._queue) >= self.queue_size:
+                if self.backpressure == 'drop_newest':
+                    self._counters['dropped'] += 1
+                    logger.debug("Write queue full, image dropped: %s", path)
+                    return False
+                elif self.backpressure == 'drop_oldest':
+                    old_path, _, _ = self._queue.popleft()
+                    self._counters['dropped'] += 1
+                    logger.debug("Write queue full, image dropped: %s",
+                                 old_path)
+                else:
+                    while len(self._queue) >= self.queue_size \
+                            and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        raise ImageWriterClosedError(
+                            "Image '{}' submitted to a closed "
+                            "writer".format(path))
+            self._queue.append((path, image.copy(), params))
+            self._counters['queued'] += 1
+            self._cond.notify_all()
+            return True
+
+    # Block until every queued image was written (or failed)
+    def flush(self):
+        with self._cond:
+            self._flush_locked()
+
+    # Write the remaining images, then stop the workers. The writer can't be
+    # used after it is closed.
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._flush_locked()
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._workers:
+            t.join()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+
+    # Same as `flush()` but the caller must already hold `self._cond`
+    def _flush_locked(self):
+        while self._queue or self._in_progress:
+            self._cond.wait()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    # Closed and nothing left to write
+                    return
+                path, image, params = self._queue.popleft()
+                self._in_progress += 1
+                # Wake up producers blocked on a full queue
+                self._cond.notify_all()
+            try:
+                if self._executor:
+                    written = self._executor.submit(
+                        write_image, path, image, params=params).result()
+                else:
+                    written = write_image(path, image, params=params)
+                if not written:
+                    raise WriteImageError("cv2.imwrite() returned False")
+            except Exception as e:
+                logger.error("Image '{}' couldn't be written: {}".format(
+                             path, e))
+                status = 'failed'
+            else:
+                status = 'written'
+            with self._cond:
+                self._counters[status] += 1
+                self._in_progress -= 1
+                self._cond.notify_all()
@@ -1,11 +1,17 @@
+import atexit
 import codecs
 import datetime
 import json
 import logging
+import logging.config
+import logging.handlers
 import os
 from pathlib import Path
+import queue
 import subprocess
 import sys
+import threading
+import time
 # Third-party modules
 import cv2
 # Get the logger
@@ -13,10 +19,80 @@ logger = logging.getLogger('{}.{}'.format(
     os.path.basename(os.path.dirname(__file__)), __name__))
 
 
+# Listeners writing the records queued by `setup_logging()`, and the loggers
+# whose handlers were replaced by a queue: (logger, queue handler, handlers)
+_queue_listeners = []
+_queued_loggers = []
+
+
+# `extra` of the messages logged for every frame, the only records that
+# `RateLimitFilter` can drop
+PER_FRAME = {'per_frame': True}
+
+
 class WriteImageError(Exception):
     """Raised when an image couldn't be saved to disk"""
 
 
+class RateLimitFilter(logging.Filter):
+    """Let through at most one record per `interval` seconds for each message
+    logged for every frame, i.e. with `extra=PER_FRAME`.
+
+    Records are grouped by logger and by message before the arguments are
+    merged (e.g. "Processing frame #%s"), so the per-frame messages must use
+    lazy %-style arguments. The other records, and the records of level
+    `level` and above, are never dropped. A record let through after some were
+    dropped reports how many.
+    """
+
+    def __init__(self, interval=1.0, level='ERROR'):
+        super().__init__()
+        self.interval = interval
+        self.level = level if isinstance(level, int) \
+            else logging.getLevelName(level)
+        self._lock = threading.Lock()
+        # (logger name, message) -> [time of the last record let through,
+        # number of records dropped since]
+        self._last = {}
+
+    def filter(self, record):
+        # The same record goes through the filter of each handler
+        passed = getattr(record, 'rate_limit_passed', None)
+        if passed is None:
+            passed = record.rate_limit_passed = self._filter(record)
+        return passed
+
+    def _filter(self, record):
+        if record.levelno >= self.level or \
+                not getattr(record, 'per_frame', False):
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is None:
+                self._last[key] = [now, 0]
+                return True
+            if now - last[0] < self.interval:
+                last[1] += 1
+                return False
+            num_dropped = last[1]
+            last[0], last[1] = now, 0
+        if num_dropped:
+            record.msg = "{} ({} similar messages suppressed)".format(
+                record.msg, num_dropped)
+        return True
+
+
+# Return the number of cores available to this process
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # `sched_getaffinity()` is not available on all platforms, e.g. macOS
+        return os.cpu_count() or 1
+
+
 # ref.: https://stackoverflow.com/a/12412153
 #       https://stackoverflow.com/a/667754
 def get_full_command_line():
@@ -34,7 +110,14 @@ def load_json(path, encoding='utf8'):
 
 
 # Setup logging from JSON configuration file
-def setup_logging(logging_filepath, main_dirpath=None):
+# NOTE: if `append` is True, the messages are added at the end of the log file
+# instead of overwriting it (e.g. for a resumed run)
+# NOTE: if `use_queue` is True, the loggers only put their records in a queue
+# and the handlers of the configuration (file, console) are run by a separate
+# thread, so that logging never waits on the disk or the terminal. The records
+# still queued are written at exit or by `stop_logging()`.
+def setup_logging(logging_filepath, main_dirpath=None, append=False,
+                  use_queue=False):
     try:
         # Read YAML configuration file
         config_dict = load_json(logging_filepath)
@@ -42,8 +125,13 @@ def setup_logging(logging_filepath, main_dirpath=None):
             filename = config_dict['handlers']['file']['filename']
             new_filename = os.path.join(main_dirpath, filename)
             config_dict['handlers']['file']['filename'] = new_filename
+            if append:
+                config_dict['handlers']['file']['mode'] = 'a'
+        stop_logging()
         # Update the logging config dict with new values from `config_dict`
         logging.config.dictConfig(config_dict)
+        if use_queue:
+            _use_queue(list(config_dict.get('loggers', {})) + [''])
     except OSError as e:
         raise OSError(e)
     except KeyError as e:
@@ -54,6 +142,60 @@ def setup_logging(logging_filepath, main_dirpath=None):
         return config_dict
 
 
+# Replace the handlers of the loggers `names` ('' for the root logger) with a
+# `QueueHandler`. The loggers with the same handlers share a queue. The filters
+# common to all the handlers are run before the records are queued.
+def _use_queue(names):
+    loggers = [logging.getLogger(name) for name in names]
+    groups = {tuple(logger_.handlers) for logger_ in loggers
+              if logger_.handlers}
+    # The filters are looked up before any of them is moved since the
+    # handlers can be in several groups
+    common_filters = {
+        handlers: [f for f in handlers[0].filters
+                   if all(f in h.filters for h in handlers)]
+        for handlers in groups}
+    queue_handlers = {}
+    for handlers in groups:
+        # NOTE: `queue.SimpleQueue` is new in Python 3.7
+        records = queue.Queue()
+        listener = logging.handlers.QueueListener(
+            records, *handlers, respect_handler_level=True)
+        listener.start()
+        _queue_listeners.append(listener)
+        queue_handler = logging.handlers.QueueHandler(records)
+        for f in common_filters[handlers]:
+            queue_handler.addFilter(f)
+            for h in handlers:
+                h.removeFilter(f)
+        queue_handlers[handlers] = queue_handler
+    for logger_ in loggers:
+        handlers = tuple(logger_.handlers)
+        if handlers in queue_handlers:
+            for handler in handlers:
+                logger_.removeHandler(handler)
+            logger_.addHandler(queue_handlers[handlers])
+            _queued_loggers.append((logger_, queue_handlers[handlers],
+                                    handlers))
+
+
+# Write the records still in the queues of `setup_logging()` and stop their
+# threads. The loggers get their handlers back, so the next records are
+# written directly.
+@atexit.register
+def stop_logging():
+    while _queue_listeners:
+        _queue_listeners.pop().stop()
+    while _queued_loggers:
+        logger_, queue_handler, handlers = _queued_loggers.pop()
+        logger_.removeHandler(queue_handler)
+        for handler in handlers:
+            for f in queue_handler.filters:
+                if f not in handler.filters:
+                    handler.addFilter(f)
+            logger_.addHandler(handler)
+
+
 # This creates a timestamped filename/foldername so we don't overwrite our good
 # work, ref.: https://stackoverflow.com/a/16713796
 def timestamped(fname, fmt='%Y%m%d-%H%M%S-{fname}'):
@@ -89,9 +231,11 @@ def unique_foldername(folder_path):
     return folder_path
 
 
-def write_image(path, image, overwrite_image=True):
+# NOTE: `params` are the encoding parameters given to `cv2.imwrite()`, e.g.
+# [cv2.IMWRITE_JPEG_QUALITY, 90]
+def write_image(path, image, overwrite_image=True, params=None):
     if os.path.isfile(path) and not overwrite_image:
         raise WriteImageError("File '{}' already exists and `overwrite` is "
                               "False".format(path))
     else:
-        cv2.imwrite(path, image)
+        return cv2.imwrite(path, image, params or [])